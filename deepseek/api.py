@@ -4,7 +4,6 @@ import asyncio
 import nest_asyncio
 import threading
 import time
-from collections import deque
 from pathlib import Path
 
 # Configure asyncio event loop before any other imports
@@ -21,11 +20,12 @@ if sys.platform == 'darwin':  # macOS
         # If already applied or another error, just continue
         pass
 
-from fastapi import FastAPI, HTTPException, Depends, Body, status, Form, Query, Request, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Depends, Body, status, Form, Query, Header, Request, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from fastapi.responses import JSONResponse, StreamingResponse, HTMLResponse
 from fastapi.staticfiles import StaticFiles
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import Optional, AsyncIterator, Dict, List, Any
 import secrets
@@ -35,7 +35,17 @@ from dotenv import load_dotenv
 # Import models only after setting event loop policy
 from app.models.rag_chain import create_rag_chain
 from app.models.change_planning_chain import create_change_planning_chain
-from app.utils.initialize import initialize_system, get_warmup_status
+from app.models.retrieval import CORPORA, build_filter, retrieve_batch, retrieval_stats, search_sources
+from app.models.fallback import retrieval_only_answer
+from app.models.conversation import load_session, format_history, record_turn
+from app.models.llm import usage_tracker
+from app.models.hedging import hedge_policy, cancellable_stream, StreamCancelled
+from app.utils.initialize import initialize_system, get_warmup_status, warmup_models
+from app.utils.stream_bus import get_stream_bus
+from app.utils.stream_writer import CoalescingStreamWriter
+from app.utils.rate_limit import rate_limiter, client_key
+from app.utils.scheduler import generation_scheduler, SchedulerBusy
+from app.utils.circuit_breaker import llm_breaker, CircuitOpen, is_transient
 
 # Load environment variables
 load_dotenv()
@@ -79,146 +89,304 @@ def verify_admin(credentials: HTTPBasicCredentials = Depends(security)):
 # Data models
 class ChatRequest(BaseModel):
     message: str
+    session_id: Optional[str] = None
     resource_type: Optional[str] = None
     audience: Optional[str] = None
 
 class PlanningRequest(BaseModel):
     message: str
+    session_id: Optional[str] = None
     plan_stage: Optional[str] = None
     change_type: Optional[str] = None
 
 class ChatResponse(BaseModel):
     response: str
+    session_id: Optional[str] = None
+    # True when DeepSeek was unavailable and the answer lists retrieved passages instead
+    degraded: bool = False
 
 class WarmupRequest(BaseModel):
     force: bool = False
 
-# Message store for active streaming requests
-# This stores messages that are being streamed, keyed by request ID
-active_streams: Dict[str, deque] = {}
+class BatchRetrieveQuery(BaseModel):
+    query: str
+    filter: Optional[Dict[str, Any]] = None
+
+class BatchRetrieveRequest(BaseModel):
+    queries: List[BatchRetrieveQuery]
+    corpus: str = "adkar"
+    k: int = 8
+    fetch_k: Optional[int] = None
+
+# Upper bound on queries per batch retrieval call
+MAX_BATCH_QUERIES = int(os.getenv("MAX_BATCH_QUERIES", "1000"))
+# Upper bound on chunks returned by /api/search
+MAX_SEARCH_K = int(os.getenv("MAX_SEARCH_K", "20"))
+
+# Transport for active streaming requests, keyed by request ID.
+# Set STREAM_BUS_BACKEND=sqlite when running with several workers so the
+# POST and the stream GET can be served by different processes.
+stream_bus = get_stream_bus()
+
+# How often a stream reader polls the bus, and how long it may stay silent
+STREAM_POLL_INTERVAL_MS = float(os.getenv("STREAM_POLL_INTERVAL_MS", "20"))
+STREAM_HEARTBEAT_SECONDS = float(os.getenv("STREAM_HEARTBEAT_SECONDS", "10"))
+# Reconnect delay suggested to EventSource clients
+STREAM_RETRY_MS = int(os.getenv("STREAM_RETRY_MS", "1000"))
+# How often an idle reader checks for a client disconnect, and how often
+# generation checks whether its stream has been abandoned
+STREAM_DISCONNECT_CHECK_SECONDS = float(os.getenv("STREAM_DISCONNECT_CHECK_SECONDS", "1"))
+STREAM_CANCEL_CHECK_SECONDS = float(os.getenv("STREAM_CANCEL_CHECK_SECONDS", "0.5"))
+
+def is_end_frame(message: str) -> bool:
+    """Check whether an SSE frame marks the end of a stream"""
+    return '"end": true' in message or '"end":true' in message
 
 # Mount static files
 static_dir = Path(__file__).parent / "app" / "static"
 app.mount("/widgets", StaticFiles(directory=static_dir), name="static")
 
 # Function to generate a streaming response for the client
-async def generate_stream_response(request_id: str) -> AsyncIterator[str]:
-    """Generate a streaming response for a given request ID"""
-    print(f"Starting stream generation for request ID: {request_id}")
-    
-    if request_id not in active_streams:
-        # Initialize an empty queue for this request
-        print(f"Creating new message queue for request ID: {request_id}")
-        active_streams[request_id] = deque()
+async def generate_stream_response(request_id: str, last_event_id: int = 0,
+                                   request: Optional[Request] = None) -> AsyncIterator[str]:
+    """Generate a streaming response for a given request ID, resuming after last_event_id.
     
-    # Get the message queue for this request
-    message_queue = active_streams[request_id]
+    The reader is attached to the stream while it runs; once the client has
+    gone and nobody reconnects within the grace period, generation is cancelled.
+    """
+    print(f"Starting stream generation for request ID: {request_id} (after event {last_event_id})")
     
-    # Send initial keep-alive message to establish connection
-    initial_message = f"data: {json.dumps({'text': '', 'keep_alive': True})}\n\n"
-    print(f"Sending initial keep-alive message for {request_id}")
-    yield initial_message
+    if not stream_bus.exists(request_id):
+        if last_event_id:
+            # A reconnect for a stream whose replay window has passed
+            print(f"Cannot resume {request_id}: stream has expired")
+            yield f"data: {json.dumps({'text': '', 'end': True, 'error': 'Stream expired'})}\n\n"
+            return
+        # Initialize an empty stream for this request
+        print(f"Creating new message stream for request ID: {request_id}")
+        stream_bus.open(request_id)
     
-    # Wait for chunks to be added to the queue and yield them
+    stream_bus.attach(request_id)
+    try:
+        # Send initial keep-alive message to establish connection, and ask the
+        # browser to reconnect quickly if the connection drops
+        initial_message = f"retry: {STREAM_RETRY_MS}\ndata: {json.dumps({'text': '', 'keep_alive': True})}\n\n"
+        print(f"Sending initial keep-alive message for {request_id}")
+        yield initial_message
+        
+        async for message in follow_stream(request_id, last_event_id, request):
+            yield message
+    finally:
+        # Runs on normal completion and when the server drops a disconnected client
+        stream_bus.detach(request_id)
+
+async def follow_stream(request_id: str, last_event_id: int, request: Optional[Request]) -> AsyncIterator[str]:
+    """Yield frames published to a stream after last_event_id until its end frame"""
+    # Wait for frames to be published and yield them
     timeout_seconds = 60  # Set a reasonable timeout
     start_time = time.time()
+    last_sent = start_time
+    last_disconnect_check = start_time
     
     try:
         while True:
             # Check if we've timed out
             if time.time() - start_time > timeout_seconds:
-                # Cleanup and yield end message
                 print(f"Stream {request_id} timed out after {timeout_seconds} seconds")
-                if request_id in active_streams:
-                    del active_streams[request_id]
                 yield f"data: {json.dumps({'text': '', 'end': True, 'error': 'Stream timeout'})}\n\n"
                 break
             
-            # If there are messages in the queue, yield them
-            if message_queue:
-                message = message_queue.popleft()
-                yield message
+            # Read frames published after the last one this client has seen
+            frames = stream_bus.read(request_id, last_event_id)
+            
+            if frames and frames[0][0] != last_event_id + 1:
+                # Older frames were evicted from the replay buffer
+                print(f"Cannot resume {request_id} after event {last_event_id}: frames no longer buffered")
+                yield f"data: {json.dumps({'text': '', 'end': True, 'error': 'Stream replay window exceeded'})}\n\n"
+                break
+            
+            # Send everything that is ready in a single write, up to the end frame
+            if frames:
+                ended = False
+                chunks = []
+                for event_id, message in frames:
+                    chunks.append(f"id: {event_id}\n{message}")
+                    last_event_id = event_id
+                    if is_end_frame(message):
+                        ended = True
+                        break
+                yield "".join(chunks)
+                last_sent = time.time()
                 
-                # If it's an end message, break the loop
-                if '"end":true' in message:
+                # The stream stays on the bus for replay until its grace period passes
+                if ended:
                     print(f"End of stream message found for {request_id}, closing connection")
-                    if request_id in active_streams:
-                        del active_streams[request_id]
                     break
             
-            # If queue is empty, send a heartbeat every 10 seconds
-            elif time.time() - start_time > 0 and (time.time() - start_time) % 10 < 0.2:
+            # A finished stream with nothing left to send (the client already has the end frame)
+            elif stream_bus.is_finished(request_id):
+                yield f"data: {json.dumps({'text': '', 'end': True})}\n\n"
+                break
+            
+            # If nothing has been sent for a while, send a heartbeat
+            elif time.time() - last_sent >= STREAM_HEARTBEAT_SECONDS:
                 # Send a heartbeat to keep connection alive
                 heartbeat = f"data: {json.dumps({'text': '', 'heartbeat': True})}\n\n"
                 print(f"Sending heartbeat for {request_id}")
                 yield heartbeat
-                await asyncio.sleep(0.1)
+                last_sent = time.time()
+            
+            # Stop reading for a client that has gone away
+            elif request is not None and time.time() - last_disconnect_check >= STREAM_DISCONNECT_CHECK_SECONDS:
+                last_disconnect_check = time.time()
+                if await request.is_disconnected():
+                    print(f"Client disconnected from stream {request_id} after event {last_event_id}")
+                    break
             
             # Otherwise wait a bit
             else:
-                await asyncio.sleep(0.1)
+                await asyncio.sleep(STREAM_POLL_INTERVAL_MS / 1000.0)
     except Exception as e:
         # Handle any unexpected exceptions
         print(f"Error in stream generation for {request_id}: {e}")
-        if request_id in active_streams:
-            del active_streams[request_id]
         yield f"data: {json.dumps({'text': '', 'end': True, 'error': str(e)})}\n\n"
 
+def resume_position(last_event_id_header: Optional[str], last_event_id: Optional[int]) -> int:
+    """Pick the event ID to resume after from the Last-Event-ID header or query parameter"""
+    value = last_event_id_header if last_event_id_header is not None else last_event_id
+    try:
+        return max(int(value or 0), 0)
+    except ValueError:
+        return 0
+
 # Function to add a message to a stream
 def add_to_stream(request_id: str, message: str):
     """Add a message to a stream queue"""
-    if request_id not in active_streams:
-        active_streams[request_id] = deque()
-    
-    active_streams[request_id].append(message)
+    stream_bus.publish(request_id, message)
 
 # Process LLM streaming in a separate thread to avoid blocking
-def process_llm_streaming(chain, user_message: str, request_id: str):
-    """Process LLM streaming in a background thread"""
+def process_llm_streaming(chain, user_message: str, request_id: str,
+                          kind: str = "chat", session_id: Optional[str] = None, fallback=None):
+    """Process LLM streaming in a background thread, coalescing tokens into frames"""
+    writer = CoalescingStreamWriter(lambda message: add_to_stream(request_id, message))
+    start_time = time.time()
+    error_msg = None
+    cancelled = False
+    degraded = False
+    answer = []
+    
     try:
-        # Initialize response
-        full_response = ""
-        
-        # Process the streaming response
-        for chunk in chain.stream(user_message):
-            if chunk:
-                # Print the chunk to logs for debugging
-                print(f"Streaming chunk: {chunk[:20]}..." if len(chunk) > 20 else f"Streaming chunk: {chunk}")
-                
-                # Add to accumulated response
-                full_response += chunk
-                
-                # Add to stream
-                add_to_stream(
-                    request_id, 
-                    f"data: {json.dumps({'text': chunk})}\n\n"
-                )
-                
-                # Add a small delay to simulate typing effect if needed
-                time.sleep(0.01)
-        
-        # Add end of stream message
-        add_to_stream(
-            request_id,
-            f"data: {json.dumps({'text': '', 'end': True})}\n\n"
-        )
+        # Fail fast without taking a slot while DeepSeek is known to be down
+        if llm_breaker.is_open():
+            raise CircuitOpen("The assistant's language model is temporarily unavailable")
         
+        # Wait for a generation slot, then process the streaming response.
+        # Stop paying for tokens nobody will read: abandonment is checked on a
+        # timer, so a generation still waiting for its first token is cancelled too
+        with generation_scheduler.slot(kind):
+            chunks = llm_breaker.stream(lambda: cancellable_stream(
+                lambda: chain.stream(user_message),
+                lambda: stream_bus.is_abandoned(request_id),
+                STREAM_CANCEL_CHECK_SECONDS
+            ))
+            try:
+                for chunk in chunks:
+                    writer.write(chunk)
+                    answer.append(chunk)
+            finally:
+                # Closing the chain's iterator closes the upstream HTTP stream
+                chunks.close()
+    except StreamCancelled:
+        cancelled = True
+    except SchedulerBusy as e:
+        error_msg = str(e)
+        print(f"Stream {request_id} rejected: {error_msg}")
     except Exception as e:
-        error_msg = f"Error during streaming: {str(e)}"
-        print(error_msg)
-        
-        # Add error message to stream
-        add_to_stream(
-            request_id,
-            f"data: {json.dumps({'error': error_msg})}\n\n"
-        )
-        
-        # Add end message
-        add_to_stream(
-            request_id,
-            f"data: {json.dumps({'text': '', 'end': True})}\n\n"
+        if fallback is not None and not answer and (isinstance(e, CircuitOpen) or is_transient(e)):
+            # Nothing was streamed yet, so answer from retrieval alone
+            print(f"Stream {request_id} falling back to retrieval only: {e}")
+            try:
+                writer.write(fallback())
+                llm_breaker.record_fallback()
+                degraded = True
+            except Exception as fallback_error:
+                error_msg = f"Error during streaming: {str(e)}"
+                print(f"Retrieval-only fallback failed for {request_id}: {fallback_error}")
+        else:
+            error_msg = f"Error during streaming: {str(e)}"
+            print(error_msg)
+    finally:
+        # Flush remaining text, then add the error (if any) and end messages
+        writer.close(error="Generation cancelled" if cancelled else error_msg)
+        stream_bus.finish(request_id)
+        print(f"Stream {request_id} {'cancelled' if cancelled else 'finished'}: "
+              f"{writer.tokens} chunks in {writer.frames} frames, {time.time() - start_time:.2f}s")
+    
+    if cancelled:
+        usage_tracker.record_cancelled(writer.tokens)
+        return
+    
+    # A retrieval-only answer is not kept as a turn of the conversation
+    if degraded:
+        return
+    
+    # Remember the exchange once the client already has the whole answer
+    if session_id and not error_msg:
+        try:
+            record_turn(kind, session_id, user_message, "".join(answer))
+        except Exception as e:
+            print(f"Error saving session {session_id}: {e}")
+
+def generate_answer(chain, user_message: str, kind: str, fallback=None):
+    """Generate a complete answer once the scheduler grants a slot (runs in the threadpool).
+    
+    Returns (answer, degraded); degraded answers come from retrieval alone because
+    DeepSeek is unavailable.
+    """
+    try:
+        if llm_breaker.is_open():
+            raise CircuitOpen("The assistant's language model is temporarily unavailable")
+        with generation_scheduler.slot(kind):
+            return llm_breaker.call(lambda: chain.invoke(user_message)), False
+    except Exception as e:
+        if fallback is None or not (isinstance(e, CircuitOpen) or is_transient(e)):
+            raise
+        print(f"Answering from retrieval only: {e}")
+        answer = fallback()
+        llm_breaker.record_fallback()
+        return answer, True
+
+def fallback_answer(corpus: str, user_message: str, **filters):
+    """Build the retrieval-only answer used while DeepSeek is unavailable"""
+    return lambda: retrieval_only_answer(corpus, user_message, build_filter(corpus, **filters))
+
+def check_rate_limit(request: Request, api_key: Optional[str], client_id: Optional[str], kind: str):
+    """Reject the request with 429 if its client has used up its token bucket"""
+    key = client_key(api_key, request.client.host if request.client else None, client_id)
+    allowed, retry_after = rate_limiter.check(key, kind)
+    if not allowed:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests; please slow down",
+            headers={"Retry-After": str(max(1, int(retry_after + 0.999)))}
         )
 
+def limit_chat(request: Request, x_api_key: Optional[str] = Header(None), x_client_id: Optional[str] = Header(None)):
+    check_rate_limit(request, x_api_key, x_client_id, "chat")
+
+def limit_planning(request: Request, x_api_key: Optional[str] = Header(None), x_client_id: Optional[str] = Header(None)):
+    check_rate_limit(request, x_api_key, x_client_id, "planning")
+
+def limit_search(request: Request, x_api_key: Optional[str] = Header(None), x_client_id: Optional[str] = Header(None)):
+    check_rate_limit(request, x_api_key, x_client_id, "search")
+
+def busy_response(e: SchedulerBusy):
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=str(e),
+        headers={"Retry-After": "5"}
+    )
+
 # Initialization endpoint
 @app.post("/api/initialize")
 async def initialize_api_system():
@@ -247,20 +415,27 @@ async def initialize_api_system():
         )
 
 # User chatbot endpoint (rag_chain)
-@app.post("/api/chat")
+@app.post("/api/chat", dependencies=[Depends(limit_chat)])
 async def chat_endpoint(
+    background_tasks: BackgroundTasks,
     request: ChatRequest = Body(...),
     stream: bool = Query(False, description="Enable streaming response"),
     request_id: str = Query(None, description="Unique ID for streaming request")
 ):
     """Public endpoint for regular users to interact with the main RAG chatbot"""
     try:
+        # Earlier turns of this session, summarized to a bounded size
+        history = format_history(load_session("chat", request.session_id)) if request.session_id else None
+        
         # Create RAG chain with filters
         rag_chain = create_rag_chain(
             streaming=stream,
             resource_type=request.resource_type,
-            audience=request.audience
+            audience=request.audience,
+            history=history
         )
+        fallback = fallback_answer("adkar", request.message,
+                                   resource_type=request.resource_type, audience=request.audience)
         
         # Return streaming response if requested
         if stream:
@@ -268,19 +443,26 @@ async def chat_endpoint(
             if not request_id:
                 request_id = f"chat_{int(time.time() * 1000)}"
             
+            # Register the stream so any worker can serve the GET
+            stream_bus.open(request_id)
+            
             # Start processing in a background thread
             threading.Thread(
                 target=process_llm_streaming,
-                args=(rag_chain, request.message, request_id),
+                args=(rag_chain, request.message, request_id, "chat", request.session_id, fallback),
                 daemon=True
             ).start()
             
             # Return success immediately - client will fetch the stream separately
-            return {"status": "streaming", "request_id": request_id}
+            return {"status": "streaming", "request_id": request_id, "session_id": request.session_id}
         
         # Otherwise return normal JSON response
-        response = rag_chain.invoke(request.message)
-        return ChatResponse(response=response)
+        response, degraded = await run_in_threadpool(generate_answer, rag_chain, request.message, "chat", fallback)
+        if request.session_id and not degraded:
+            background_tasks.add_task(record_turn, "chat", request.session_id, request.message, response)
+        return ChatResponse(response=response, session_id=request.session_id, degraded=degraded)
+    except SchedulerBusy as e:
+        raise busy_response(e)
     except Exception as e:
         # Check if it's likely due to missing initialization
         if "Vector store not found" in str(e):
@@ -297,8 +479,11 @@ async def chat_endpoint(
 # Streaming endpoint for user chat
 @app.get("/api/chat/stream")
 async def chat_stream_endpoint(
+    request: Request,
     request_id: str = Query(..., description="ID of the streaming request to fetch"),
-    stream: bool = Query(True, description="Must be true for streaming")
+    stream: bool = Query(True, description="Must be true for streaming"),
+    last_event_id: Optional[int] = Query(None, description="Resume after this event ID"),
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID")
 ):
     """Endpoint to stream chat responses for a request that was initiated via the POST endpoint"""
     if not stream:
@@ -309,14 +494,12 @@ async def chat_stream_endpoint(
     
     print(f"Streaming request received for ID: {request_id}")
     
-    # Ensure the request_id exists in active_streams
-    if request_id not in active_streams:
+    # generate_stream_response opens unknown streams itself, and reports expired ones on resume
+    if not stream_bus.exists(request_id):
         print(f"Warning: Request ID {request_id} not found in active streams")
-        # Initialize an empty queue for this request anyway
-        active_streams[request_id] = deque()
         
     return StreamingResponse(
-        generate_stream_response(request_id),
+        generate_stream_response(request_id, resume_position(last_event_id_header, last_event_id), request),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
@@ -326,8 +509,9 @@ async def chat_stream_endpoint(
     )
 
 # Admin planning chatbot endpoint (change_planning_chain)
-@app.post("/api/planning")
+@app.post("/api/planning", dependencies=[Depends(limit_planning)])
 async def planning_endpoint(
+    background_tasks: BackgroundTasks,
     request: PlanningRequest = Body(...),
     stream: bool = Query(False, description="Enable streaming response"),
     request_id: str = Query(None, description="Unique ID for streaming request")
@@ -336,12 +520,18 @@ async def planning_endpoint(
     try:
         print(f"Planning request received: stream={stream}, request_id={request_id}, message={request.message[:30]}...")
         
+        # Earlier turns of this session, summarized to a bounded size
+        history = format_history(load_session("planning", request.session_id)) if request.session_id else None
+        
         # Create Change Planning RAG chain with filters
         planning_chain = create_change_planning_chain(
             streaming=stream,
             plan_stage=request.plan_stage,
-            change_type=request.change_type
+            change_type=request.change_type,
+            history=history
         )
+        fallback = fallback_answer("change_planning", request.message,
+                                   plan_stage=request.plan_stage, change_type=request.change_type)
         
         # Return streaming response if requested
         if stream:
@@ -352,22 +542,29 @@ async def planning_endpoint(
             else:
                 print(f"Using provided request_id: {request_id}")
             
+            # Register the stream so any worker can serve the GET
+            stream_bus.open(request_id)
+            
             # Start processing in a background thread
             print(f"Starting background thread for request_id: {request_id}")
             threading.Thread(
                 target=process_llm_streaming,
-                args=(planning_chain, request.message, request_id),
+                args=(planning_chain, request.message, request_id, "planning", request.session_id, fallback),
                 daemon=True
             ).start()
             
             # Return success immediately - client will fetch the stream separately
             print(f"Returning streaming response with request_id: {request_id}")
-            return {"status": "streaming", "request_id": request_id}
+            return {"status": "streaming", "request_id": request_id, "session_id": request.session_id}
         
         # Otherwise return normal JSON response
         print("Processing non-streaming request")
-        response = planning_chain.invoke(request.message)
-        return ChatResponse(response=response)
+        response, degraded = await run_in_threadpool(generate_answer, planning_chain, request.message, "planning", fallback)
+        if request.session_id and not degraded:
+            background_tasks.add_task(record_turn, "planning", request.session_id, request.message, response)
+        return ChatResponse(response=response, session_id=request.session_id, degraded=degraded)
+    except SchedulerBusy as e:
+        raise busy_response(e)
     except Exception as e:
         # Check if it's likely due to missing initialization
         if "vector store not found" in str(e).lower():
@@ -384,8 +581,11 @@ async def planning_endpoint(
 # Streaming endpoint for admin planning
 @app.get("/api/planning/stream")
 async def planning_stream_endpoint(
+    request: Request,
     request_id: str = Query(..., description="ID of the streaming request to fetch"),
-    stream: bool = Query(True, description="Must be true for streaming")
+    stream: bool = Query(True, description="Must be true for streaming"),
+    last_event_id: Optional[int] = Query(None, description="Resume after this event ID"),
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID")
 ):
     """Endpoint to stream planning responses for a request that was initiated via the POST endpoint"""
     print(f"Stream request received for planning with ID: {request_id}")
@@ -396,16 +596,12 @@ async def planning_stream_endpoint(
             detail="Stream parameter must be true for this endpoint"
         )
     
-    print(f"Checking if request_id {request_id} exists in active_streams: {request_id in active_streams}")
-    
-    # Ensure the request_id exists in active_streams
-    if request_id not in active_streams:
-        print(f"Request ID {request_id} not found, initializing empty queue")
-        # Initialize an empty queue for this request
-        active_streams[request_id] = deque()
+    request_exists = stream_bus.exists(request_id)
+    print(f"Checking if request_id {request_id} exists on the stream bus: {request_exists}")
     
+    # generate_stream_response opens unknown streams itself, and reports expired ones on resume
     return StreamingResponse(
-        generate_stream_response(request_id),
+        generate_stream_response(request_id, resume_position(last_event_id_header, last_event_id), request),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
@@ -414,6 +610,124 @@ async def planning_stream_endpoint(
         }
     )
 
+# Batched retrieval endpoint for internal tools and evaluation jobs.
+# Declared without async so FastAPI runs the CPU-bound search in its threadpool.
+@app.post("/api/retrieve/batch")
+def retrieve_batch_endpoint(
+    request: BatchRetrieveRequest = Body(...),
+    username: str = Depends(verify_admin)
+):
+    """Return the top-k chunks for many queries with one batched embedding and search"""
+    if request.corpus not in CORPORA:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown corpus. Expected one of: {', '.join(CORPORA)}"
+        )
+    if len(request.queries) > MAX_BATCH_QUERIES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Too many queries; the limit is {MAX_BATCH_QUERIES} per request"
+        )
+    if request.k < 1:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="k must be at least 1"
+        )
+    
+    try:
+        results = retrieve_batch(
+            [item.query for item in request.queries],
+            corpus=request.corpus,
+            k=request.k,
+            filters=[item.filter for item in request.queries],
+            fetch_k=request.fetch_k
+        )
+    except ValueError as e:
+        if "vector store not found" in str(e).lower():
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="System needs initialization. Please use the /api/initialize endpoint."
+            )
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    return {
+        "corpus": request.corpus,
+        "results": [
+            {"query": item.query, "chunks": chunks}
+            for item, chunks in zip(request.queries, results)
+        ]
+    }
+
+# Retrieval-only search for instant source suggestions; works without a DeepSeek key.
+# Declared without async so FastAPI runs the search in its threadpool.
+@app.get("/api/search", dependencies=[Depends(limit_search)])
+def search_endpoint(
+    q: str = Query(..., min_length=1, max_length=1000, description="Text to search for"),
+    corpus: str = Query("all", description="adkar, change_planning or all"),
+    k: int = Query(5, ge=1, description="Chunks to return"),
+    resource_type: Optional[str] = Query(None),
+    audience: Optional[str] = Query(None),
+    plan_stage: Optional[str] = Query(None),
+    change_type: Optional[str] = Query(None)
+):
+    """Return the chunks that best match a query, with their source, page and similarity score"""
+    if corpus != "all" and corpus not in CORPORA:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown corpus. Expected all or one of: {', '.join(CORPORA)}"
+        )
+    if k > MAX_SEARCH_K:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"k must be at most {MAX_SEARCH_K}"
+        )
+    
+    start_time = time.perf_counter()
+    try:
+        hits = search_sources(
+            q,
+            corpora=None if corpus == "all" else [corpus],
+            k=k,
+            resource_type=resource_type,
+            audience=audience,
+            plan_stage=plan_stage,
+            change_type=change_type
+        )
+    except ValueError as e:
+        if "vector store not found" in str(e).lower():
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="System needs initialization. Please use the /api/initialize endpoint."
+            )
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    return {
+        "query": q,
+        "results": hits,
+        "took_ms": round((time.perf_counter() - start_time) * 1000, 2)
+    }
+
+# DeepSeek token usage (including prompt tokens served from the provider's prefix cache),
+# the retrieved context actually placed in prompts, generation queueing, request hedging,
+# upstream retries and circuit state, and per-client counters
+@app.get("/api/usage")
+async def usage_endpoint(username: str = Depends(verify_admin)):
+    """Report usage and load counters accumulated by this process"""
+    return {
+        "llm": usage_tracker.snapshot(),
+        "hedging": hedge_policy.snapshot(),
+        "upstream": llm_breaker.snapshot(),
+        "retrieval": retrieval_stats.snapshot(),
+        "scheduler": generation_scheduler.snapshot(),
+        "clients": rate_limiter.usage()
+    }
+
 # Status endpoint
 @app.get("/api/status")
 async def status_endpoint(request: Request):
@@ -432,14 +746,15 @@ async def status_endpoint(request: Request):
 # Warmup endpoint for widgets
 @app.post("/api/warmup")
 async def warmup_endpoint(request: WarmupRequest = Body(...)):
-    """Warm up the models to reduce first-query latency"""
-    # Start initialization in a background thread if not already warmed up
+    """Warm up the models to reduce first-query latency (local only, no LLM tokens)"""
+    # Start a local warmup in a background thread if not already warmed up
     warmup_status = get_warmup_status()
     
     if request.force or warmup_status["status"] != "ready":
-        # Start initialization in a background thread
+        # The readiness state machine ignores the call if a warmup is already running
         threading.Thread(
-            target=initialize_system,
+            target=warmup_models,
+            kwargs={"force": request.force},
             daemon=True
         ).start()
     
@@ -458,8 +773,8 @@ async def test_stream_endpoint(
 ):
     """Test endpoint to simulate a streaming response - for debugging only"""
     # Create a test stream
-    if request_id not in active_streams:
-        active_streams[request_id] = deque()
+    if not stream_bus.exists(request_id):
+        stream_bus.open(request_id)
         
         # Add some test messages in a background thread
         def add_test_messages():
@@ -475,6 +790,7 @@ async def test_stream_endpoint(
             add_to_stream(request_id, f"data: {json.dumps({'text': 'stream.'})}\n\n")
             time.sleep(0.5)
             add_to_stream(request_id, f"data: {json.dumps({'text': '', 'end': True})}\n\n")
+            stream_bus.finish(request_id)
         
         threading.Thread(target=add_test_messages, daemon=True).start()
     
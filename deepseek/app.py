@@ -18,16 +18,40 @@ if sys.platform == 'darwin':  # macOS
         pass
 
 # Import streamlit and environment variables
+import uuid
+
 import streamlit as st
 from dotenv import load_dotenv
 
-# Import models only after setting event loop policy
-from app.models.rag_chain import create_rag_chain
-from app.utils.initialize import initialize_system
+from app.utils.api_client import ASSISTANT_API_URL, stream_answer, get_backend_status, initialize_backend
 
 # Load environment variables
 load_dotenv()
 
+# "api" streams answers from the running FastAPI backend (ASSISTANT_API_URL),
+# so Streamlit sessions share its models and indexes; "local" runs the chain
+# in this process with the model and index cached once per process
+STREAMLIT_BACKEND = os.getenv("STREAMLIT_BACKEND", "api")
+
+@st.cache_resource(show_spinner="Loading models...")
+def get_local_chain(resource_type, audience):
+    """Build the RAG chain once per filter combination and share it across sessions."""
+    # Import models only after setting event loop policy
+    from app.models.rag_chain import create_rag_chain
+    return create_rag_chain(streaming=True, resource_type=resource_type, audience=audience)
+
+def stream_response(prompt):
+    """Yield answer text from the backend or the cached local chain."""
+    if STREAMLIT_BACKEND == "local":
+        yield from get_local_chain(st.session_state.resource_type, st.session_state.audience).stream(prompt)
+    else:
+        yield from stream_answer("chat", {
+            "message": prompt,
+            "session_id": st.session_state.session_id,
+            "resource_type": st.session_state.resource_type,
+            "audience": st.session_state.audience
+        }, client_id=st.session_state.session_id)
+
 # Set page config
 st.set_page_config(
     page_title="Change Management Assistant",
@@ -63,27 +87,50 @@ if "resource_type" not in st.session_state:
     st.session_state.resource_type = None
 if "audience" not in st.session_state:
     st.session_state.audience = None
+if "session_id" not in st.session_state:
+    st.session_state.session_id = str(uuid.uuid4())
 
 # Sidebar with system initialization and filters
 with st.sidebar:
     st.header("System Configuration")
     
-    # Check if API key is set
-    api_key = os.getenv("DEEPSEEK_API_KEY")
-    if not api_key or api_key == "your_api_key_here":
-        st.error("⚠️ DeepSeek API key not configured")
-        st.info("Please set your API key in the .env file")
-        api_key_input = st.text_input("Or enter your DeepSeek API key:", type="password")
-        if api_key_input:
-            os.environ["DEEPSEEK_API_KEY"] = api_key_input
-            st.success("API key set for this session!")
+    if STREAMLIT_BACKEND == "local":
+        # Check if API key is set
+        api_key = os.getenv("DEEPSEEK_API_KEY")
+        if not api_key or api_key == "your_api_key_here":
+            st.error("⚠️ DeepSeek API key not configured")
+            st.info("Please set your API key in the .env file")
+            api_key_input = st.text_input("Or enter your DeepSeek API key:", type="password")
+            if api_key_input:
+                os.environ["DEEPSEEK_API_KEY"] = api_key_input
+                st.success("API key set for this session!")
+        else:
+            st.success("✅ DeepSeek API key configured")
     else:
-        st.success("✅ DeepSeek API key configured")
+        # The backend holds the API key, models and indexes
+        backend_status = get_backend_status()
+        if backend_status is None:
+            st.error(f"⚠️ Backend not reachable at {ASSISTANT_API_URL}")
+            st.info("Start it with: uvicorn api:app")
+        elif backend_status.get("status") == "ready":
+            st.success("✅ Backend ready")
+        else:
+            st.warning(f"Backend status: {backend_status.get('status')}")
     
     # System initialization button
     if st.button("Initialize/Reinitialize System"):
         with st.spinner("Initializing system..."):
-            success = initialize_system()
+            if STREAMLIT_BACKEND == "local":
+                from app.utils.initialize import initialize_system
+                success = initialize_system()
+                # Rebuild cached chains against the new indexes
+                get_local_chain.clear()
+            else:
+                try:
+                    success = initialize_backend().get("status") in ("success", "in_progress")
+                except Exception as e:
+                    print(f"Backend initialization failed: {e}")
+                    success = False
             if success:
                 st.success("System initialized successfully!")
             else:
@@ -159,15 +206,8 @@ if prompt := st.chat_input("Ask about adapting to changes or finding educational
             message_placeholder = st.empty()
             full_response = ""
             
-            # Create RAG chain with filters
-            rag_chain = create_rag_chain(
-                streaming=True,
-                resource_type=st.session_state.resource_type,
-                audience=st.session_state.audience
-            )
-            
             # Process the stream of response tokens
-            for chunk in rag_chain.stream(prompt):
+            for chunk in stream_response(prompt):
                 full_response += chunk
                 # Add a blinking cursor to simulate typing
                 message_placeholder.markdown(full_response + "▌")
@@ -183,7 +223,7 @@ if prompt := st.chat_input("Ask about adapting to changes or finding educational
             st.error(error_message)
             
             # Check if it's likely due to missing initialization
-            if "Vector store not found" in str(e):
+            if "Vector store not found" in str(e) or "503" in str(e):
                 st.info("Please initialize the system using the button in the sidebar.")
             
             # Add error message to chat history
@@ -0,0 +1,63 @@
+import os
+import sys
+import asyncio
+import shutil
+
+# Configure asyncio event loop before importing torch-related modules
+if sys.platform == 'darwin':  # macOS
+    if not isinstance(asyncio.get_event_loop_policy(), asyncio.DefaultEventLoopPolicy):
+        asyncio.set_event_loop_policy(asyncio.DefaultEventLoopPolicy())
+
+import faiss
+
+from app.models.docstore import DOCSTORE_FILE, write_docstore
+from app.models.vector_store import (
+    INDEX_FILE, PICKLED_DOCSTORE_FILE, VECTOR_PCA_DIMS, VERSIONS_DIR,
+    begin_version, get_current_version, publish_build, read_store_dir
+)
+
+def convert_store(store_path):
+    """Republish a store whose current version has a pickled docstore in the SQLite format.
+
+    The FAISS index is copied as is (including any PCA projection), so
+    search results do not change. A store saved before versioning keeps its
+    files directly in store_path; they are removed once the converted
+    version is published, since nothing reads them after that. Returns the
+    new version, or None if there was nothing to convert.
+    """
+    version = get_current_version(store_path)
+    store_dir = store_path if version is None else os.path.join(store_path, VERSIONS_DIR, version)
+    if os.path.exists(os.path.join(store_dir, DOCSTORE_FILE)):
+        print(f"{store_dir} already has a {DOCSTORE_FILE}")
+        return None
+    if not os.path.exists(os.path.join(store_dir, PICKLED_DOCSTORE_FILE)):
+        print(f"No pickled docstore in {store_dir}")
+        return None
+
+    # Read the pickle explicitly; embeddings are not needed to copy the store
+    vector_store = read_store_dir(store_dir, None, allow_pickle=True)
+    new_version, build_dir = begin_version(store_path)
+    try:
+        faiss.write_index(vector_store.index, os.path.join(build_dir, INDEX_FILE))
+        write_docstore(os.path.join(build_dir, DOCSTORE_FILE), vector_store)
+    except Exception:
+        shutil.rmtree(build_dir, ignore_errors=True)
+        raise
+    print(f"Converted {vector_store.index.ntotal} chunks from {store_dir}")
+    publish_build(store_path, new_version, build_dir)
+
+    if version is None:
+        for name in (INDEX_FILE, PICKLED_DOCSTORE_FILE):
+            os.remove(os.path.join(store_path, name))
+    return new_version
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert pickled vector stores to the SQLite docstore format")
+    parser.add_argument("stores", nargs="*", default=list(VECTOR_PCA_DIMS),
+                        help="Store directories (default: the ADKAR and change planning stores)")
+    args = parser.parse_args()
+
+    for store_path in args.stores:
+        convert_store(store_path)
@@ -0,0 +1,168 @@
+import os
+import hashlib
+import json
+import zlib
+
+import numpy as np
+
+# Drop duplicate chunks at ingestion time (set to false to keep every copy)
+DEDUP_CHUNKS = os.getenv("DEDUP_CHUNKS", "true").lower() in ("1", "true", "yes")
+# Estimated Jaccard similarity above which two chunks count as near duplicates
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.85"))
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+def normalize_text(text):
+    """Lowercase and collapse whitespace so formatting differences do not matter."""
+    return " ".join(text.lower().split())
+
+class ChunkDeduplicator:
+    """Detect exact and near-duplicate chunks with shingled MinHash and LSH.
+
+    Only hashes and signatures are kept, never chunk text, so it can sit in
+    a streaming pipeline. Each chunk is identified by a caller-chosen key;
+    the first chunk seen becomes canonical, and later duplicates are
+    recorded against its key in `duplicates`.
+    """
+
+    def __init__(self, threshold=DEDUP_THRESHOLD, num_perm=128, bands=16, shingle_size=5, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+
+        self._exact = {}
+        self._signatures = {}
+        self._buckets = {}
+        self.duplicates = {}
+        self.stats = {"chunks": 0, "exact_duplicates": 0, "near_duplicates": 0, "chars_removed": 0}
+
+    def _signature(self, normalized):
+        words = normalized.split()
+        if len(words) <= self.shingle_size:
+            shingles = {normalized}
+        else:
+            shingles = {
+                " ".join(words[i:i + self.shingle_size])
+                for i in range(len(words) - self.shingle_size + 1)
+            }
+        hashes = np.fromiter(
+            (zlib.crc32(shingle.encode("utf-8")) for shingle in shingles),
+            dtype=np.uint64,
+            count=len(shingles)
+        )
+        # Every (a * h + b) stays below 2^64 because a, b and h are all below 2^32
+        permuted = (np.outer(hashes, self._a) + self._b) % _MERSENNE_PRIME & _MAX_HASH
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def _band_keys(self, signature):
+        return [
+            (band, signature[band * self.rows:(band + 1) * self.rows].tobytes())
+            for band in range(self.bands)
+        ]
+
+    def add(self, key, text, source=None):
+        """Register a chunk. Returns the canonical key it duplicates, or None if it is new."""
+        self.stats["chunks"] += 1
+        normalized = normalize_text(text)
+
+        digest = hashlib.sha1(normalized.encode("utf-8")).digest()
+        canonical = self._exact.get(digest)
+        if canonical is not None:
+            self.stats["exact_duplicates"] += 1
+            return self._record(canonical, text, source)
+
+        signature = self._signature(normalized)
+        band_keys = self._band_keys(signature)
+        candidates = {candidate for band_key in band_keys for candidate in self._buckets.get(band_key, ())}
+        for candidate in candidates:
+            similarity = float(np.mean(self._signatures[candidate] == signature))
+            if similarity >= self.threshold:
+                self.stats["near_duplicates"] += 1
+                return self._record(candidate, text, source)
+
+        self._exact[digest] = key
+        self._signatures[key] = signature
+        for band_key in band_keys:
+            self._buckets.setdefault(band_key, []).append(key)
+        return None
+
+    def _record(self, canonical, text, source):
+        self.stats["chars_removed"] += len(text)
+        if source is not None:
+            self.duplicates.setdefault(canonical, []).append(source)
+        return canonical
+
+    def report(self):
+        """Summarize how much the corpus shrank."""
+        removed = self.stats["exact_duplicates"] + self.stats["near_duplicates"]
+        total = self.stats["chunks"]
+        return {
+            **self.stats,
+            "chunks_kept": total - removed,
+            "chunks_removed": removed,
+            "shrink_ratio": round(removed / total, 4) if total else 0.0
+        }
+
+def embed_seconds_saved(report, embed_seconds, chunks_embedded):
+    """Embedding time the removed chunks would have cost, at the rate measured for the kept ones."""
+    seconds_per_chunk = embed_seconds / chunks_embedded if chunks_embedded else 0.0
+    return round(report["chunks_removed"] * seconds_per_chunk, 2)
+
+def describe_savings(report, seconds_saved):
+    """One-line summary of the shrink ratio and the embedding time saved."""
+    return (f"Deduplication removed {report['chunks_removed']} chunks: index shrinks by "
+            f"{report['shrink_ratio']:.1%}, saving about {seconds_saved:.1f}s of embedding")
+
+def dedup_report_path(documents_file):
+    """Where the dedup report of a processed documents file is kept, for the step that embeds it."""
+    return f"{os.path.splitext(documents_file)[0]}.dedup.json"
+
+def save_dedup_report(report, documents_file):
+    """Keep the report next to documents_file, or remove a stale one when report is None."""
+    path = dedup_report_path(documents_file)
+    if report is None:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    with open(path, 'w') as f:
+        json.dump(report, f)
+
+def load_dedup_report(documents_file):
+    """The dedup report saved with documents_file, or None if it was not deduplicated."""
+    try:
+        with open(dedup_report_path(documents_file), 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def chunk_source(doc):
+    """The provenance recorded for a dropped duplicate."""
+    return {"source": doc.metadata.get("source"), "page": doc.metadata.get("page")}
+
+def dedup_documents(documents, threshold=DEDUP_THRESHOLD):
+    """Drop duplicate chunks from a list, noting their sources on the kept copy.
+
+    Returns the kept documents and a report of what was removed.
+    """
+    deduplicator = ChunkDeduplicator(threshold=threshold)
+    kept = []
+    for doc in documents:
+        if deduplicator.add(len(kept), doc.page_content, chunk_source(doc)) is None:
+            kept.append(doc)
+
+    for index, sources in deduplicator.duplicates.items():
+        kept[index].metadata["duplicate_sources"] = sources
+
+    report = deduplicator.report()
+    print(f"Removed {report['chunks_removed']} duplicate chunks "
+          f"({report['exact_duplicates']} exact, {report['near_duplicates']} near); "
+          f"index shrinks by {report['shrink_ratio']:.1%}")
+    return kept, report
@@ -0,0 +1,271 @@
+import os
+import sys
+import asyncio
+import json
+import queue
+import resource
+import shutil
+import threading
+import time
+import uuid
+
+# Configure asyncio event loop before importing torch-related modules
+if sys.platform == 'darwin':  # macOS
+    if not isinstance(asyncio.get_event_loop_policy(), asyncio.DefaultEventLoopPolicy):
+        asyncio.set_event_loop_policy(asyncio.DefaultEventLoopPolicy())
+
+import faiss
+import numpy as np
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from app.data.dedup import DEDUP_CHUNKS, ChunkDeduplicator, chunk_source, describe_savings, embed_seconds_saved
+from app.data.pdf_loaders import iter_pdf_file_pages
+from app.data.prepare_data import get_resource_metadata
+from app.data.prepare_change_planning_data import get_planning_metadata, create_change_planning_documents
+from app.models.docstore import DOCSTORE_FILE, DocstoreWriter
+from app.models.vector_store import (
+    INDEX_FILE, begin_version, get_embeddings, project_index, publish_build, resolve_pca_dim
+)
+
+# Chunks embedded and appended to the index per step
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+# Chunks the loader may run ahead of the embedder before it blocks
+INGEST_PREFETCH_CHUNKS = int(os.getenv("INGEST_PREFETCH_CHUNKS", "256"))
+
+# Source directory, filename metadata and outputs for each corpus
+INGEST_CORPORA = {
+    "adkar": {
+        "directory": "./resources",
+        "metadata": get_resource_metadata,
+        "documents_file": "app/data/processed_documents.json",
+        "store_path": "app/data/vector_store",
+        "baseline": None
+    },
+    "change_planning": {
+        "directory": "./resources/change_planning",
+        "metadata": get_planning_metadata,
+        "documents_file": "app/data/change_planning_documents.json",
+        "store_path": "app/data/change_planning_store",
+        "baseline": create_change_planning_documents
+    }
+}
+
+_END = object()
+
+def peak_rss_mb():
+    """Peak resident memory of this process so far, in megabytes."""
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return usage / (1024 * 1024) if sys.platform == 'darwin' else usage / 1024
+
+def iter_pdf_pages(directory, metadata_fn):
+    """Yield PDF pages one at a time with filename-derived metadata."""
+    if not os.path.exists(directory):
+        return
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith(".pdf"):
+            continue
+        file_metadata = metadata_fn(filename)
+        for page in iter_pdf_file_pages(os.path.join(directory, filename)):
+            page.metadata.update(file_metadata)
+            yield page
+
+def iter_chunks(pages, chunk_size=1000, chunk_overlap=100):
+    """Split pages into chunks as they arrive, keeping one page in memory."""
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        separators=["\n\n", "\n", " ", ""]
+    )
+    for page in pages:
+        yield from text_splitter.split_documents([page])
+
+def iter_unique_chunks(chunks, deduplicator=None):
+    """Assign each chunk its docstore ID and drop duplicates of earlier chunks."""
+    for doc in chunks:
+        chunk_id = str(uuid.uuid4())
+        if deduplicator is not None and deduplicator.add(chunk_id, doc.page_content, chunk_source(doc)) is not None:
+            continue
+        yield chunk_id, doc
+
+def iter_batches(items, batch_size):
+    """Group an iterable into lists of at most batch_size items."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def bounded_prefetch(items, max_items):
+    """Produce items on a background thread through a bounded queue.
+
+    The producer blocks once max_items are waiting, so a fast stage (PDF
+    parsing) can overlap with a slow one (embedding) without running ahead
+    of it unboundedly.
+    """
+    buffer = queue.Queue(maxsize=max_items)
+    failure = []
+
+    def produce():
+        try:
+            for item in items:
+                buffer.put(item)
+        except Exception as e:
+            failure.append(e)
+        finally:
+            buffer.put(_END)
+
+    threading.Thread(target=produce, daemon=True).start()
+    while True:
+        item = buffer.get()
+        if item is _END:
+            break
+        yield item
+    if failure:
+        raise failure[0]
+
+class JsonArrayWriter:
+    """Write a JSON array of documents one element at a time.
+
+    Elements go to a temporary file; commit() replaces the real file with
+    it, and close() without a commit deletes it, so a failed run leaves the
+    last good file in place.
+    """
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.tmp_path = f"{path}.tmp-{os.getpid()}"
+        self.file = open(self.tmp_path, 'w')
+        self.file.write("[")
+        self.count = 0
+
+    def write(self, doc):
+        if self.count:
+            self.file.write(", ")
+        json.dump({"page_content": doc.page_content, "metadata": doc.metadata}, self.file)
+        self.count += 1
+
+    def commit(self):
+        self.file.write("]")
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+def ingest_corpus(corpus, batch_size=INGEST_BATCH_SIZE, prefetch=INGEST_PREFETCH_CHUNKS):
+    """Stream a corpus from PDFs into a new published index version.
+
+    Pages are loaded, chunked, de-duplicated, embedded in fixed-size batches
+    and appended to a FAISS index, while the chunks themselves are written
+    straight to the new version's SQLite docstore. Only the vectors stay in
+    memory. Returns a report with counts, timings and peak RSS.
+    
+    Sources of dropped duplicates are added to the canonical chunk's
+    docstore metadata once ingestion finishes; the JSON documents file,
+    written as chunks stream past, does not carry them. Nothing is published
+    (index or JSON) unless the whole run succeeds.
+    """
+    config = INGEST_CORPORA[corpus]
+    start_time = time.time()
+    embeddings = get_embeddings()
+
+    deduplicator = ChunkDeduplicator() if DEDUP_CHUNKS else None
+    pages = iter_pdf_pages(config["directory"], config["metadata"])
+    chunks = bounded_prefetch(iter_unique_chunks(iter_chunks(pages), deduplicator), prefetch)
+
+    writer = JsonArrayWriter(config["documents_file"])
+    index = None
+    docstore = None
+    version, build_dir = None, None
+    published = False
+    chunk_count = 0
+    batch_count = 0
+    embed_seconds = 0.0
+
+    def add_batch(batch):
+        nonlocal index, docstore, version, build_dir, chunk_count, batch_count, embed_seconds
+        ids = [chunk_id for chunk_id, _ in batch]
+        documents = [doc for _, doc in batch]
+        embed_start = time.time()
+        vectors = np.asarray(embeddings.embed_documents([doc.page_content for doc in documents]), dtype=np.float32)
+        embed_seconds += time.time() - embed_start
+        if index is None:
+            # Same index the LangChain wrapper builds: flat L2 over the raw embeddings
+            index = faiss.IndexFlatL2(vectors.shape[1])
+            version, build_dir = begin_version(config["store_path"])
+            docstore = DocstoreWriter(os.path.join(build_dir, DOCSTORE_FILE))
+        index.add(vectors)
+        docstore.add(ids, documents)
+        for doc in documents:
+            writer.write(doc)
+        chunk_count += len(batch)
+        batch_count += 1
+
+    try:
+        for batch in iter_batches(chunks, batch_size):
+            add_batch(batch)
+
+        # Change planning falls back to its built-in knowledge when no PDFs exist
+        if index is None and config["baseline"]:
+            print("No external documents found, using baseline knowledge...")
+            baseline_chunks = iter_unique_chunks(iter_chunks(config["baseline"]()), deduplicator)
+            for batch in iter_batches(baseline_chunks, batch_size):
+                add_batch(batch)
+
+        report = {
+            "corpus": corpus,
+            "chunks": chunk_count,
+            "batches": batch_count,
+            "embed_seconds": round(embed_seconds, 2),
+            "total_seconds": round(time.time() - start_time, 2),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+            "version": None
+        }
+        if deduplicator is not None:
+            dedup_report = deduplicator.report()
+            report["dedup"] = dedup_report
+            report["embed_seconds_saved"] = embed_seconds_saved(dedup_report, embed_seconds, chunk_count)
+            print(describe_savings(dedup_report, report["embed_seconds_saved"]))
+        if index is None:
+            print(f"No documents found for {corpus}; vector store not rebuilt.")
+            return report
+
+        if deduplicator is not None:
+            for chunk_id, sources in deduplicator.duplicates.items():
+                docstore.update_metadata(chunk_id, {"duplicate_sources": sources})
+        docstore.close()
+        index = project_index(index, resolve_pca_dim(config["store_path"]))
+        faiss.write_index(index, os.path.join(build_dir, INDEX_FILE))
+
+        report["version"] = publish_build(config["store_path"], version, build_dir)
+        published = True
+        writer.commit()
+    finally:
+        writer.close()
+        if docstore is not None:
+            docstore.close()
+        if build_dir is not None and not published:
+            shutil.rmtree(build_dir, ignore_errors=True)
+
+    print(f"Ingested {corpus}: {report}")
+    return report
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Stream PDFs into a versioned vector store")
+    parser.add_argument("--corpus", choices=list(INGEST_CORPORA), required=True)
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE)
+    parser.add_argument("--prefetch", type=int, default=INGEST_PREFETCH_CHUNKS)
+    args = parser.parse_args()
+
+    report = ingest_corpus(args.corpus, batch_size=args.batch_size, prefetch=args.prefetch)
+    sys.exit(0 if report["chunks"] else 1)
@@ -0,0 +1,77 @@
+import os
+import re
+
+from langchain.schema.document import Document
+from langchain_community.document_loaders import PyPDFLoader
+
+# "pypdf" uses LangChain's PyPDFLoader; "pymupdf" uses PyMuPDF, which is much
+# faster on large, image-heavy exports
+PDF_LOADER = os.getenv("PDF_LOADER", "pypdf")
+
+# PDF metadata keys mapped to the names PyPDFLoader gives them
+_PYMUPDF_METADATA_KEYS = {
+    "producer": "producer",
+    "creator": "creator",
+    "creationDate": "creationdate",
+    "author": "author",
+    "modDate": "moddate",
+    "title": "title",
+    "subject": "subject",
+    "keywords": "keywords",
+    "trapped": "trapped"
+}
+
+_PDF_DATE = re.compile(
+    r"D:(\d{4})(\d{2})?(\d{2})?(\d{2})?(\d{2})?(\d{2})?([Z+-])?(\d{2})?'?(\d{2})?'?"
+)
+
+def pdf_date_to_iso(value):
+    """Convert a PDF date like D:20201203162615+08'00' to ISO 8601, as PyPDFLoader does."""
+    match = _PDF_DATE.match(value or "")
+    if not match:
+        return value
+    year, month, day, hour, minute, second, sign, tz_hour, tz_minute = match.groups()
+    iso = f"{year}-{month or '01'}-{day or '01'}T{hour or '00'}:{minute or '00'}:{second or '00'}"
+    if sign == "Z":
+        iso += "+00:00"
+    elif sign:
+        iso += f"{sign}{tz_hour or '00'}:{tz_minute or '00'}"
+    return iso
+
+def iter_pymupdf_pages(file_path):
+    """Yield one Document per page with PyMuPDF, matching PyPDFLoader's metadata.
+
+    Pages without a text layer (no fonts, e.g. scanned images) are skipped
+    before any text extraction.
+    """
+    import fitz  # PyMuPDF
+
+    with fitz.open(file_path) as pdf:
+        base_metadata = {}
+        for key, name in _PYMUPDF_METADATA_KEYS.items():
+            value = (pdf.metadata or {}).get(key)
+            if value:
+                base_metadata[name] = pdf_date_to_iso(value) if key.endswith("Date") else value
+        base_metadata["source"] = file_path
+        base_metadata["total_pages"] = pdf.page_count
+
+        for page_number, page in enumerate(pdf):
+            if not page.get_fonts():
+                continue
+            text = page.get_text("text")
+            if not text.strip():
+                continue
+            metadata = dict(base_metadata)
+            metadata["page"] = page_number
+            metadata["page_label"] = page.get_label() or str(page_number + 1)
+            yield Document(page_content=text, metadata=metadata)
+
+def iter_pdf_file_pages(file_path, loader=None):
+    """Yield the pages of one PDF with the configured loader backend."""
+    loader = loader or PDF_LOADER
+    if loader == "pymupdf":
+        yield from iter_pymupdf_pages(file_path)
+    elif loader == "pypdf":
+        yield from PyPDFLoader(file_path).lazy_load()
+    else:
+        raise ValueError(f"Unknown PDF_LOADER: {loader}")
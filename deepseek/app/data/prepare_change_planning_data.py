@@ -7,9 +7,42 @@ if sys.platform == 'darwin':  # macOS
     if not isinstance(asyncio.get_event_loop_policy(), asyncio.DefaultEventLoopPolicy):
         asyncio.set_event_loop_policy(asyncio.DefaultEventLoopPolicy())
 
-from langchain_community.document_loaders import PyPDFLoader
+from app.data.pdf_loaders import iter_pdf_file_pages
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 import json
+from app.data.dedup import DEDUP_CHUNKS, dedup_documents, save_dedup_report
+
+def get_planning_metadata(filename):
+    """Derive plan_stage and change_type metadata from a PDF filename."""
+    # Initialize with default metadata
+    metadata = {"plan_stage": "general", "change_type": "general"}
+    
+    # Categorize based on filename patterns
+    lower_filename = filename.lower()
+    
+    # Plan stage categorization
+    if "assessment" in lower_filename or "analysis" in lower_filename:
+        metadata["plan_stage"] = "assessment"
+    elif "implement" in lower_filename or "execution" in lower_filename:
+        metadata["plan_stage"] = "implementation"
+    elif "risk" in lower_filename:
+        metadata["plan_stage"] = "risk_analysis"
+    elif "benefit" in lower_filename or "roi" in lower_filename:
+        metadata["plan_stage"] = "benefit_analysis"
+    elif "communication" in lower_filename or "stakeholder" in lower_filename:
+        metadata["plan_stage"] = "communication"
+    
+    # Change type categorization
+    if "process" in lower_filename or "workflow" in lower_filename:
+        metadata["change_type"] = "process"
+    elif "tech" in lower_filename or "digital" in lower_filename or "system" in lower_filename:
+        metadata["change_type"] = "technological"
+    elif "structure" in lower_filename or "org" in lower_filename or "reorgan" in lower_filename:
+        metadata["change_type"] = "structural"
+    elif "cultural" in lower_filename or "behavior" in lower_filename:
+        metadata["change_type"] = "cultural"
+    
+    return metadata
 
 def load_change_planning_documents(directory="./resources/change_planning"):
     """Load PDF documents for change planning from the specified directory."""
@@ -22,39 +55,12 @@ def load_change_planning_documents(directory="./resources/change_planning"):
     for filename in os.listdir(directory):
         if filename.endswith(".pdf"):
             file_path = os.path.join(directory, filename)
-            loader = PyPDFLoader(file_path)
-            loaded_docs = loader.load()
+            loaded_docs = list(iter_pdf_file_pages(file_path))
             
             # Add metadata based on filename patterns
+            file_metadata = get_planning_metadata(filename)
             for doc in loaded_docs:
-                # Initialize with default metadata
-                doc.metadata["plan_stage"] = "general"
-                doc.metadata["change_type"] = "general"
-                
-                # Categorize based on filename patterns
-                lower_filename = filename.lower()
-                
-                # Plan stage categorization
-                if "assessment" in lower_filename or "analysis" in lower_filename:
-                    doc.metadata["plan_stage"] = "assessment"
-                elif "implement" in lower_filename or "execution" in lower_filename:
-                    doc.metadata["plan_stage"] = "implementation"
-                elif "risk" in lower_filename:
-                    doc.metadata["plan_stage"] = "risk_analysis"
-                elif "benefit" in lower_filename or "roi" in lower_filename:
-                    doc.metadata["plan_stage"] = "benefit_analysis"
-                elif "communication" in lower_filename or "stakeholder" in lower_filename:
-                    doc.metadata["plan_stage"] = "communication"
-                
-                # Change type categorization
-                if "process" in lower_filename or "workflow" in lower_filename:
-                    doc.metadata["change_type"] = "process"
-                elif "tech" in lower_filename or "digital" in lower_filename or "system" in lower_filename:
-                    doc.metadata["change_type"] = "technological"
-                elif "structure" in lower_filename or "org" in lower_filename or "reorgan" in lower_filename:
-                    doc.metadata["change_type"] = "structural"
-                elif "cultural" in lower_filename or "behavior" in lower_filename:
-                    doc.metadata["change_type"] = "cultural"
+                doc.metadata.update(file_metadata)
                 
             documents.extend(loaded_docs)
     
@@ -547,9 +553,15 @@ def prepare_change_planning_data():
     chunked_docs = split_documents(loaded_docs)
     print(f"Created {len(chunked_docs)} document chunks")
     
-    # Save processed documents to JSON
+    # Drop repeated headers, boilerplate and copies across versions
+    dedup_report = None
+    if DEDUP_CHUNKS:
+        chunked_docs, dedup_report = dedup_documents(chunked_docs)
+    
+    # Save processed documents to JSON, with the dedup report for the embedding step
     print("Saving processed documents...")
     save_to_json(chunked_docs)
+    save_dedup_report(dedup_report, "app/data/change_planning_documents.json")
     
     return True
 
@@ -7,9 +7,34 @@ if sys.platform == 'darwin':  # macOS
     if not isinstance(asyncio.get_event_loop_policy(), asyncio.DefaultEventLoopPolicy):
         asyncio.set_event_loop_policy(asyncio.DefaultEventLoopPolicy())
 
-from langchain_community.document_loaders import PyPDFLoader
+from app.data.pdf_loaders import iter_pdf_file_pages
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 import json
+from app.data.dedup import DEDUP_CHUNKS, dedup_documents, save_dedup_report
+
+def get_resource_metadata(filename):
+    """Derive resource_type and audience metadata from a PDF filename."""
+    # Initialize with default metadata
+    metadata = {"resource_type": "general", "audience": "all_employees"}
+    
+    # Categorize based on filename patterns
+    lower_filename = filename.lower()
+    if "training" in lower_filename or "tutorial" in lower_filename:
+        metadata["resource_type"] = "training"
+    elif "guide" in lower_filename or "manual" in lower_filename:
+        metadata["resource_type"] = "guide"
+    elif "faq" in lower_filename or "question" in lower_filename:
+        metadata["resource_type"] = "faq"
+    
+    # Identify target audience
+    if "manager" in lower_filename or "leader" in lower_filename:
+        metadata["audience"] = "managers"
+    elif "employee" in lower_filename:
+        metadata["audience"] = "employees"
+    elif "technical" in lower_filename or "it" in lower_filename:
+        metadata["audience"] = "technical_staff"
+    
+    return metadata
 
 def load_documents(directory="./resources"):
     """Load PDF documents from the specified directory."""
@@ -22,31 +47,12 @@ def load_documents(directory="./resources"):
     for filename in os.listdir(directory):
         if filename.endswith(".pdf"):
             file_path = os.path.join(directory, filename)
-            loader = PyPDFLoader(file_path)
-            loaded_docs = loader.load()
+            loaded_docs = list(iter_pdf_file_pages(file_path))
             
             # Add metadata based on filename patterns
+            file_metadata = get_resource_metadata(filename)
             for doc in loaded_docs:
-                # Initialize with default metadata
-                doc.metadata["resource_type"] = "general"
-                doc.metadata["audience"] = "all_employees"
-                
-                # Categorize based on filename patterns
-                lower_filename = filename.lower()
-                if "training" in lower_filename or "tutorial" in lower_filename:
-                    doc.metadata["resource_type"] = "training"
-                elif "guide" in lower_filename or "manual" in lower_filename:
-                    doc.metadata["resource_type"] = "guide"
-                elif "faq" in lower_filename or "question" in lower_filename:
-                    doc.metadata["resource_type"] = "faq"
-                
-                # Identify target audience
-                if "manager" in lower_filename or "leader" in lower_filename:
-                    doc.metadata["audience"] = "managers"
-                elif "employee" in lower_filename:
-                    doc.metadata["audience"] = "employees"
-                elif "technical" in lower_filename or "it" in lower_filename:
-                    doc.metadata["audience"] = "technical_staff"
+                doc.metadata.update(file_metadata)
             
             documents.extend(loaded_docs)
     
@@ -331,7 +337,13 @@ if __name__ == "__main__":
         splits = split_documents(all_documents)
         print(f"Created {len(splits)} document chunks")
         
-        # Save processed documents
+        # Drop repeated headers, boilerplate and copies across versions
+        dedup_report = None
+        if DEDUP_CHUNKS:
+            splits, dedup_report = dedup_documents(splits)
+        
+        # Save processed documents, with the dedup report for the embedding step
         save_to_json(splits, "app/data/processed_documents.json")
+        save_dedup_report(dedup_report, "app/data/processed_documents.json")
     else:
         print("No documents processed. Please add PDF resources to the 'resources' directory.") 
\ No newline at end of file
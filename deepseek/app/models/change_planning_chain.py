@@ -1,4 +1,3 @@
-import os
 import sys
 import asyncio
 
@@ -8,101 +7,93 @@ if sys.platform == 'darwin':  # macOS
         asyncio.set_event_loop_policy(asyncio.DefaultEventLoopPolicy())
 
 from dotenv import load_dotenv
-from langchain.schema.runnable import RunnablePassthrough
-from langchain_deepseek.chat_models import ChatDeepSeek
-from langchain.prompts import PromptTemplate
+from langchain.schema.runnable import RunnableLambda, RunnablePassthrough
+from langchain.prompts import ChatPromptTemplate
 from langchain.schema.output_parser import StrOutputParser
-from app.models.vector_store import load_vector_store
+from app.models.retrieval import create_retriever
+from app.models.llm import create_llm
+from app.models.conversation import condense_question
 
 load_dotenv()
 
-# Load DeepSeek API key from environment
-DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
-if not DEEPSEEK_API_KEY:
-    raise ValueError("DeepSeek API key not found. Please set it in the .env file.")
+# Static instructions, sent first and byte-identical on every request so
+# DeepSeek's prompt prefix cache can reuse them
+CHANGE_PLANNING_SYSTEM_PROMPT = """You are an expert change management consultant for managers in a pharmaceutical manufacturing company.
+You help managers create and evaluate change management plans, focusing on calculating benefits and risks of 
+implementing specific changes. Your expertise includes cost-benefit analysis, risk assessment, and creating 
+clear change descriptions.
 
-def get_change_planning_retriever(vector_store_path="app/data/change_planning_store"):
-    """Get a retriever from the change planning vector store."""
+When assisting managers with change planning:
+1. Help quantify potential benefits (time savings, cost reduction, efficiency gains, quality improvements)
+2. Analyze possible risks and challenges with implementation
+3. Suggest mitigation strategies for identified risks
+4. Provide frameworks for creating clear change descriptions
+5. Recommend communication strategies for the planned change
+6. Offer templates or examples of well-structured change plans when appropriate
+7. Maintain a practical, business-focused tone while being encouraging"""
+
+# Per-request part: earlier conversation, retrieved context, then the question
+CHANGE_PLANNING_HUMAN_TEMPLATE = """{history}Use the following information to answer the manager's question:
+
+{context}
+
+Manager's Question: {question}"""
+
+def get_change_planning_retriever(filter_dict=None):
+    """Get an adaptive retriever over the change planning vector store."""
     try:
-        vector_store = load_vector_store(vector_store_path)
-        if vector_store is None:
-            raise ValueError("Change planning vector store not found. Please create one first.")
-        
-        # Create a retriever with filter capabilities
-        return vector_store.as_retriever(
-            search_kwargs={
-                "k": 8,  # Return 8 most relevant documents
-                "score_threshold": 0.5,  # Only return relevant enough results
-                "filter": None  # Will be set dynamically if needed
-            }
-        )
+        # Returns between min_k and max_k chunks above the corpus's similarity
+        # cutoff, stopping at a sharp drop in scores (see retrieval.CORPORA)
+        return create_retriever("change_planning", filter_dict)
     except Exception as e:
         print(f"Error loading change planning vector store: {e}")
         raise ValueError(f"Failed to load change planning vector store: {e}")
 
+def create_change_planning_prompt(history=None):
+    """Build the chat prompt: the static system message, then the variable parts."""
+    return ChatPromptTemplate.from_messages([
+        ("system", CHANGE_PLANNING_SYSTEM_PROMPT),
+        ("human", CHANGE_PLANNING_HUMAN_TEMPLATE)
+    ]).partial(history=f"Conversation so far:\n{history}\n\n" if history else "")
+
 def format_docs(docs):
     """Format retrieved documents into a single string."""
     return "\n\n".join([doc.page_content for doc in docs])
 
-def create_change_planning_chain(streaming=False, plan_stage=None, change_type=None):
+def create_change_planning_chain(streaming=False, plan_stage=None, change_type=None, history=None):
     """Create a RAG chain for change planning with DeepSeek model.
     
     Args:
         streaming (bool): Whether to enable streaming for responses
         plan_stage (str, optional): Stage of planning to filter for (e.g., "assessment", "implementation", "risk_analysis")
         change_type (str, optional): Type of change to filter for (e.g., "process", "technological", "structural")
+        history (str, optional): Summarized earlier conversation to include in the prompt
     """
     try:
         # Configure LLM with streaming parameter
-        llm = ChatDeepSeek(
-            api_key=DEEPSEEK_API_KEY, 
-            model_name="deepseek-chat",
-            streaming=streaming
-        )
+        llm = create_llm(streaming=streaming)
         
-        # Get change planning retriever
-        retriever = get_change_planning_retriever()
+        # Build a metadata filter if specified
+        filter_dict = {}
+        if plan_stage:
+            filter_dict["plan_stage"] = plan_stage
+        if change_type:
+            filter_dict["change_type"] = change_type
         
-        # Apply metadata filters if specified
-        if plan_stage or change_type:
-            # Create a metadata filter
-            filter_dict = {}
-            if plan_stage:
-                filter_dict["plan_stage"] = plan_stage
-            if change_type:
-                filter_dict["change_type"] = change_type
-            
-            # Set the filter on the retriever
-            retriever.search_kwargs["filter"] = filter_dict
+        # Get change planning retriever
+        retriever = get_change_planning_retriever(filter_dict or None)
         
-        # Define the prompt template for change planning
-        template = """You are an expert change management consultant for managers in a pharmaceutical manufacturing company.
-You help managers create and evaluate change management plans, focusing on calculating benefits and risks of 
-implementing specific changes. Your expertise includes cost-benefit analysis, risk assessment, and creating 
-clear change descriptions.
-
-Use the following information to answer the manager's question:
-
-{context}
-
-When assisting managers with change planning:
-1. Help quantify potential benefits (time savings, cost reduction, efficiency gains, quality improvements)
-2. Analyze possible risks and challenges with implementation
-3. Suggest mitigation strategies for identified risks
-4. Provide frameworks for creating clear change descriptions
-5. Recommend communication strategies for the planned change
-6. Offer templates or examples of well-structured change plans when appropriate
-7. Maintain a practical, business-focused tone while being encouraging
-
-Manager's Question: {question}
-
-Your Response:"""
+        prompt = create_change_planning_prompt(history)
         
-        prompt = PromptTemplate.from_template(template)
+        # Follow-ups are retrieved with a standalone version of the question
+        if history:
+            retrieval_query = RunnableLambda(lambda question: condense_question(history, question, "planning"))
+        else:
+            retrieval_query = RunnablePassthrough()
         
         # Create the RAG chain
         rag_chain = (
-            {"context": retriever | format_docs, "question": RunnablePassthrough()}
+            {"context": retrieval_query | retriever | format_docs, "question": RunnablePassthrough()}
             | prompt
             | llm
             | StrOutputParser()
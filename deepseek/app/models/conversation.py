@@ -0,0 +1,164 @@
+import os
+
+from dotenv import load_dotenv
+
+from app.utils.sessions import get_session_store, new_session_state
+
+load_dotenv()
+
+# Most recent turns kept verbatim in the prompt
+SESSION_RECENT_TURNS = int(os.getenv("SESSION_RECENT_TURNS", "3"))
+# Token budget for the verbatim recent turns
+SESSION_HISTORY_TOKENS = int(os.getenv("SESSION_HISTORY_TOKENS", "1000"))
+# Token budget for the rolling summary of older turns
+SESSION_SUMMARY_TOKENS = int(os.getenv("SESSION_SUMMARY_TOKENS", "300"))
+
+CONDENSE_TEMPLATE = """Given the conversation below and a follow-up question, rewrite the follow-up as a single standalone question that can be understood without the conversation. Return only the question.
+
+{history}
+Follow-up question: {question}
+
+Standalone question:"""
+
+SUMMARY_TEMPLATE = """Update the running summary of a conversation between a user and a change management assistant with the new exchanges below. Keep the facts, decisions, roles and open questions that later answers may depend on. Use at most {max_words} words. Return only the summary.
+
+Current summary:
+{summary}
+
+New exchanges:
+{turns}
+
+Updated summary:"""
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token for English text)."""
+    return (len(text) + 3) // 4
+
+def clip_to_tokens(text, max_tokens):
+    """Cut text to roughly max_tokens, keeping the beginning."""
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rsplit(" ", 1)[0] + " ..."
+
+def session_key(kind, session_id):
+    """Chat and planning conversations with the same session ID are kept apart."""
+    return f"{kind}:{session_id}"
+
+def load_session(kind, session_id):
+    """Return the stored state for a session, or an empty one."""
+    return get_session_store().get(session_key(kind, session_id)) or new_session_state()
+
+def format_turns(turns):
+    return "\n".join(f"User: {turn['question']}\nAssistant: {turn['answer']}" for turn in turns)
+
+def format_history(state):
+    """Render a session as prompt text: the summary, then the recent turns."""
+    parts = []
+    if state["summary"]:
+        parts.append(f"Summary of earlier conversation:\n{state['summary']}")
+    if state["turns"]:
+        parts.append(f"Recent conversation:\n{format_turns(state['turns'])}")
+    return "\n\n".join(parts)
+
+def invoke_llm(prompt, kind):
+    """One non-streaming DeepSeek call, under the same breaker and scheduler as answers."""
+    from app.models.llm import create_llm
+    from app.utils.circuit_breaker import llm_breaker, CircuitOpen
+    from app.utils.scheduler import generation_scheduler
+
+    if llm_breaker.is_open():
+        raise CircuitOpen("The assistant's language model is temporarily unavailable")
+    llm = create_llm(streaming=False)
+    with generation_scheduler.slot(kind):
+        return llm_breaker.call(lambda: llm.invoke(prompt)).content.strip()
+
+def condense_question(history, question, kind="chat"):
+    """Rewrite a follow-up into a standalone question for retrieval.
+
+    Falls back to the original question if the model call fails.
+    """
+    try:
+        standalone = invoke_llm(CONDENSE_TEMPLATE.format(history=history, question=question), kind)
+        return standalone or question
+    except Exception as e:
+        print(f"Error condensing question, retrieving with the original: {e}")
+        return question
+
+def summarize_turns(summary, turns, kind="chat"):
+    """Fold old turns into the rolling summary, staying within its token budget."""
+    try:
+        prompt = SUMMARY_TEMPLATE.format(
+            max_words=int(SESSION_SUMMARY_TOKENS * 0.75),
+            summary=summary or "(none)",
+            turns=format_turns(turns)
+        )
+        summary = invoke_llm(prompt, kind)
+    except Exception as e:
+        # Without the model, keep at least what the user asked about
+        print(f"Error summarizing conversation, keeping earlier questions only: {e}")
+        asked = "; ".join(turn["question"] for turn in turns)
+        summary = f"{summary} Earlier the user asked: {asked}".strip()
+    return clip_to_tokens(summary, SESSION_SUMMARY_TOKENS)
+
+def split_turns(turns):
+    """Split turns into (older, keep) for compaction.
+
+    Keeps at most SESSION_RECENT_TURNS turns within SESSION_HISTORY_TOKENS;
+    the newest turn is always kept, clipped if it alone is over budget.
+    """
+    keep = []
+    used = 0
+    for turn in reversed(turns):
+        tokens = estimate_tokens(turn["question"]) + estimate_tokens(turn["answer"])
+        if keep and (len(keep) >= SESSION_RECENT_TURNS or used + tokens > SESSION_HISTORY_TOKENS):
+            break
+        keep.insert(0, turn)
+        used += tokens
+
+    if used > SESSION_HISTORY_TOKENS:
+        newest = dict(keep[-1])
+        newest["question"] = clip_to_tokens(newest["question"], SESSION_HISTORY_TOKENS // 4)
+        newest["answer"] = clip_to_tokens(newest["answer"], SESSION_HISTORY_TOKENS - estimate_tokens(newest["question"]))
+        keep[-1] = newest
+
+    return turns[:len(turns) - len(keep)], keep
+
+def needs_compaction(state):
+    turns = state["turns"]
+    return len(turns) > SESSION_RECENT_TURNS or estimate_tokens(format_turns(turns)) > SESSION_HISTORY_TOKENS
+
+def record_turn(kind, session_id, question, answer):
+    """Append a finished exchange to the session, compacting older turns if needed.
+
+    Each change is applied to the stored state atomically, so concurrent
+    answers in one session cannot overwrite each other's turns. The summary
+    call runs between updates; if another request compacted the session in
+    the meantime, this summary is dropped and a later turn compacts again.
+    """
+    store = get_session_store()
+    key = session_key(kind, session_id)
+    turn = {"question": question, "answer": answer}
+
+    def append(state):
+        state["turns"].append(turn)
+        return state
+
+    # Save the new turn before the (slower) summary call so the next request sees it
+    state = store.update(key, append)
+    if not needs_compaction(state):
+        return
+
+    older, keep = split_turns(state["turns"])
+    summary = summarize_turns(state["summary"], older, kind) if older else state["summary"]
+    seen = state["turns"]
+
+    def fold(current):
+        if current["summary"] != state["summary"] or current["turns"][:len(seen)] != seen:
+            return current
+        # Turns added while summarizing stay after the kept ones
+        current["summary"] = summary
+        current["turns"] = keep + current["turns"][len(seen):]
+        return current
+
+    store.update(key, fold)
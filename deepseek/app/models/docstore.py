@@ -0,0 +1,192 @@
+import os
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from urllib.parse import quote
+
+from dotenv import load_dotenv
+from langchain_community.docstore.base import Docstore
+from langchain.schema.document import Document
+
+load_dotenv()
+
+# File in each index version holding every chunk's text and metadata
+DOCSTORE_FILE = "docstore.sqlite3"
+# Recently read chunks kept in memory per loaded store
+DOCSTORE_CACHE_SIZE = int(os.getenv("DOCSTORE_CACHE_SIZE", "512"))
+
+class DocstoreWriter:
+    """Append chunks to a new SQLite docstore in index order.
+
+    Each batch is committed as it is added, so a build streaming into the
+    docstore keeps no chunk text in memory.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("""
+            CREATE TABLE chunks (
+                position INTEGER PRIMARY KEY,
+                id TEXT NOT NULL UNIQUE,
+                page_content TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            )
+        """)
+
+    def add(self, ids, documents):
+        """Store documents at the next index positions, under their docstore IDs."""
+        rows = [
+            (self.count + offset, chunk_id, doc.page_content, json.dumps(doc.metadata))
+            for offset, (chunk_id, doc) in enumerate(zip(ids, documents))
+        ]
+        with self._conn:
+            self._conn.executemany(
+                "INSERT INTO chunks (position, id, page_content, metadata) VALUES (?, ?, ?, ?)", rows
+            )
+        self.count += len(rows)
+
+    def update_metadata(self, chunk_id, updates):
+        """Merge keys into a stored chunk's metadata."""
+        row = self._conn.execute("SELECT metadata FROM chunks WHERE id = ?", (chunk_id,)).fetchone()
+        if row is None:
+            raise KeyError(chunk_id)
+        with self._conn:
+            self._conn.execute(
+                "UPDATE chunks SET metadata = ? WHERE id = ?", (json.dumps({**json.loads(row[0]), **updates}), chunk_id)
+            )
+
+    def close(self):
+        self._conn.close()
+
+def write_docstore(path, vector_store, batch_size=1000):
+    """Write a built store's chunks to a new SQLite docstore, keyed by index position.
+
+    Works from any docstore the LangChain FAISS wrapper supports, so
+    stores built in memory (or loaded from an older pickled version) can be
+    saved in this format.
+    """
+    writer = DocstoreWriter(path)
+    try:
+        for start in range(0, vector_store.index.ntotal, batch_size):
+            positions = range(start, min(start + batch_size, vector_store.index.ntotal))
+            writer.add(
+                [vector_store.index_to_docstore_id[position] for position in positions],
+                documents_at(vector_store, positions)
+            )
+    finally:
+        writer.close()
+
+class SQLiteDocstore(Docstore):
+    """Read-only docstore over one index version's SQLite file.
+
+    Nothing is read when the store is opened: chunks are fetched by index
+    position (one query for all the hits of a search) or by docstore ID
+    (what the LangChain FAISS wrapper does), and the most recent
+    `cache_size` are kept in an LRU. Index versions never change once
+    published, so cached chunks never go stale.
+    """
+
+    def __init__(self, path, cache_size=DOCSTORE_CACHE_SIZE):
+        self.path = path
+        self.cache_size = cache_size
+        self._uri = f"file:{quote(os.path.abspath(path))}?mode=ro"
+        self._local = threading.local()
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # The largest rowid comes from the primary key's B-tree, without a scan
+        last = self._connection().execute("SELECT MAX(position) FROM chunks").fetchone()[0]
+        self.size = 0 if last is None else last + 1
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._uri, uri=True)
+            self._local.conn = conn
+        return conn
+
+    def by_positions(self, positions):
+        """Documents at the given index positions, reading the uncached ones in one query."""
+        positions = [int(position) for position in positions]
+        found = {}
+        with self._cache_lock:
+            for position in positions:
+                doc = self._cache.get(position)
+                if doc is not None:
+                    self._cache.move_to_end(position)
+                    found[position] = doc
+
+        missing = [position for position in dict.fromkeys(positions) if position not in found]
+        if missing:
+            placeholders = ",".join("?" * len(missing))
+            rows = self._connection().execute(
+                f"SELECT position, page_content, metadata FROM chunks WHERE position IN ({placeholders})", missing
+            ).fetchall()
+            loaded = {
+                position: Document(page_content=page_content, metadata=json.loads(metadata))
+                for position, page_content, metadata in rows
+            }
+            if len(loaded) != len(missing):
+                raise KeyError(f"No chunks at index positions {sorted(set(missing) - set(loaded))}")
+            found.update(loaded)
+            if self.cache_size > 0:
+                with self._cache_lock:
+                    self._cache.update(loaded)
+                    while len(self._cache) > self.cache_size:
+                        self._cache.popitem(last=False)
+
+        return [found[position] for position in positions]
+
+    def search(self, search: str):
+        """Document for a docstore ID, or a not-found message like LangChain's docstores."""
+        row = self._connection().execute("SELECT position FROM chunks WHERE id = ?", (search,)).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return self.by_positions([row[0]])[0]
+
+    def id_at(self, position):
+        row = self._connection().execute("SELECT id FROM chunks WHERE position = ?", (int(position),)).fetchone()
+        if row is None:
+            raise KeyError(position)
+        return row[0]
+
+    def all_metadata(self):
+        """Metadata of every chunk in index order (for building filter bitmaps)."""
+        return [
+            json.loads(metadata)
+            for (metadata,) in self._connection().execute("SELECT metadata FROM chunks ORDER BY position")
+        ]
+
+    def index_map(self):
+        return SQLiteIndexMap(self)
+
+class SQLiteIndexMap(Mapping):
+    """Index position to docstore ID map that reads IDs from the docstore on demand."""
+
+    def __init__(self, docstore):
+        self.docstore = docstore
+
+    def __getitem__(self, position):
+        return self.docstore.id_at(position)
+
+    def __len__(self):
+        return self.docstore.size
+
+    def __iter__(self):
+        return iter(range(self.docstore.size))
+
+def documents_at(vector_store, positions):
+    """Documents at the given index positions of a loaded store, whichever docstore it has."""
+    if isinstance(vector_store.docstore, SQLiteDocstore):
+        return vector_store.docstore.by_positions(positions)
+    return [vector_store.docstore.search(vector_store.index_to_docstore_id[int(position)]) for position in positions]
+
+def metadata_in_index_order(vector_store):
+    """Metadata of every chunk of a loaded store, in index order."""
+    if isinstance(vector_store.docstore, SQLiteDocstore):
+        return vector_store.docstore.all_metadata()
+    return [doc.metadata for doc in documents_at(vector_store, range(vector_store.index.ntotal))]
@@ -0,0 +1,218 @@
+import os
+import sys
+import asyncio
+import json
+
+# Configure asyncio event loop before importing torch-related modules
+if sys.platform == 'darwin':  # macOS
+    if not isinstance(asyncio.get_event_loop_policy(), asyncio.DefaultEventLoopPolicy):
+        asyncio.set_event_loop_policy(asyncio.DefaultEventLoopPolicy())
+
+import numpy as np
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+
+load_dotenv()
+
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+# "torch" runs the model through sentence-transformers; "onnx" runs an
+# exported (optionally int8-quantized) copy through ONNX Runtime, without
+# importing torch at all
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "app/data/onnx/all-MiniLM-L6-v2")
+ONNX_QUANTIZED = os.getenv("ONNX_QUANTIZED", "true").lower() in ("1", "true", "yes")
+
+# all-MiniLM-L6-v2 truncates input at 256 word pieces
+MAX_SEQUENCE_LENGTH = 256
+ONNX_BATCH_SIZE = int(os.getenv("ONNX_BATCH_SIZE", "32"))
+
+# Minimum cosine similarity allowed between torch and ONNX vectors is 1 - tolerance
+EMBEDDING_PARITY_TOLERANCE = float(os.getenv("EMBEDDING_PARITY_TOLERANCE", "0.01"))
+
+FP32_MODEL_FILE = "model.onnx"
+INT8_MODEL_FILE = "model-int8.onnx"
+
+class OnnxMiniLMEmbeddings(Embeddings):
+    """MiniLM sentence embeddings computed with ONNX Runtime.
+
+    Reproduces the sentence-transformers pipeline (mean pooling over the
+    attention mask, then L2 normalization), so its vectors can be searched
+    against indexes built with the torch model.
+    """
+
+    def __init__(self, model_dir=ONNX_MODEL_DIR, quantized=ONNX_QUANTIZED, batch_size=ONNX_BATCH_SIZE):
+        try:
+            import onnxruntime as ort
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ImportError(
+                "The ONNX embedding backend needs onnxruntime and tokenizers. "
+                "Install them with: pip install onnxruntime tokenizers"
+            ) from e
+
+        model_file = os.path.join(model_dir, INT8_MODEL_FILE if quantized else FP32_MODEL_FILE)
+        tokenizer_file = os.path.join(model_dir, "tokenizer.json")
+        if not os.path.exists(model_file) or not os.path.exists(tokenizer_file):
+            raise ValueError(
+                f"ONNX embedding model not found in {model_dir}. "
+                "Export it first with: python -m app.models.embeddings export"
+            )
+
+        self.batch_size = batch_size
+        self.tokenizer = Tokenizer.from_file(tokenizer_file)
+        self.tokenizer.enable_truncation(max_length=MAX_SEQUENCE_LENGTH)
+        self.tokenizer.enable_padding()
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_file, options, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    def _encode(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+
+        token_embeddings = self.session.run(None, feeds)[0]
+
+        # Mean pooling over real tokens, then L2 normalization
+        mask = attention_mask[:, :, None].astype(np.float32)
+        summed = (token_embeddings * mask).sum(axis=1)
+        counts = np.clip(mask.sum(axis=1), 1e-9, None)
+        pooled = summed / counts
+        norms = np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled / norms
+
+    def embed_array(self, texts):
+        """Embed texts into a float32 (n, 384) array."""
+        texts = [text.replace("\n", " ") for text in texts]
+        batches = [
+            self._encode(texts[i:i + self.batch_size])
+            for i in range(0, len(texts), self.batch_size)
+        ]
+        if not batches:
+            return np.zeros((0, 384), dtype=np.float32)
+        return np.vstack(batches).astype(np.float32)
+
+    def embed_documents(self, texts):
+        return self.embed_array(texts).tolist()
+
+    def embed_query(self, text):
+        return self.embed_array([text])[0].tolist()
+
+def create_torch_embeddings():
+    """Create the sentence-transformers embedder used to build the indexes."""
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    return HuggingFaceEmbeddings(
+        model_name="all-MiniLM-L6-v2",  # This is a small, efficient embedding model
+        model_kwargs={'device': 'cpu'},
+        encode_kwargs={'normalize_embeddings': True}
+    )
+
+def create_embeddings(backend=None):
+    """Create the embedder for the configured backend."""
+    backend = backend or EMBEDDING_BACKEND
+    if backend == "torch":
+        return create_torch_embeddings()
+    if backend == "onnx":
+        return OnnxMiniLMEmbeddings()
+    raise ValueError(f"Unknown EMBEDDING_BACKEND: {backend}")
+
+def export_onnx_model(output_dir=ONNX_MODEL_DIR, quantize=True):
+    """Export MiniLM to ONNX (and an int8 copy) next to its tokenizer.
+
+    Needs torch and transformers, so run it on a build machine; serving the
+    exported model only needs onnxruntime and tokenizers.
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(EMBEDDING_MODEL_NAME)
+    model = AutoModel.from_pretrained(EMBEDDING_MODEL_NAME)
+    model.eval()
+
+    sample = tokenizer(["An example sentence to trace the model."], return_tensors="pt")
+    input_names = ["input_ids", "attention_mask", "token_type_ids"]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names + ["last_hidden_state"]}
+
+    fp32_path = os.path.join(output_dir, FP32_MODEL_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14
+        )
+    tokenizer.save_pretrained(output_dir)
+    print(f"Exported ONNX model to {fp32_path}")
+
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+
+        int8_path = os.path.join(output_dir, INT8_MODEL_FILE)
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+        print(f"Quantized int8 model saved to {int8_path}")
+
+def load_parity_texts(file_path="app/data/processed_documents.json", limit=200):
+    """Sample chunk texts and short queries to compare backends on."""
+    texts = [
+        "How do I support my team through a new process change?",
+        "What are the risks of implementing a new quality system?",
+        "ADKAR reinforcement"
+    ]
+    if os.path.exists(file_path):
+        with open(file_path, 'r') as f:
+            data = json.load(f)
+        texts.extend(item["page_content"] for item in data[:limit])
+    return texts
+
+def check_parity(onnx_embeddings=None, texts=None, tolerance=EMBEDDING_PARITY_TOLERANCE):
+    """Compare ONNX vectors with the torch vectors the indexes were built with.
+
+    Raises ValueError if any text drifts below 1 - tolerance cosine similarity.
+    """
+    onnx_embeddings = onnx_embeddings or OnnxMiniLMEmbeddings()
+    texts = texts or load_parity_texts()
+
+    reference = np.asarray(create_torch_embeddings().embed_documents(texts), dtype=np.float32)
+    candidate = onnx_embeddings.embed_array(texts)
+    # Both sides are L2-normalized, so the row-wise dot product is the cosine
+    cosines = (reference * candidate).sum(axis=1)
+
+    report = {
+        "texts": len(texts),
+        "min_cosine": float(cosines.min()),
+        "mean_cosine": float(cosines.mean()),
+        "tolerance": tolerance
+    }
+    if report["min_cosine"] < 1.0 - tolerance:
+        raise ValueError(f"ONNX embeddings drift too far from torch: {report}")
+    return report
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export and validate the ONNX MiniLM embedder")
+    parser.add_argument("command", choices=["export", "parity"])
+    parser.add_argument("--output-dir", default=ONNX_MODEL_DIR)
+    parser.add_argument("--no-quantize", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=EMBEDDING_PARITY_TOLERANCE)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_onnx_model(args.output_dir, quantize=not args.no_quantize)
+    for quantized in ([False] if args.no_quantize else [False, True]):
+        report = check_parity(
+            OnnxMiniLMEmbeddings(args.output_dir, quantized=quantized),
+            tolerance=args.tolerance
+        )
+        print(f"{'int8' if quantized else 'fp32'} parity: {report}")
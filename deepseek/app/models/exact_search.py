@@ -0,0 +1,157 @@
+import os
+import threading
+
+import faiss
+import numpy as np
+
+from app.models.docstore import documents_at, metadata_in_index_order
+
+# Corpora with at most this many chunks are searched with the in-memory
+# exact engine instead of FAISS (0 disables it)
+EXACT_SEARCH_MAX_CHUNKS = int(os.getenv("EXACT_SEARCH_MAX_CHUNKS", "5000"))
+# "float32", or "float16" to halve the matrix size (NumPy multiplies
+# float16 without BLAS, so it is slower per query)
+EXACT_SEARCH_DTYPE = os.getenv("EXACT_SEARCH_DTYPE", "float32")
+
+class ExactSearchEngine:
+    """Brute-force cosine search over a small corpus held in NumPy arrays.
+
+    Keeps one contiguous matrix of unit vectors in index order, the chunk
+    metadata in a parallel list, and a boolean mask per metadata value
+    of the filterable keys. A filtered search is one matrix product, the
+    AND of a few precomputed masks, and an argpartition for the top k.
+    Positions match the FAISS index the engine was built from; the
+    documents for the top k are read with fetch_documents(positions).
+
+    For an index built with a PCA projection, the matrix holds the
+    projected vectors, queries are projected with the same transform, and
+    scores come from L2 distance the way FAISS computes them.
+    """
+
+    def __init__(self, vectors, metadatas, fetch_documents, filter_keys=(), dtype=EXACT_SEARCH_DTYPE, transform=None):
+        matrix = np.asarray(vectors, dtype=np.float32)
+        self.transform = transform
+        if transform is None:
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix = matrix / np.where(norms == 0, 1.0, norms)
+            self.half_sq_norms = None
+        else:
+            # Projected vectors are not unit length; keep their norms for L2 scores
+            self.half_sq_norms = 0.5 * np.einsum("ij,ij->i", matrix, matrix)
+        self.matrix = np.ascontiguousarray(matrix, dtype=np.dtype(dtype))
+        self.metadatas = list(metadatas)
+        self.fetch_documents = fetch_documents
+        self.size = len(self.metadatas)
+
+        self.bitmaps = {}
+        for key in filter_keys:
+            values = np.array([metadata.get(key) for metadata in self.metadatas], dtype=object)
+            self.bitmaps[key] = {value: values == value for value in set(values.tolist()) if value is not None}
+
+    @classmethod
+    def from_vector_store(cls, vector_store, filter_keys=(), dtype=EXACT_SEARCH_DTYPE):
+        """Build an engine from a LangChain FAISS store, reading vectors from its index.
+
+        Only the chunk metadata is read up front; documents are fetched from
+        the store's docstore as searches return them.
+        """
+        index = vector_store.index
+        size = index.ntotal
+        transform = None
+        if isinstance(index, faiss.IndexPreTransform):
+            # Keep the projected vectors, not their reconstruction in full dimensions
+            transform = faiss.downcast_VectorTransform(index.chain.at(0))
+            index = faiss.downcast_index(index.index)
+        vectors = index.reconstruct_n(0, size)
+        return cls(
+            vectors, metadata_in_index_order(vector_store),
+            lambda positions: documents_at(vector_store, positions),
+            filter_keys, dtype, transform
+        )
+
+    def mask(self, filter_dict):
+        """Boolean mask of the chunks matching a filter; list values mean "any of"."""
+        if not filter_dict:
+            return None
+        mask = np.ones(self.size, dtype=bool)
+        for key, expected in filter_dict.items():
+            values = expected if isinstance(expected, (list, tuple, set)) else [expected]
+            if key in self.bitmaps:
+                key_mask = np.zeros(self.size, dtype=bool)
+                for value in values:
+                    bitmap = self.bitmaps[key].get(value)
+                    if bitmap is not None:
+                        key_mask |= bitmap
+            else:
+                # Keys without a bitmap fall back to a scan of the metadata
+                key_mask = np.fromiter(
+                    (metadata.get(key) in values for metadata in self.metadatas), dtype=bool, count=self.size
+                )
+            mask &= key_mask
+        return mask
+
+    def vectors(self, positions):
+        """Stored unit vectors for the given positions, as float32 in the embedding space."""
+        vectors = self.matrix[np.asarray(positions, dtype=np.int64)].astype(np.float32)
+        if self.transform is not None:
+            vectors = self.transform.reverse_transform(vectors)
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors
+
+    def search(self, query_vectors, k, filters=None):
+        """Exact top-k for each query row.
+
+        Returns, per query, a list of (position, document, cosine similarity)
+        triples in decreasing similarity, after applying that query's filter.
+        """
+        query_vectors = np.asarray(query_vectors, dtype=np.float32)
+        if self.transform is not None:
+            query_vectors = self.transform.apply(query_vectors)
+        filters = filters if filters is not None else [None] * len(query_vectors)
+        scores = (query_vectors.astype(self.matrix.dtype) @ self.matrix.T).astype(np.float32)
+        if self.half_sq_norms is not None:
+            # 1 - |q - x|^2 / 2, the similarity FAISS scores are converted to
+            half_sq_query = 0.5 * np.einsum("ij,ij->i", query_vectors, query_vectors)
+            scores += 1.0 - self.half_sq_norms[None, :] - half_sq_query[:, None]
+
+        results = []
+        for row, filter_dict in enumerate(filters):
+            row_scores = scores[row]
+            mask = self.mask(filter_dict)
+            if mask is not None:
+                row_scores = np.where(mask, row_scores, -np.inf)
+                available = int(mask.sum())
+            else:
+                available = self.size
+            top = min(k, available)
+            if top == 0:
+                results.append([])
+                continue
+            positions = np.argpartition(-row_scores, top - 1)[:top] if top < self.size else np.arange(self.size)
+            positions = positions[np.argsort(-row_scores[positions], kind="stable")]
+            documents = self.fetch_documents(positions.tolist())
+            results.append([
+                (int(position), doc, float(row_scores[position]))
+                for position, doc in zip(positions, documents)
+            ])
+        return results
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+def get_exact_engine(corpus, vector_store, filter_keys=()):
+    """Return the exact engine for a corpus's current store, or None if it is too large.
+
+    The engine is rebuilt whenever the corpus's store object changes, e.g.
+    after a new index version is hot-swapped in.
+    """
+    if vector_store.index.ntotal > EXACT_SEARCH_MAX_CHUNKS:
+        return None
+    with _engines_lock:
+        cached = _engines.get(corpus)
+        if cached is not None and cached[0] is vector_store:
+            return cached[1]
+        engine = ExactSearchEngine.from_vector_store(vector_store, filter_keys)
+        _engines[corpus] = (vector_store, engine)
+        print(f"Built exact search engine for {corpus}: {engine.size} chunks, {engine.matrix.dtype}")
+        return engine
@@ -0,0 +1,43 @@
+import os
+
+from app.models.retrieval import CORPORA, search_batch
+
+# Passages included in a retrieval-only answer, and the length of each excerpt
+FALLBACK_CHUNKS = int(os.getenv("FALLBACK_CHUNKS", "3"))
+FALLBACK_EXCERPT_CHARS = int(os.getenv("FALLBACK_EXCERPT_CHARS", "600"))
+
+FALLBACK_INTRO = (
+    "The assistant can't write a full answer right now, so here are the passages "
+    "from our resources that best match your question:"
+)
+FALLBACK_EMPTY = (
+    "The assistant is temporarily unavailable and no closely matching resources were found. "
+    "Please try again in a minute."
+)
+
+def excerpt(text, limit=FALLBACK_EXCERPT_CHARS):
+    """Shorten text to about limit characters, cutting at a word boundary."""
+    text = " ".join(text.split())
+    if len(text) <= limit:
+        return text
+    return text[:limit].rsplit(" ", 1)[0] + "…"
+
+def retrieval_only_answer(corpus, question, filter_dict=None, k=FALLBACK_CHUNKS):
+    """Answer with the top matching chunks when the language model is unavailable.
+
+    Uses the plain vector search only, so it stays fast and does not call
+    DeepSeek.
+    """
+    pairs = search_batch([question], corpus=corpus, k=k, filters=filter_dict)[0]
+    threshold = CORPORA[corpus]["score_threshold"]
+    pairs = [(doc, score) for doc, score in pairs if threshold is None or score >= threshold]
+    if not pairs:
+        return FALLBACK_EMPTY
+
+    passages = []
+    for doc, _ in pairs:
+        source = os.path.basename(doc.metadata.get("source") or "") or "resource"
+        page = doc.metadata.get("page_label") or doc.metadata.get("page")
+        reference = f"{source}, page {page}" if page is not None else source
+        passages.append(f"- {excerpt(doc.page_content)} ({reference})")
+    return FALLBACK_INTRO + "\n\n" + "\n\n".join(passages)
@@ -0,0 +1,324 @@
+import os
+import math
+import contextvars
+import queue
+import socket
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Iterator, List, Optional
+
+from dotenv import load_dotenv
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel, generate_from_stream
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+load_dotenv()
+
+# Send a second, identical request when the first token is late (off by default)
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+# Hedge once the wait for a first token exceeds this percentile of recent ones
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+# Delay used until enough first-token times have been seen, and the floor
+LLM_HEDGE_DEFAULT_DELAY_MS = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY_MS", "3000"))
+LLM_HEDGE_MIN_DELAY_MS = float(os.getenv("LLM_HEDGE_MIN_DELAY_MS", "500"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+# Recent requests used for the percentile and the hedge budget
+LLM_HEDGE_WINDOW = int(os.getenv("LLM_HEDGE_WINDOW", "500"))
+# Largest fraction of recent requests that may be hedged
+LLM_HEDGE_BUDGET = float(os.getenv("LLM_HEDGE_BUDGET", "0.1"))
+
+class HedgePolicy:
+    """Decides when to hedge an LLM request, and counts what hedging did.
+
+    The hedge delay is the configured percentile of recent times to first
+    token. Hedges are capped at `budget` of the requests in the recent
+    window, so an upstream slowdown that affects every request cannot
+    double the load on it.
+    """
+
+    def __init__(self, percentile: float = LLM_HEDGE_PERCENTILE, budget: float = LLM_HEDGE_BUDGET,
+                 window: int = LLM_HEDGE_WINDOW, default_delay: float = LLM_HEDGE_DEFAULT_DELAY_MS / 1000.0,
+                 min_delay: float = LLM_HEDGE_MIN_DELAY_MS / 1000.0, min_samples: int = LLM_HEDGE_MIN_SAMPLES):
+        self.percentile = percentile
+        self.budget = budget
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._first_token_times = deque(maxlen=window)
+        self._recent_hedges = deque(maxlen=window)
+        self.stats = {"requests": 0, "hedged": 0, "hedge_wins": 0, "budget_denied": 0, "cancelled_losers": 0}
+
+    def delay(self) -> float:
+        """Seconds to wait for a first token before hedging."""
+        with self._lock:
+            samples = sorted(self._first_token_times)
+        if len(samples) < self.min_samples:
+            return self.default_delay
+        index = min(max(math.ceil(self.percentile / 100.0 * len(samples)) - 1, 0), len(samples) - 1)
+        return max(samples[index], self.min_delay)
+
+    def start_request(self):
+        with self._lock:
+            self.stats["requests"] += 1
+            self._recent_hedges.append(False)
+
+    def allow_hedge(self) -> bool:
+        """Take a hedge from the budget, or refuse if the recent hedge rate is at the cap."""
+        with self._lock:
+            hedged = sum(self._recent_hedges)
+            if hedged >= max(1.0, self.budget * len(self._recent_hedges)):
+                self.stats["budget_denied"] += 1
+                return False
+            self._recent_hedges[-1] = True
+            self.stats["hedged"] += 1
+            return True
+
+    def record_first_token(self, seconds: float, hedge_won: bool = False):
+        with self._lock:
+            self._first_token_times.append(seconds)
+            if hedge_won:
+                self.stats["hedge_wins"] += 1
+
+    def record_cancelled(self):
+        with self._lock:
+            self.stats["cancelled_losers"] += 1
+
+    def snapshot(self):
+        delay = self.delay()
+        with self._lock:
+            stats = dict(self.stats)
+        stats["hedge_rate"] = round(stats["hedged"] / stats["requests"], 4) if stats["requests"] else 0.0
+        stats["delay_ms"] = round(delay * 1000.0, 1)
+        return stats
+
+# The attempt whose thread (or a chain step it runs) is making the current
+# request; LangChain copies context into the threads it runs steps on
+_current_attempt = contextvars.ContextVar("upstream_attempt", default=None)
+
+def on_cancel(release: Callable[[], None]):
+    """Register how to release the upstream request being made here.
+
+    If the request is part of an attempt, release() is called from the
+    cancelling side as soon as the attempt is cancelled (at once if it
+    already was), so an attempt stalled inside a read does not hold its
+    connection until the next chunk or the read timeout.
+    """
+    attempt = _current_attempt.get()
+    if attempt is not None:
+        attempt.add_release(release)
+
+def release_on_cancel(response):
+    """httpx response hook: a cancelled attempt shuts down its response's socket."""
+    stream = response.extensions.get("network_stream")
+    sock = stream.get_extra_info("socket") if stream is not None else None
+    if sock is None:
+        return
+
+    def release():
+        # A finished response's connection is back in the pool, maybe serving another request
+        if response.is_closed:
+            return
+        try:
+            # socket.socket.shutdown also works on TLS sockets without touching the
+            # SSL state the reading thread is using; the blocked read sees EOF at once
+            socket.socket.shutdown(sock, socket.SHUT_RDWR)
+        except OSError:
+            pass
+    on_cancel(release)
+
+class _Attempt:
+    """One upstream request, pumped into the shared event queue by its own thread.
+
+    The thread runs in a copy of the caller's context, so it sees the
+    caller's generation slot. An attempt started inside another one (a
+    hedged call within a cancellable stream) is cancelled with it.
+    """
+
+    def __init__(self, index: int, start: Callable[[], Iterator], events: "queue.Queue"):
+        self.index = index
+        self.started_at = time.monotonic()
+        self.cancelled = threading.Event()
+        self._start = start
+        self._events = events
+        self._lock = threading.Lock()
+        self._releases = []
+        parent = _current_attempt.get()
+        if parent is not None:
+            parent.add_release(self.cancel)
+        context = contextvars.copy_context()
+        threading.Thread(target=context.run, args=(self._run,), daemon=True).start()
+
+    def add_release(self, release: Callable[[], None]):
+        with self._lock:
+            self._releases.append(release)
+            cancelled = self.cancelled.is_set()
+        if cancelled:
+            release()
+
+    def _finish(self):
+        # Once the stream is over its connection may be reused, so it must not be shut down
+        with self._lock:
+            self._releases.clear()
+
+    def cancel(self):
+        """Stop the attempt, closing its upstream connection from this thread."""
+        with self._lock:
+            if self.cancelled.is_set():
+                return
+            self.cancelled.set()
+            releases = list(self._releases)
+        for release in releases:
+            release()
+
+    def _run(self):
+        _current_attempt.set(self)
+        chunks = None
+        try:
+            chunks = self._start()
+            for chunk in chunks:
+                # Also covers a loser whose chunk arrived before its connection was released
+                if self.cancelled.is_set():
+                    return
+                self._events.put((self.index, "chunk", chunk))
+            self._finish()
+            self._events.put((self.index, "done", None))
+        except Exception as e:
+            self._finish()
+            self._events.put((self.index, "error", e))
+        finally:
+            self._finish()
+            if chunks is not None and hasattr(chunks, "close"):
+                chunks.close()
+
+class StreamCancelled(Exception):
+    """Raised by cancellable_stream once should_cancel() has said to stop."""
+
+def cancellable_stream(start: Callable[[], Iterator], should_cancel: Callable[[], bool],
+                       check_seconds: float) -> Iterator:
+    """Yield from start(), which runs on its own thread, checking should_cancel() every check_seconds.
+
+    The check runs on a timer rather than when a chunk arrives, so a
+    stream still waiting for its first token is cancelled too. On
+    cancellation StreamCancelled is raised at once, and the upstream
+    connection is shut down the same way as a losing hedged attempt's.
+    """
+    events = queue.Queue()
+    attempt = _Attempt(0, start, events)
+    last_check = time.monotonic()
+    try:
+        while True:
+            wait = max(check_seconds - (time.monotonic() - last_check), 0.0)
+            try:
+                _, kind, payload = events.get(timeout=wait)
+            except queue.Empty:
+                kind, payload = None, None
+            if kind == "done":
+                return
+            if kind == "error":
+                raise payload
+            if time.monotonic() - last_check >= check_seconds:
+                last_check = time.monotonic()
+                if should_cancel():
+                    raise StreamCancelled()
+            if kind == "chunk":
+                yield payload
+    finally:
+        # Also reached when the caller stops reading
+        attempt.cancel()
+
+def hedged_stream(start: Callable[[], Iterator], policy: HedgePolicy,
+                  has_token: Callable[[Any], bool] = bool) -> Iterator:
+    """Stream chunks from start(), racing a second call if the first token is late.
+
+    The first attempt to produce a chunk for which has_token() is true
+    wins: only its chunks are yielded and the other attempt is cancelled.
+    An error is raised only once every attempt launched has failed.
+    """
+    policy.start_request()
+    events = queue.Queue()
+    attempts = [_Attempt(0, start, events)]
+    deadline = time.monotonic() + policy.delay()
+    can_hedge = True
+    winner = None
+    failed = 0
+    first_error = None
+
+    try:
+        while True:
+            timeout = max(deadline - time.monotonic(), 0.0) if winner is None and can_hedge else None
+            try:
+                index, kind, payload = events.get(timeout=timeout)
+            except queue.Empty:
+                can_hedge = False
+                if policy.allow_hedge():
+                    print(f"No first token after {policy.delay():.2f}s, hedging LLM request")
+                    attempts.append(_Attempt(1, start, events))
+                continue
+
+            if winner is not None and index != winner:
+                continue
+
+            if kind == "error":
+                failed += 1
+                first_error = first_error or payload
+                if winner is not None or failed == len(attempts):
+                    raise first_error
+                continue
+
+            if winner is None and (kind == "done" or has_token(payload)):
+                winner = index
+                policy.record_first_token(time.monotonic() - attempts[index].started_at, hedge_won=index > 0)
+                if index > 0:
+                    # The primary was still waiting; its elapsed time is a lower bound on its latency
+                    policy.record_first_token(time.monotonic() - attempts[0].started_at)
+                for attempt in attempts:
+                    if attempt.index != winner:
+                        attempt.cancel()
+                        policy.record_cancelled()
+
+            if kind == "done":
+                return
+            # Chunks without content (e.g. the role header) are passed through from the primary only
+            if winner is not None or index == 0:
+                yield payload
+    finally:
+        # Also reached when the caller stops reading, e.g. after a client disconnect
+        for attempt in attempts:
+            attempt.cancel()
+
+class HedgedChatModel(BaseChatModel):
+    """Chat model wrapper that hedges slow first tokens across two identical requests.
+
+    Non-streaming calls are served from the same hedged stream, so both
+    chains get the same tail-latency protection.
+    """
+
+    model: BaseChatModel
+    policy: Any = None
+
+    @property
+    def _llm_type(self) -> str:
+        return f"hedged-{self.model._llm_type}"
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        chunks = hedged_stream(
+            lambda: self.model.stream(messages, stop=stop, **kwargs),
+            self.policy or hedge_policy,
+            has_token=lambda chunk: bool(chunk.content)
+        )
+        for message in chunks:
+            chunk = ChatGenerationChunk(message=message)
+            if run_manager:
+                run_manager.on_llm_new_token(message.content, chunk=chunk)
+            yield chunk
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        return generate_from_stream(self._stream(messages, stop=stop, run_manager=run_manager, **kwargs))
+
+# Process-wide hedging state, shared by every hedged model
+hedge_policy = HedgePolicy()
@@ -0,0 +1,166 @@
+import os
+import sys
+import asyncio
+import threading
+
+# Configure asyncio event loop before importing torch-related modules
+if sys.platform == 'darwin':  # macOS
+    if not isinstance(asyncio.get_event_loop_policy(), asyncio.DefaultEventLoopPolicy):
+        asyncio.set_event_loop_policy(asyncio.DefaultEventLoopPolicy())
+
+import httpx
+from dotenv import load_dotenv
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_deepseek.chat_models import ChatDeepSeek
+
+from app.models.hedging import LLM_HEDGE_ENABLED, HedgedChatModel, hedge_policy, release_on_cancel
+
+load_dotenv()
+
+DEEPSEEK_API_BASE = os.getenv("DEEPSEEK_API_BASE", "https://api.deepseek.com/v1")
+DEEPSEEK_MODEL = os.getenv("DEEPSEEK_MODEL", "deepseek-chat")
+
+# Pool limits for the shared upstream connection pool
+HTTP_MAX_CONNECTIONS = int(os.getenv("DEEPSEEK_MAX_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_SECONDS = float(os.getenv("DEEPSEEK_KEEPALIVE_SECONDS", "120"))
+# Longest wait for the next bytes from DeepSeek before the call counts as failed
+HTTP_READ_TIMEOUT_SECONDS = float(os.getenv("DEEPSEEK_READ_TIMEOUT_SECONDS", "30"))
+
+_http_client = None
+_http_client_lock = threading.Lock()
+
+def get_http_client():
+    """Return the process-wide pooled HTTP client used for DeepSeek calls."""
+    global _http_client
+    if _http_client is None:
+        with _http_client_lock:
+            if _http_client is None:
+                _http_client = httpx.Client(
+                    limits=httpx.Limits(
+                        max_connections=HTTP_MAX_CONNECTIONS,
+                        max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+                        keepalive_expiry=HTTP_KEEPALIVE_SECONDS
+                    ),
+                    timeout=httpx.Timeout(HTTP_READ_TIMEOUT_SECONDS, connect=10.0),
+                    # Lets a losing hedged attempt be closed while it is still waiting for data
+                    event_hooks={"response": [release_on_cancel]}
+                )
+    return _http_client
+
+class UsageTracker(BaseCallbackHandler):
+    """Accumulate token usage reported by DeepSeek, including prompt-cache hits.
+
+    DeepSeek caches prompt prefixes on its side; cached prompt tokens are
+    reported as prompt_cache_hit_tokens (or cache_read in LangChain's usage
+    metadata) and billed at a fraction of the normal rate.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.totals = {
+            "calls": 0, "prompt_tokens": 0, "cached_prompt_tokens": 0, "completion_tokens": 0,
+            "cancelled_calls": 0, "cancelled_completion_tokens": 0, "estimated_tokens_saved": 0
+        }
+
+    @staticmethod
+    def _usage(response):
+        """Pull (prompt, cached prompt, completion) token counts from an LLMResult."""
+        token_usage = (response.llm_output or {}).get("token_usage") or {}
+        for generations in response.generations:
+            for generation in generations:
+                metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if metadata:
+                    cached = (metadata.get("input_token_details") or {}).get("cache_read")
+                    if cached is None:
+                        cached = token_usage.get("prompt_cache_hit_tokens", 0)
+                    return metadata.get("input_tokens", 0), cached or 0, metadata.get("output_tokens", 0)
+        if token_usage:
+            return (
+                token_usage.get("prompt_tokens", 0),
+                token_usage.get("prompt_cache_hit_tokens", 0),
+                token_usage.get("completion_tokens", 0)
+            )
+        return None
+
+    def on_llm_end(self, response, **kwargs):
+        usage = self._usage(response)
+        if usage is None:
+            return
+        prompt_tokens, cached_tokens, completion_tokens = usage
+        with self._lock:
+            self.totals["calls"] += 1
+            self.totals["prompt_tokens"] += prompt_tokens
+            self.totals["cached_prompt_tokens"] += cached_tokens
+            self.totals["completion_tokens"] += completion_tokens
+        print(f"LLM usage: {prompt_tokens} prompt tokens ({cached_tokens} cached), "
+              f"{completion_tokens} completion tokens")
+
+    def record_cancelled(self, generated_tokens):
+        """Count a generation stopped early because its reader went away.
+
+        Tokens saved are estimated as the average completion length of
+        finished calls minus what the cancelled call had already produced.
+        """
+        with self._lock:
+            calls = self.totals["calls"]
+            average = self.totals["completion_tokens"] / calls if calls else 0
+            saved = max(int(average) - generated_tokens, 0)
+            self.totals["cancelled_calls"] += 1
+            self.totals["cancelled_completion_tokens"] += generated_tokens
+            self.totals["estimated_tokens_saved"] += saved
+        print(f"LLM call cancelled after {generated_tokens} completion tokens (~{saved} saved)")
+
+    def snapshot(self):
+        with self._lock:
+            totals = dict(self.totals)
+        prompt_tokens = totals["prompt_tokens"]
+        totals["prompt_cache_hit_rate"] = round(totals["cached_prompt_tokens"] / prompt_tokens, 4) if prompt_tokens else 0.0
+        return totals
+
+# Process-wide token usage, shared by every model created below
+usage_tracker = UsageTracker()
+
+def get_api_key():
+    """Return the DeepSeek API key, checked when a model is first needed.
+
+    Retrieval-only features such as /api/search work without it.
+    """
+    api_key = os.getenv("DEEPSEEK_API_KEY")
+    if not api_key:
+        raise ValueError("DeepSeek API key not found. Please set it in the .env file.")
+    return api_key
+
+def create_llm(streaming=False):
+    """Create a DeepSeek chat model that shares the pooled HTTP client.
+
+    With LLM_HEDGE_ENABLED=true the model is wrapped so that a request whose
+    first token is late is hedged with a second, identical request.
+    """
+    llm = ChatDeepSeek(
+        api_key=get_api_key(),
+        api_base=DEEPSEEK_API_BASE,
+        model_name=DEEPSEEK_MODEL,
+        streaming=streaming,
+        # Ask for a final usage chunk on streamed responses too
+        stream_usage=True,
+        http_client=get_http_client(),
+        # Retries are handled by the circuit breaker around the chains
+        max_retries=0,
+        callbacks=[usage_tracker]
+    )
+    if LLM_HEDGE_ENABLED:
+        return HedgedChatModel(model=llm, policy=hedge_policy)
+    return llm
+
+def warm_upstream_connection():
+    """Open a pooled connection to DeepSeek without generating any tokens.
+
+    Lists the available models, which completes the TCP and TLS handshakes
+    so the first real request can reuse the kept-alive connection.
+    """
+    response = get_http_client().get(
+        f"{DEEPSEEK_API_BASE.rstrip('/')}/models",
+        headers={"Authorization": f"Bearer {os.getenv('DEEPSEEK_API_KEY')}"}
+    )
+    response.raise_for_status()
+    return response.status_code
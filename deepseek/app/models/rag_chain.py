@@ -1,4 +1,3 @@
-import os
 import sys
 import asyncio
 
@@ -8,100 +7,92 @@ if sys.platform == 'darwin':  # macOS
         asyncio.set_event_loop_policy(asyncio.DefaultEventLoopPolicy())
 
 from dotenv import load_dotenv
-from langchain.schema.runnable import RunnablePassthrough
-from langchain_deepseek.chat_models import ChatDeepSeek
-from langchain.prompts import PromptTemplate
+from langchain.schema.runnable import RunnableLambda, RunnablePassthrough
+from langchain.prompts import ChatPromptTemplate
 from langchain.schema.output_parser import StrOutputParser
-from app.models.vector_store import load_vector_store
+from app.models.retrieval import create_retriever
+from app.models.llm import create_llm
+from app.models.conversation import condense_question
 
 load_dotenv()
 
-# Load DeepSeek API key from environment
-DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
-if not DEEPSEEK_API_KEY:
-    raise ValueError("DeepSeek API key not found. Please set it in the .env file.")
+# Static instructions, sent first and byte-identical on every request so
+# DeepSeek's prompt prefix cache can reuse them
+RAG_SYSTEM_PROMPT = """You are an expert change management consultant in a pharmaceutical manufacturing company specializing in the ADKAR model. 
+You provide guidance and evaluate change management plans based on the ADKAR framework 
+(Awareness, Desire, Knowledge, Ability, Reinforcement). Answer the questions in the context of a pharmaceutical manufacturing company, and guide employees through organizational changes.
+
+When supporting employees through organizational changes:
+1. Identify which ADKAR elements are addressed and which ones need improvement
+2. Recommend specific educational resources and training materials when applicable
+3. Provide practical, actionable advice tailored to the employee's role and situation
+4. Suggest concrete steps employees can take to adapt to the change
+5. Offer guidance on where to find additional resources or support
+6. Maintain an empathetic, supportive, and encouraging tone"""
 
-def get_retriever(vector_store_path="app/data/vector_store"):
-    """Get a retriever from the vector store."""
+# Per-request part: earlier conversation, retrieved context, then the question
+RAG_HUMAN_TEMPLATE = """{history}Use the following information to answer the user's question:
+
+{context}
+
+User Question: {question}"""
+
+def get_retriever(filter_dict=None):
+    """Get an adaptive retriever over the ADKAR vector store."""
     try:
-        vector_store = load_vector_store(vector_store_path)
-        if vector_store is None:
-            raise ValueError("Vector store not found. Please create one first.")
-        
-        # Create a more advanced retriever with filter capabilities
-        return vector_store.as_retriever(
-            search_kwargs={
-                "k": 8,  # Increase from 5 to 8 to get more diverse sources
-                "score_threshold": 0.5,  # Only return relevant enough results
-                "filter": None  # Will be set dynamically in the chain if needed
-            }
-        )
+        # Returns between min_k and max_k chunks above the corpus's similarity
+        # cutoff, stopping at a sharp drop in scores (see retrieval.CORPORA)
+        return create_retriever("adkar", filter_dict)
     except Exception as e:
         print(f"Error loading vector store: {e}")
         raise ValueError(f"Failed to load vector store: {e}")
 
+def create_rag_prompt(history=None):
+    """Build the chat prompt: the static system message, then the variable parts."""
+    return ChatPromptTemplate.from_messages([
+        ("system", RAG_SYSTEM_PROMPT),
+        ("human", RAG_HUMAN_TEMPLATE)
+    ]).partial(history=f"Conversation so far:\n{history}\n\n" if history else "")
+
 def format_docs(docs):
     """Format retrieved documents into a single string."""
     return "\n\n".join([doc.page_content for doc in docs])
 
-def create_rag_chain(streaming=False, resource_type=None, audience=None):
+def create_rag_chain(streaming=False, resource_type=None, audience=None, history=None):
     """Create a RAG chain with DeepSeek model.
     
     Args:
         streaming (bool): Whether to enable streaming for responses
         resource_type (str, optional): Type of resource to filter for (e.g., "training", "guide", "faq")
         audience (str, optional): Target audience to filter for (e.g., "managers", "employees", "technical_staff")
+        history (str, optional): Summarized earlier conversation to include in the prompt
     """
     # Initialize DeepSeek LLM with proper error handling and streaming support
     try:
         # Configure streaming parameter
-        llm = ChatDeepSeek(
-            api_key=DEEPSEEK_API_KEY, 
-            model_name="deepseek-chat",
-            streaming=streaming
-        )
+        llm = create_llm(streaming=streaming)
         
-        # Get retriever
-        retriever = get_retriever()
+        # Build a metadata filter if specified
+        filter_dict = {}
+        if resource_type:
+            filter_dict["resource_type"] = resource_type
+        if audience:
+            filter_dict["audience"] = audience
         
-        # Apply metadata filters if specified
-        if resource_type or audience:
-            # Create a metadata filter
-            filter_dict = {}
-            if resource_type:
-                filter_dict["resource_type"] = resource_type
-            if audience:
-                filter_dict["audience"] = audience
-            
-            # Set the filter on the retriever
-            retriever.search_kwargs["filter"] = filter_dict
+        # Get retriever
+        retriever = get_retriever(filter_dict or None)
         
-        # Define the prompt template
-        template = """You are an expert change management consultant in a pharmaceutical manufacturing company specializing in the ADKAR model. 
-You provide guidance and evaluate change management plans based on the ADKAR framework 
-(Awareness, Desire, Knowledge, Ability, Reinforcement). Answer the questions in the context of a pharmaceutical manufacturing company, and guide employees through organizational changes.
-
-Use the following information to answer the user's question:
-
-{context}
-
-When supporting employees through organizational changes:
-1. Identify which ADKAR elements are addressed and which ones need improvement
-2. Recommend specific educational resources and training materials when applicable
-3. Provide practical, actionable advice tailored to the employee's role and situation
-4. Suggest concrete steps employees can take to adapt to the change
-5. Offer guidance on where to find additional resources or support
-6. Maintain an empathetic, supportive, and encouraging tone
-
-User Question: {question}
-
-Your Response:"""
+        prompt = create_rag_prompt(history)
         
-        prompt = PromptTemplate.from_template(template)
+        # Follow-ups are retrieved with a standalone version of the question
+        if history:
+            retrieval_query = RunnableLambda(lambda question: condense_question(history, question, "chat"))
+        else:
+            retrieval_query = RunnablePassthrough()
         
         # Create the RAG chain
         rag_chain = (
-            {"context": retriever | format_docs, "question": RunnablePassthrough()}
+            {"context": retrieval_query | retriever | format_docs, "question": RunnablePassthrough()}
             | prompt
             | llm
             | StrOutputParser()
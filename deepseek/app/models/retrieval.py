@@ -0,0 +1,511 @@
+import os
+import sys
+import asyncio
+
+# Configure asyncio event loop before importing torch-related modules
+if sys.platform == 'darwin':  # macOS
+    if not isinstance(asyncio.get_event_loop_policy(), asyncio.DefaultEventLoopPolicy):
+        asyncio.set_event_loop_policy(asyncio.DefaultEventLoopPolicy())
+
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+import faiss
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from app.models.docstore import documents_at
+from app.models.vector_store import get_embeddings, get_vector_store
+from app.models.exact_search import get_exact_engine
+from app.models.conversation import estimate_tokens
+
+# "adaptive" returns between min_k and max_k chunks above a similarity cutoff,
+# stopping early at a drop in scores; "mmr" returns mmr_k diverse chunks above
+# the cutoff; "fixed" always returns max_k chunks
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "adaptive")
+# Largest drop in cosine similarity between consecutive chunks before the rest are cut
+RETRIEVAL_SCORE_GAP = float(os.getenv("RETRIEVAL_SCORE_GAP", "0.08"))
+# "mmr" mode: candidates considered, and relevance vs. diversity weight (1.0 = relevance only)
+RETRIEVAL_MMR_FETCH_K = int(os.getenv("RETRIEVAL_MMR_FETCH_K", "20"))
+RETRIEVAL_MMR_LAMBDA = float(os.getenv("RETRIEVAL_MMR_LAMBDA", "0.5"))
+# Also search the other corpus and merge the results (adaptive and fixed modes)
+RETRIEVAL_FEDERATED = os.getenv("RETRIEVAL_FEDERATED", "false").lower() == "true"
+# The other corpus is skipped when the query is less similar to its centroid
+# than to the home corpus's centroid by more than this
+FEDERATION_ROUTER_MARGIN = float(os.getenv("FEDERATION_ROUTER_MARGIN", "0.1"))
+
+# Corpora served by the chains, with the metadata keys each one can filter on
+# and the adaptive retrieval limits (cosine similarity for the threshold)
+CORPORA = {
+    "adkar": {
+        "path": "app/data/vector_store",
+        "filter_keys": ("resource_type", "audience"),
+        "min_k": int(os.getenv("ADKAR_MIN_K", "2")),
+        "max_k": int(os.getenv("ADKAR_MAX_K", "8")),
+        "score_threshold": float(os.getenv("ADKAR_SCORE_THRESHOLD", "0.3")),
+        "mmr_k": int(os.getenv("ADKAR_MMR_K", "5"))
+    },
+    "change_planning": {
+        "path": "app/data/change_planning_store",
+        "filter_keys": ("plan_stage", "change_type"),
+        "min_k": int(os.getenv("CHANGE_PLANNING_MIN_K", "2")),
+        "max_k": int(os.getenv("CHANGE_PLANNING_MAX_K", "8")),
+        "score_threshold": float(os.getenv("CHANGE_PLANNING_SCORE_THRESHOLD", "0.3")),
+        "mmr_k": int(os.getenv("CHANGE_PLANNING_MMR_K", "5"))
+    }
+}
+
+# Candidates fetched per query when a filter has to be applied after the search
+DEFAULT_FILTER_FETCH_K = 20
+# Recent query embeddings kept, so a question searched by a widget and then
+# asked of a chain is only embedded once (0 disables the cache)
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+
+_query_vectors = OrderedDict()
+_query_vectors_lock = threading.Lock()
+
+def embed_queries(queries):
+    """Embed queries as a float32 matrix, reusing recently computed vectors."""
+    vectors = [None] * len(queries)
+    with _query_vectors_lock:
+        for row, query in enumerate(queries):
+            vector = _query_vectors.get(query)
+            if vector is not None:
+                _query_vectors.move_to_end(query)
+                vectors[row] = vector
+    missing = [row for row, vector in enumerate(vectors) if vector is None]
+    if missing:
+        # Embed only the texts not cached yet, in one batched call
+        texts = list(dict.fromkeys(queries[row] for row in missing))
+        embedded = dict(zip(texts, np.asarray(get_embeddings().embed_documents(texts), dtype=np.float32)))
+        for row in missing:
+            vectors[row] = embedded[queries[row]]
+        if QUERY_EMBEDDING_CACHE_SIZE > 0:
+            with _query_vectors_lock:
+                _query_vectors.update(embedded)
+                while len(_query_vectors) > QUERY_EMBEDDING_CACHE_SIZE:
+                    _query_vectors.popitem(last=False)
+    return np.stack(vectors)
+
+def get_corpus_store(corpus):
+    """Return the cached vector store for a named corpus."""
+    if corpus not in CORPORA:
+        raise ValueError(f"Unknown corpus '{corpus}'. Expected one of: {', '.join(CORPORA)}")
+    vector_store = get_vector_store(CORPORA[corpus]["path"])
+    if vector_store is None:
+        raise ValueError(f"Vector store not found for corpus '{corpus}'. Please create one first.")
+    return vector_store
+
+def build_filter(corpus, **values):
+    """Build a metadata filter from the non-empty values allowed for a corpus."""
+    allowed = CORPORA[corpus]["filter_keys"]
+    filter_dict = {key: value for key, value in values.items() if key in allowed and value}
+    return filter_dict or None
+
+def matches_filter(metadata, filter_dict):
+    """Check chunk metadata against a filter; list values mean "any of"."""
+    if not filter_dict:
+        return True
+    for key, expected in filter_dict.items():
+        value = metadata.get(key)
+        if isinstance(expected, (list, tuple, set)):
+            if value not in expected:
+                return False
+        elif value != expected:
+            return False
+    return True
+
+def distance_to_similarity(distances, index):
+    """Convert raw FAISS distances to cosine similarity for normalized vectors."""
+    if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+        return distances
+    # IndexFlatL2 returns squared L2 distance, and |a-b|^2 = 2 - 2cos for unit vectors
+    return 1.0 - distances / 2.0
+
+def to_hit(doc, score, corpus):
+    """Shape a retrieved chunk for API responses."""
+    metadata = doc.metadata or {}
+    return {
+        "content": doc.page_content,
+        "score": float(score),
+        "corpus": corpus,
+        "source": metadata.get("source"),
+        "page": metadata.get("page"),
+        "page_label": metadata.get("page_label"),
+        "metadata": metadata
+    }
+
+def _per_query_filters(filters, count):
+    if filters is None or isinstance(filters, dict):
+        return [filters] * count
+    filters = list(filters)
+    if len(filters) != count:
+        raise ValueError(f"Expected {count} filters, got {len(filters)}")
+    return filters
+
+def search_batch(queries, corpus="adkar", k=8, filters=None, fetch_k=None):
+    """Search many queries at once, returning (document, similarity) pairs.
+
+    All queries are embedded in one batched call and searched with a single
+    matrix search (FAISS, or the exact engine for small corpora), instead of
+    one embedding and search per question. Pairs are ordered by decreasing
+    cosine similarity.
+
+    Takes the same arguments as retrieve_batch.
+    """
+    queries = list(queries)
+    if not queries:
+        return []
+    return search_vectors(embed_queries(queries), corpus=corpus, k=k, filters=filters, fetch_k=fetch_k)
+
+def search_vectors(vectors, corpus="adkar", k=8, filters=None, fetch_k=None):
+    """Search already embedded queries (one row each); same results as search_batch."""
+    vector_store = get_corpus_store(corpus)
+    query_filters = _per_query_filters(filters, len(vectors))
+
+    if fetch_k is None:
+        fetch_k = max(DEFAULT_FILTER_FETCH_K, k * 4) if any(query_filters) else k
+    fetch_k = min(max(fetch_k, k), vector_store.index.ntotal)
+    if fetch_k == 0:
+        return [[] for _ in range(len(vectors))]
+
+    return [
+        [(doc, score) for _, doc, score in candidates]
+        for candidates in _search_candidates(corpus, vector_store, vectors, query_filters, k, fetch_k)
+    ]
+
+def _search_candidates(corpus, vector_store, vectors, query_filters, k, fetch_k):
+    """Search embedded queries; per query, up to k (index position, document, similarity) triples.
+
+    Small corpora go through the exact NumPy engine, which applies filters
+    with bitmaps before ranking, so fetch_k does not limit filtered recall.
+    Otherwise chunks are read from the docstore in one batch per query: the
+    top k when unfiltered, all fetch_k candidates when a filter must be
+    checked against their metadata.
+    """
+    engine = get_exact_engine(corpus, vector_store, CORPORA[corpus]["filter_keys"])
+    if engine is not None:
+        return engine.search(vectors, k, query_filters)
+
+    distances, indices = vector_store.index.search(vectors, fetch_k)
+    similarities = distance_to_similarity(distances, vector_store.index)
+
+    results = []
+    for row, query_filter in enumerate(query_filters):
+        hits = [
+            (int(position), float(score))
+            for score, position in zip(similarities[row], indices[row]) if position != -1
+        ]
+        if not query_filter:
+            hits = hits[:k]
+        documents = documents_at(vector_store, [position for position, _ in hits])
+        candidates = []
+        for (position, score), doc in zip(hits, documents):
+            if not matches_filter(doc.metadata, query_filter):
+                continue
+            candidates.append((position, doc, score))
+            if len(candidates) == k:
+                break
+        results.append(candidates)
+
+    return results
+
+def mmr_select(candidate_vectors, relevance, k, lambda_mult=0.5):
+    """Pick k diverse candidates by maximal marginal relevance.
+
+    Greedily takes the candidate with the best trade-off between relevance
+    to the query and similarity to anything already picked. The candidate
+    similarity matrix is computed once, and each step is a vector update,
+    so for a few dozen candidates this takes microseconds.
+
+    Returns positions into the candidate arrays, in selection order.
+    """
+    count = len(relevance)
+    k = min(k, count)
+    if k <= 0:
+        return []
+    relevance = np.asarray(relevance, dtype=np.float32)
+    pairwise = candidate_vectors @ candidate_vectors.T
+
+    first = int(np.argmax(relevance))
+    selected = [first]
+    redundancy = pairwise[first].copy()
+    available = np.ones(count, dtype=bool)
+    available[first] = False
+    while len(selected) < k:
+        scores = lambda_mult * relevance - (1.0 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(redundancy, pairwise[best], out=redundancy)
+    return selected
+
+def search_mmr(query, corpus="adkar", k=5, fetch_k=RETRIEVAL_MMR_FETCH_K, lambda_mult=RETRIEVAL_MMR_LAMBDA,
+               filter_dict=None, score_threshold=None):
+    """Search one query, then choose k diverse chunks from the top fetch_k.
+
+    Candidate vectors are reconstructed from the FAISS index rather than
+    re-embedded. Candidates below score_threshold are discarded before
+    selection. Returns (document, similarity) pairs in MMR order.
+    """
+    vector_store = get_corpus_store(corpus)
+    fetch_k = min(max(fetch_k, k), vector_store.index.ntotal)
+    if fetch_k == 0:
+        return []
+    search_k = max(DEFAULT_FILTER_FETCH_K, fetch_k * 2) if filter_dict else fetch_k
+    search_k = min(search_k, vector_store.index.ntotal)
+
+    vector = embed_queries([query])
+    candidates = _search_candidates(corpus, vector_store, vector, [filter_dict], fetch_k, search_k)[0]
+    if score_threshold is not None:
+        candidates = [candidate for candidate in candidates if candidate[2] >= score_threshold]
+    if not candidates:
+        return []
+
+    positions = np.array([position for position, _, _ in candidates], dtype=np.int64)
+    engine = get_exact_engine(corpus, vector_store, CORPORA[corpus]["filter_keys"])
+    if engine is not None:
+        candidate_vectors = engine.vectors(positions)
+    else:
+        candidate_vectors = vector_store.index.reconstruct_batch(positions)
+    order = mmr_select(candidate_vectors, [score for _, _, score in candidates], k, lambda_mult)
+    return [(candidates[i][1], candidates[i][2]) for i in order]
+
+def retrieve_batch(queries, corpus="adkar", k=8, filters=None, fetch_k=None):
+    """Retrieve the top-k chunks for many queries at once.
+
+    All queries are embedded in one batched call and searched with a single
+    matrix FAISS search, instead of one embedding and search per question.
+
+    Args:
+        queries (list[str]): Questions to retrieve chunks for
+        corpus (str): "adkar" or "change_planning"
+        k (int): Chunks to return per query
+        filters (dict or list, optional): One metadata filter for every query,
+            or a list with one filter (or None) per query
+        fetch_k (int, optional): Candidates searched per query before filtering
+
+    Returns:
+        list[list[dict]]: For each query, its chunks with score and source metadata
+    """
+    return [
+        [to_hit(doc, score, corpus) for doc, score in pairs]
+        for pairs in search_batch(queries, corpus=corpus, k=k, filters=filters, fetch_k=fetch_k)
+    ]
+
+def search_sources(query, corpora=None, k=5, **filter_values):
+    """Rank chunks for one query across corpora, as hits in decreasing similarity.
+
+    Filter values apply to the corpora that have those keys; a corpus is
+    skipped when a filter is given on a key it does not have.
+    """
+    given = {key for key, value in filter_values.items() if value}
+    hits = []
+    for corpus in corpora or list(CORPORA):
+        if not given <= set(CORPORA[corpus]["filter_keys"]):
+            continue
+        pairs = search_batch([query], corpus=corpus, k=k, filters=build_filter(corpus, **filter_values))[0]
+        hits.extend(to_hit(doc, score, corpus) for doc, score in pairs)
+    hits.sort(key=lambda hit: -hit["score"])
+    return hits[:k]
+
+_centroids = {}
+_centroids_lock = threading.Lock()
+
+def corpus_centroid(corpus):
+    """Unit mean vector of a corpus's chunks, recomputed when its store changes."""
+    vector_store = get_corpus_store(corpus)
+    with _centroids_lock:
+        cached = _centroids.get(corpus)
+        if cached is not None and cached[0] is vector_store:
+            return cached[1]
+
+    index = vector_store.index
+    total = np.zeros(index.d, dtype=np.float64)
+    # Read the vectors in blocks so large corpora are never copied whole
+    for start in range(0, index.ntotal, 10000):
+        total += index.reconstruct_n(start, min(10000, index.ntotal - start)).sum(axis=0)
+    centroid = (total / max(np.linalg.norm(total), 1e-12)).astype(np.float32)
+    with _centroids_lock:
+        _centroids[corpus] = (vector_store, centroid)
+    return centroid
+
+def route_corpora(query_vector, home, corpora, margin=FEDERATION_ROUTER_MARGIN):
+    """Corpora worth searching for a query: always home, the others unless clearly off topic."""
+    if len(corpora) < 2:
+        return list(corpora)
+    similarity = {corpus: float(query_vector @ corpus_centroid(corpus)) for corpus in corpora}
+    return [corpus for corpus in corpora if corpus == home or similarity[corpus] >= similarity[home] - margin]
+
+def normalize_score(score, corpus):
+    """Map a similarity onto 0 at the corpus's cutoff and 1 at a perfect match.
+
+    Corpora differ in how similar their typical matches are, so raw cosine
+    scores are not comparable across them; their cutoffs are.
+    """
+    threshold = CORPORA[corpus]["score_threshold"] or 0.0
+    return (score - threshold) / (1.0 - threshold)
+
+_federation_pool = ThreadPoolExecutor(max_workers=len(CORPORA), thread_name_prefix="federated-search")
+
+def search_federated(query, home, k=8, filter_dict=None):
+    """Search the home corpus and the other corpora the router picks, merged by normalized score.
+
+    The query is embedded once and the corpora are searched concurrently.
+    A corpus is left out when filter_dict uses keys it does not have.
+    Returns up to k (document, normalized score, corpus) triples, best
+    first, without chunks below their own corpus's cutoff.
+    """
+    given = set(filter_dict or {})
+    corpora = [corpus for corpus in CORPORA
+               if corpus == home or given <= set(CORPORA[corpus]["filter_keys"])]
+    vectors = embed_queries([query])
+    corpora = route_corpora(vectors[0], home, corpora)
+
+    def search(corpus):
+        return search_vectors(vectors, corpus=corpus, k=k, filters=filter_dict)[0]
+
+    if len(corpora) > 1:
+        results = list(_federation_pool.map(search, corpora))
+    else:
+        results = [search(corpus) for corpus in corpora]
+
+    merged = []
+    for corpus, pairs in zip(corpora, results):
+        threshold = CORPORA[corpus]["score_threshold"]
+        merged.extend(
+            (doc, normalize_score(score, corpus), corpus)
+            for doc, score in pairs
+            if threshold is None or score >= threshold
+        )
+    merged.sort(key=lambda triple: -triple[1])
+    return merged[:k]
+
+def select_adaptive(pairs, min_k, max_k, score_threshold=None, max_gap=None):
+    """Choose how many of the ranked (document, similarity) pairs to keep.
+
+    Chunks below score_threshold are always dropped. After the first min_k
+    chunks, selection also stops at the first drop in similarity larger
+    than max_gap, since what follows a sharp drop is rarely on topic.
+    """
+    selected = []
+    for doc, score in pairs[:max_k]:
+        if score_threshold is not None and score < score_threshold:
+            break
+        if selected and len(selected) >= min_k and max_gap is not None and selected[-1][1] - score > max_gap:
+            break
+        selected.append((doc, score))
+    return selected
+
+class RetrievalStats:
+    """Chunks and context tokens actually sent to the model, per process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.totals = {"requests": 0, "chunks": 0, "context_tokens": 0, "chunks_by_corpus": {}}
+
+    def record(self, chunks, context_tokens, corpora=()):
+        with self._lock:
+            self.totals["requests"] += 1
+            self.totals["chunks"] += chunks
+            self.totals["context_tokens"] += context_tokens
+            by_corpus = self.totals["chunks_by_corpus"]
+            for corpus in corpora:
+                by_corpus[corpus] = by_corpus.get(corpus, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            totals = dict(self.totals, chunks_by_corpus=dict(self.totals["chunks_by_corpus"]))
+        requests = totals["requests"]
+        totals["avg_chunks"] = round(totals["chunks"] / requests, 2) if requests else 0.0
+        totals["avg_context_tokens"] = round(totals["context_tokens"] / requests, 1) if requests else 0.0
+        return totals
+
+retrieval_stats = RetrievalStats()
+
+class AdaptiveRetriever(BaseRetriever):
+    """Retriever for a corpus that honours a similarity cutoff and score gaps.
+
+    Resolves the corpus's vector store on every call, so a newly published
+    index version is picked up without rebuilding the chain. Each returned
+    document is a copy whose metadata carries its similarity as "score"
+    and its corpus as "corpus". With search_type="mmr", up to max_k diverse
+    chunks are picked instead. With federated=True, the other corpora are
+    searched too (unless the router skips them) and scores are normalized
+    against each corpus's cutoff.
+    """
+
+    corpus: str
+    filter: Optional[dict] = None
+    min_k: int = 2
+    max_k: int = 8
+    score_threshold: Optional[float] = None
+    max_gap: Optional[float] = None
+    search_type: str = "similarity"
+    fetch_k: int = RETRIEVAL_MMR_FETCH_K
+    lambda_mult: float = RETRIEVAL_MMR_LAMBDA
+    federated: bool = False
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        if self.search_type == "mmr":
+            selected = search_mmr(query, corpus=self.corpus, k=self.max_k, fetch_k=self.fetch_k,
+                                  lambda_mult=self.lambda_mult, filter_dict=self.filter,
+                                  score_threshold=self.score_threshold)
+            pairs = selected
+            corpora = [self.corpus] * len(selected)
+        elif self.federated:
+            triples = search_federated(query, self.corpus, k=self.max_k, filter_dict=self.filter)
+            pairs = [(doc, score) for doc, score, _ in triples]
+            # Cutoffs are already applied; the gap is measured on the normalized scale
+            threshold = CORPORA[self.corpus]["score_threshold"] or 0.0
+            max_gap = self.max_gap / (1.0 - threshold) if self.max_gap is not None else None
+            selected = select_adaptive(pairs, self.min_k, self.max_k, None, max_gap)
+            corpora = [corpus for _, _, corpus in triples[:len(selected)]]
+        else:
+            pairs = search_batch([query], corpus=self.corpus, k=self.max_k, filters=self.filter)[0]
+            selected = select_adaptive(pairs, self.min_k, self.max_k, self.score_threshold, self.max_gap)
+            corpora = [self.corpus] * len(selected)
+        docs = [
+            Document(page_content=doc.page_content, metadata={**doc.metadata, "score": score, "corpus": corpus})
+            for (doc, score), corpus in zip(selected, corpora)
+        ]
+
+        # Same separator the chains use to join the context
+        context_tokens = estimate_tokens("\n\n".join(doc.page_content for doc in docs))
+        retrieval_stats.record(len(docs), context_tokens, corpora)
+        scores = ", ".join(f"{score:.2f} {corpus}" if self.federated else f"{score:.2f}"
+                           for (_, score), corpus in zip(selected, corpora))
+        print(f"Retrieved {len(docs)} of {len(pairs)} {self.corpus}{' (federated)' if self.federated else ''} chunks "
+              f"(~{context_tokens} context tokens; scores: {scores or 'none'})")
+        return docs
+
+def create_retriever(corpus, filter_dict=None, mode=None, federated=None):
+    """Create the chains' retriever for a corpus using its configured limits."""
+    config = CORPORA[corpus]
+    get_corpus_store(corpus)  # fail early if the index has not been built
+    mode = mode or RETRIEVAL_MODE
+    federated = RETRIEVAL_FEDERATED if federated is None else federated
+    if mode == "fixed":
+        return AdaptiveRetriever(corpus=corpus, filter=filter_dict, min_k=config["max_k"], max_k=config["max_k"],
+                                 federated=federated)
+    if mode == "mmr":
+        return AdaptiveRetriever(
+            corpus=corpus,
+            filter=filter_dict,
+            max_k=config["mmr_k"],
+            score_threshold=config["score_threshold"],
+            search_type="mmr"
+        )
+    return AdaptiveRetriever(
+        corpus=corpus,
+        filter=filter_dict,
+        min_k=config["min_k"],
+        max_k=config["max_k"],
+        score_threshold=config["score_threshold"],
+        max_gap=RETRIEVAL_SCORE_GAP,
+        federated=federated
+    )
@@ -2,19 +2,75 @@ import os
 import sys
 import asyncio
 import json
+import shutil
+import threading
+import time
+import uuid
 
 # Configure asyncio event loop before importing torch-related modules
 if sys.platform == 'darwin':  # macOS
     if not isinstance(asyncio.get_event_loop_policy(), asyncio.DefaultEventLoopPolicy):
         asyncio.set_event_loop_policy(asyncio.DefaultEventLoopPolicy())
 
+import faiss
 from dotenv import load_dotenv
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
 from langchain.schema.document import Document
+from app.models.docstore import DOCSTORE_FILE, SQLiteDocstore, write_docstore
+from app.models.embeddings import create_embeddings
 
 load_dotenv()
 
+# Each build is saved to <store>/versions/<version>/ and published by
+# atomically replacing the <store>/CURRENT pointer file
+VERSIONS_DIR = "versions"
+CURRENT_POINTER = "CURRENT"
+# Each version holds the FAISS index and a SQLite docstore of its chunks
+INDEX_FILE = "index.faiss"
+# Docstore of stores saved before the SQLite format, pickled by LangChain
+PICKLED_DOCSTORE_FILE = "index.pkl"
+# Still load stores whose docstore is pickled. Off by default: unpickling runs
+# arbitrary code, so convert them once with python -m app.data.convert_store
+VECTOR_STORE_ALLOW_PICKLE = os.getenv("VECTOR_STORE_ALLOW_PICKLE", "false").lower() == "true"
+
+# How many published versions to keep on disk, including the current one
+VECTOR_STORE_KEEP_VERSIONS = int(os.getenv("VECTOR_STORE_KEEP_VERSIONS", "3"))
+# How often a running process checks for a newly published version
+VECTOR_STORE_POLL_SECONDS = float(os.getenv("VECTOR_STORE_POLL_SECONDS", "5"))
+# Dimensions kept per store when building an index: PCA fitted on the corpus
+# reduces the 384-dim MiniLM vectors (0 keeps them whole); compare settings
+# with python -m benchmarks.pca_projection
+VECTOR_PCA_DIMS = {
+    "app/data/vector_store": int(os.getenv("ADKAR_PCA_DIM", "0")),
+    "app/data/change_planning_store": int(os.getenv("CHANGE_PLANNING_PCA_DIM", "0"))
+}
+
+# Embedding model and loaded stores are shared by every chain in the process
+_embeddings = None
+_embeddings_lock = threading.Lock()
+_vector_stores = {}
+_vector_stores_lock = threading.Lock()
+
+class _CachedStore:
+    """A loaded vector store together with the version it was loaded from."""
+
+    def __init__(self, vector_store, version):
+        self.vector_store = vector_store
+        self.version = version
+        self.checked_at = time.time()
+
+def get_embeddings():
+    """Return the process-wide embedding model, loading it on first use.
+    
+    The backend (torch or onnx) is chosen with EMBEDDING_BACKEND.
+    """
+    global _embeddings
+    if _embeddings is None:
+        with _embeddings_lock:
+            if _embeddings is None:
+                _embeddings = create_embeddings()
+    return _embeddings
+
 def load_processed_documents(file_path="app/data/processed_documents.json"):
     """Load previously processed documents from JSON."""
     if not os.path.exists(file_path):
@@ -34,46 +90,279 @@ def load_processed_documents(file_path="app/data/processed_documents.json"):
     
     return documents
 
-def create_vector_store(documents, save_path="app/data/vector_store"):
-    """Create and save a FAISS vector store from documents."""
+def get_current_version(store_path="app/data/vector_store"):
+    """Return the published version of a store, or None for the legacy flat layout."""
+    pointer = os.path.join(store_path, CURRENT_POINTER)
+    try:
+        with open(pointer, 'r') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def _resolve_store_dir(store_path, version):
+    """Directory holding a version's index files."""
+    if version is None:
+        return store_path
+    return os.path.join(store_path, VERSIONS_DIR, version)
+
+def publish_version(store_path, version):
+    """Atomically point the store at a fully written version."""
+    pointer = os.path.join(store_path, CURRENT_POINTER)
+    tmp_pointer = f"{pointer}.tmp-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    with open(tmp_pointer, 'w') as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_pointer, pointer)
+
+def collect_old_versions(store_path, keep=VECTOR_STORE_KEEP_VERSIONS):
+    """Delete all but the newest `keep` versions, never touching the current one.
+    
+    Older versions are kept for a while so processes that are still loading
+    them, or serving requests from them, are not affected.
+    """
+    versions_dir = os.path.join(store_path, VERSIONS_DIR)
+    if not os.path.isdir(versions_dir):
+        return []
+    
+    current = get_current_version(store_path)
+    versions = sorted(
+        name for name in os.listdir(versions_dir)
+        if not name.startswith(".") and os.path.isdir(os.path.join(versions_dir, name))
+    )
+    keep_set = set(versions[-keep:]) if keep > 0 else set()
+    if current:
+        keep_set.add(current)
+    
+    removed = []
+    for name in versions:
+        if name not in keep_set:
+            shutil.rmtree(os.path.join(versions_dir, name), ignore_errors=True)
+            removed.append(name)
+    
+    # Leftovers from builds that crashed before publishing
+    for name in os.listdir(versions_dir):
+        path = os.path.join(versions_dir, name)
+        if name.startswith(".building-") and time.time() - os.path.getmtime(path) > 3600:
+            shutil.rmtree(path, ignore_errors=True)
+    
+    if removed:
+        print(f"Removed old vector store versions from {store_path}: {', '.join(removed)}")
+    return removed
+
+def resolve_pca_dim(save_path, pca_dim=None):
+    """The projection dimension for a store: pca_dim, or the store's VECTOR_PCA_DIMS setting."""
+    if pca_dim is None:
+        pca_dim = VECTOR_PCA_DIMS.get(os.path.normpath(save_path), 0)
+    return pca_dim
+
+def project_index(index, dim):
+    """Reduce a flat index's vectors to `dim` dimensions with PCA fitted on its own chunks.
+    
+    Returns a FAISS IndexPreTransform (the PCA followed by a flat index of
+    projected vectors), or the index unchanged when no projection applies.
+    The projection is saved inside index.faiss, so queries are projected
+    the same way wherever the store is loaded, and search code keeps
+    passing full query embeddings. L2 distances between projected vectors
+    approximate the originals, so similarity scores stay on the same scale.
+    """
+    if dim <= 0 or dim >= index.d or isinstance(index, faiss.IndexPreTransform):
+        return index
+    if index.ntotal < dim:
+        print(f"Only {index.ntotal} chunks, too few to fit a {dim}-dim projection; keeping {index.d} dims")
+        return index
+    
+    vectors = index.reconstruct_n(0, index.ntotal)
+    pca = faiss.PCAMatrix(index.d, dim)
+    pca.train(vectors)
+    projected = faiss.IndexPreTransform(pca, faiss.IndexFlat(dim, index.metric_type))
+    projected.add(vectors)
+    print(f"Projected {index.ntotal} vectors from {index.d} to {dim} dims")
+    return projected
+
+def project_vector_store(vector_store, dim):
+    """Project a LangChain store's index in place; see project_index."""
+    vector_store.index = project_index(vector_store.index, dim)
+    return vector_store
+
+def create_vector_store(documents, save_path="app/data/vector_store", pca_dim=None, dedup_report=None):
+    """Create a FAISS vector store from documents and publish it as a new version.
+    
+    The index is written to a private build directory, renamed into place
+    and only then published, so readers never see a half-written index.
+    With the dedup report of the documents, the embedding time the removed
+    duplicates would have cost is estimated from the measured time.
+    """
     if not documents:
         print("No documents to create vector store. Please process documents first.")
         return None
     
-    # Using HuggingFace embeddings which are available offline
-    embeddings = HuggingFaceEmbeddings(
-        model_name="all-MiniLM-L6-v2",  # This is a small, efficient embedding model
-        model_kwargs={'device': 'cpu'},
-        encode_kwargs={'normalize_embeddings': True}
-    )
+    # Using local MiniLM embeddings which are available offline
+    embeddings = get_embeddings()
     
-    # Create and save the vector store
+    # Create the vector store (embedding every chunk) and save it as a new version
+    start_time = time.time()
     vector_store = FAISS.from_documents(documents, embeddings)
-    vector_store.save_local(save_path)
-    print(f"Vector store created and saved to {save_path}")
+    embed_seconds = time.time() - start_time
+    print(f"Embedded {len(documents)} chunks in {embed_seconds:.1f}s")
+    if dedup_report is not None:
+        from app.data.dedup import describe_savings, embed_seconds_saved
+        print(describe_savings(dedup_report, embed_seconds_saved(dedup_report, embed_seconds, len(documents))))
+    save_vector_store_version(vector_store, save_path, pca_dim)
     
     return vector_store
 
-def load_vector_store(load_path="app/data/vector_store"):
-    """Load a previously saved FAISS vector store."""
+def save_vector_store_version(vector_store, save_path="app/data/vector_store", pca_dim=None):
+    """Save a built vector store as a new version and publish it atomically.
+    
+    The vectors are first projected to pca_dim dimensions (by default the
+    store's VECTOR_PCA_DIMS setting). The version holds index.faiss and a
+    SQLite docstore of the chunks (no pickle).
+    """
+    project_vector_store(vector_store, resolve_pca_dim(save_path, pca_dim))
+    
+    version, build_dir = begin_version(save_path)
+    try:
+        faiss.write_index(vector_store.index, os.path.join(build_dir, INDEX_FILE))
+        write_docstore(os.path.join(build_dir, DOCSTORE_FILE), vector_store)
+    except Exception:
+        shutil.rmtree(build_dir, ignore_errors=True)
+        raise
+    return publish_build(save_path, version, build_dir)
+
+def begin_version(save_path="app/data/vector_store"):
+    """Create the private build directory for a new version; returns (version, build_dir)."""
+    version = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    build_dir = os.path.join(save_path, VERSIONS_DIR, f".building-{version}")
+    os.makedirs(build_dir)
+    return version, build_dir
+
+def publish_build(save_path, version, build_dir):
+    """Move a fully written build directory into place and publish it atomically."""
+    os.rename(build_dir, os.path.join(save_path, VERSIONS_DIR, version))
+    publish_version(save_path, version)
+    print(f"Vector store created and published to {save_path} (version {version})")
+    
+    # Swap the new version in for this process (reading chunks from disk,
+    # like every other process) and drop old versions
+    _store_in_cache(save_path, load_vector_store(save_path, version), version)
+    collect_old_versions(save_path)
+    
+    return version
+
+def load_vector_store(load_path="app/data/vector_store", version=None):
+    """Load a previously saved FAISS vector store.
+    
+    Loads the given version, or the currently published one. Only the FAISS
+    index is read into memory; chunk text and metadata stay in the
+    version's SQLite docstore and are read as searches return them. Stores
+    saved before versioning (index files directly in load_path) still load;
+    a pickled docstore (index.pkl) only with VECTOR_STORE_ALLOW_PICKLE.
+    """
     if not os.path.exists(load_path):
         print(f"No vector store found at {load_path}")
         return None
     
+    if version is None:
+        version = get_current_version(load_path)
+    store_dir = _resolve_store_dir(load_path, version)
+    
     # Use consistent embeddings when loading
-    embeddings = HuggingFaceEmbeddings(
-        model_name="all-MiniLM-L6-v2",
-        model_kwargs={'device': 'cpu'},
-        encode_kwargs={'normalize_embeddings': True}
-    )
+    vector_store = read_store_dir(store_dir, get_embeddings())
+    print(f"Vector store loaded from {store_dir}")
+    
+    return vector_store
+
+def read_store_dir(store_dir, embeddings, allow_pickle=None):
+    """Open the index files in one version directory.
+    
+    A pickled docstore is refused unless allow_pickle (by default
+    VECTOR_STORE_ALLOW_PICKLE) is set.
+    """
+    docstore_path = os.path.join(store_dir, DOCSTORE_FILE)
+    if os.path.exists(docstore_path):
+        docstore = SQLiteDocstore(docstore_path)
+        return FAISS(
+            embedding_function=embeddings,
+            index=faiss.read_index(os.path.join(store_dir, INDEX_FILE)),
+            docstore=docstore,
+            index_to_docstore_id=docstore.index_map()
+        )
+    
+    if allow_pickle is None:
+        allow_pickle = VECTOR_STORE_ALLOW_PICKLE
+    if not allow_pickle:
+        raise ValueError(
+            f"{store_dir} has no {DOCSTORE_FILE}. Convert its pickled docstore with "
+            f"python -m app.data.convert_store, or set VECTOR_STORE_ALLOW_PICKLE=true to load it as is."
+        )
+    print(f"Loading the pickled docstore in {store_dir} (legacy format)")
+    return FAISS.load_local(store_dir, embeddings, allow_dangerous_deserialization=True)
+
+def _store_in_cache(load_path, vector_store, version):
+    with _vector_stores_lock:
+        _vector_stores[os.path.abspath(load_path)] = _CachedStore(vector_store, version)
+
+def get_vector_store(load_path="app/data/vector_store"):
+    """Return the cached vector store, hot-swapping in newly published versions.
     
-    # Allow deserialization since we created this vector store ourselves
-    vector_store = FAISS.load_local(load_path, embeddings, allow_dangerous_deserialization=True)
-    print(f"Vector store loaded from {load_path}")
+    The published version is re-checked at most every
+    VECTOR_STORE_POLL_SECONDS. While a new version loads, other threads keep
+    getting the old store, and requests already holding it finish on it.
+    Returns None (without caching) if no store exists at the path yet.
+    """
+    key = os.path.abspath(load_path)
+    now = time.time()
     
+    with _vector_stores_lock:
+        entry = _vector_stores.get(key)
+        if entry is not None:
+            if now - entry.checked_at < VECTOR_STORE_POLL_SECONDS:
+                return entry.vector_store
+            # Claim this check so concurrent callers keep using the old store
+            entry.checked_at = now
+    
+    if entry is None:
+        with _vector_stores_lock:
+            entry = _vector_stores.get(key)
+            if entry is None:
+                version = get_current_version(load_path)
+                vector_store = load_vector_store(load_path, version)
+                if vector_store is not None:
+                    _vector_stores[key] = _CachedStore(vector_store, version)
+                return vector_store
+        return entry.vector_store
+    
+    version = get_current_version(load_path)
+    if version == entry.version:
+        return entry.vector_store
+    
+    try:
+        vector_store = load_vector_store(load_path, version)
+    except Exception as e:
+        print(f"Error loading vector store version {version}, keeping {entry.version}: {e}")
+        return entry.vector_store
+    if vector_store is None:
+        return entry.vector_store
+    
+    _store_in_cache(load_path, vector_store, version)
+    print(f"Hot-swapped vector store {load_path} to version {version}")
     return vector_store
 
+def refresh_vector_store_cache(load_path=None):
+    """Make the next use of cached stores re-check the published version now."""
+    with _vector_stores_lock:
+        if load_path is None:
+            entries = list(_vector_stores.values())
+        else:
+            entry = _vector_stores.get(os.path.abspath(load_path))
+            entries = [entry] if entry else []
+        for entry in entries:
+            entry.checked_at = 0.0
+
 if __name__ == "__main__":
+    from app.data.dedup import load_dedup_report
+    
     documents = load_processed_documents()
     if documents:
-        create_vector_store(documents) 
\ No newline at end of file
+        create_vector_store(documents, dedup_report=load_dedup_report("app/data/processed_documents.json"))
\ No newline at end of file
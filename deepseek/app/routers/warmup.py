@@ -1,7 +1,9 @@
 from fastapi import APIRouter, BackgroundTasks, Request
 from pydantic import BaseModel
 import logging
-import time
+
+from app.utils.initialize import warmup_models
+from app.utils.readiness import readiness, WARMING_UP, READY
 
 # Create a router instance
 router = APIRouter()
@@ -10,65 +12,31 @@ router = APIRouter()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# In-memory states
-warmup_state = {
-    "is_warmed_up": False,
-    "last_warmup": None,
-    "warming_up": False
-}
-
 class WarmupRequest(BaseModel):
     action: str = "warmup"
     force: bool = False
 
-# Global variable to access LLM (will be set later)
-llm = None
-
-def set_llm_instance(llm_instance):
-    """Set the LLM instance to use for warmup"""
-    global llm
-    llm = llm_instance
-    logger.info("LLM instance registered for warmup")
-
-def background_warmup():
-    """Background task to warm up the LLM"""
-    if warmup_state["warming_up"]:
-        logger.info("Warmup already in progress, skipping")
-        return
-    
-    warmup_state["warming_up"] = True
-    try:
-        logger.info("Starting LLM warmup")
-        start_time = time.time()
-        
-        # If we have access to the LLM, generate a simple response to warm it up
-        if llm:
-            # Run a simple query through the model to load it into memory
-            test_prompt = "Hello, this is a warmup prompt to initialize the model."
-            response = llm(test_prompt)
-            logger.info(f"Warmup response generated: {response[:50]}...")
-        else:
-            # Simulate warmup if we don't have direct access to the LLM
-            logger.info("No LLM instance available, simulating warmup")
-            time.sleep(2)  # Simulate loading time
-        
-        warmup_state["is_warmed_up"] = True
-        warmup_state["last_warmup"] = time.time()
-        
-        elapsed = time.time() - start_time
-        logger.info(f"LLM warmup completed in {elapsed:.2f} seconds")
-    except Exception as e:
-        logger.error(f"Error during warmup: {str(e)}")
-    finally:
-        warmup_state["warming_up"] = False
+def background_warmup(force=False):
+    """Background task to warm up the local models and indexes"""
+    logger.info("Starting local model warmup")
+    if warmup_models(force=force):
+        logger.info(f"Model warmup finished: {readiness.snapshot()['components']}")
+    else:
+        logger.error(f"Model warmup failed: {readiness.snapshot()['message']}")
 
 @router.post("/api/warmup")
 async def warmup(request: WarmupRequest, background_tasks: BackgroundTasks):
     """
-    Warmup endpoint to initialize the LLM model
+    Warmup endpoint to load the embedder and indexes without calling the LLM
     """
-    if request.force or not warmup_state["is_warmed_up"]:
-        background_tasks.add_task(background_warmup)
+    snapshot = readiness.snapshot()
+    if snapshot["status"] == WARMING_UP:
+        return {
+            "status": "warmup_in_progress",
+            "message": "Model warmup is already in progress"
+        }
+    if request.force or snapshot["status"] != READY:
+        background_tasks.add_task(background_warmup, request.force)
         return {
             "status": "warmup_initiated",
             "message": "Model warmup has been initiated in the background"
@@ -77,7 +45,7 @@ async def warmup(request: WarmupRequest, background_tasks: BackgroundTasks):
         return {
             "status": "already_warmed",
             "message": "Model is already warmed up",
-            "last_warmup": warmup_state["last_warmup"]
+            "last_warmup": snapshot["timestamp"]
         }
 
 @router.get("/api/warmup/status")
@@ -85,8 +53,11 @@ async def warmup_status():
     """
     Get the current warmup status
     """
+    snapshot = readiness.snapshot()
     return {
-        "is_warmed_up": warmup_state["is_warmed_up"],
-        "last_warmup": warmup_state["last_warmup"],
-        "warming_up": warmup_state["warming_up"]
-    } 
\ No newline at end of file
+        "is_warmed_up": snapshot["status"] == READY,
+        "last_warmup": snapshot["timestamp"],
+        "warming_up": snapshot["status"] == WARMING_UP,
+        "status": snapshot["status"],
+        "components": snapshot["components"]
+    }
@@ -0,0 +1,108 @@
+import os
+import json
+import threading
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Base URL of the running FastAPI backend
+ASSISTANT_API_URL = os.getenv("ASSISTANT_API_URL", "http://localhost:8000")
+# Times a dropped stream is resumed with Last-Event-ID before giving up
+STREAM_RECONNECTS = int(os.getenv("STREAM_RECONNECTS", "3"))
+# Key the backend lists in RATE_LIMIT_PROXY_KEYS, so each Streamlit session
+# (sent as X-Client-Id) is rate limited on its own
+ASSISTANT_API_KEY = os.getenv("ASSISTANT_API_KEY")
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """Return the process-wide HTTP client for calls to the backend."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = httpx.Client(timeout=httpx.Timeout(90.0, connect=10.0))
+    return _client
+
+def iter_sse_events(lines):
+    """Parse SSE lines into (event ID, decoded data) pairs."""
+    event_id = None
+    data = []
+    for line in lines:
+        if not line:
+            if data:
+                yield event_id, json.loads("\n".join(data))
+            event_id = None
+            data = []
+        elif line.startswith("id:"):
+            event_id = int(line[3:].strip())
+        elif line.startswith("data:"):
+            data.append(line[5:].strip())
+
+def client_headers(client_id=None):
+    """Identify this app, and the user it is asking for, to the backend's rate limits."""
+    headers = {}
+    if ASSISTANT_API_KEY:
+        headers["X-API-Key"] = ASSISTANT_API_KEY
+        if client_id:
+            headers["X-Client-Id"] = client_id
+    return headers
+
+def stream_answer(kind, payload, api_url=None, client_id=None):
+    """Yield the answer text for a chat or planning request, as the backend streams it.
+
+    Starts generation with a POST to /api/<kind>?stream=true, then reads
+    /api/<kind>/stream. A dropped connection is resumed after the last
+    event received, so the backend does not generate the answer again.
+    client_id names the user for the backend's per-client rate limits.
+    """
+    api_url = (api_url or ASSISTANT_API_URL).rstrip("/")
+    client = get_client()
+    response = client.post(f"{api_url}/api/{kind}", params={"stream": "true"}, json=payload,
+                           headers=client_headers(client_id))
+    response.raise_for_status()
+    request_id = response.json()["request_id"]
+
+    last_event_id = None
+    for attempt in range(STREAM_RECONNECTS + 1):
+        headers = {"Last-Event-ID": str(last_event_id)} if last_event_id else {}
+        try:
+            with client.stream(
+                "GET",
+                f"{api_url}/api/{kind}/stream",
+                params={"request_id": request_id, "stream": "true"},
+                headers=headers
+            ) as stream:
+                stream.raise_for_status()
+                for event_id, data in iter_sse_events(stream.iter_lines()):
+                    if event_id is not None:
+                        last_event_id = event_id
+                    if data.get("error"):
+                        raise RuntimeError(data["error"])
+                    if data.get("end"):
+                        return
+                    if data.get("text"):
+                        yield data["text"]
+        except httpx.TransportError as e:
+            print(f"Stream {request_id} interrupted ({e}), resuming after event {last_event_id}")
+    raise RuntimeError(f"Stream {request_id} ended before the answer was complete")
+
+def get_backend_status(api_url=None):
+    """Return the backend's warmup status, or None if it cannot be reached."""
+    api_url = (api_url or ASSISTANT_API_URL).rstrip("/")
+    try:
+        response = get_client().get(f"{api_url}/api/warmup/status", timeout=5.0)
+        response.raise_for_status()
+        return response.json()
+    except httpx.HTTPError:
+        return None
+
+def initialize_backend(api_url=None):
+    """Ask the backend to (re)build its indexes."""
+    api_url = (api_url or ASSISTANT_API_URL).rstrip("/")
+    response = get_client().post(f"{api_url}/api/initialize", timeout=600.0)
+    response.raise_for_status()
+    return response.json()
@@ -0,0 +1,206 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Retries after a transient upstream error, with full-jitter exponential backoff
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_MS = float(os.getenv("LLM_RETRY_BASE_MS", "500"))
+LLM_RETRY_MAX_MS = float(os.getenv("LLM_RETRY_MAX_MS", "4000"))
+# The circuit opens when at least LLM_BREAKER_ERROR_RATE of the last
+# LLM_BREAKER_WINDOW calls failed (once LLM_BREAKER_MIN_CALLS have been made)
+LLM_BREAKER_WINDOW = int(os.getenv("LLM_BREAKER_WINDOW", "20"))
+LLM_BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", "10"))
+LLM_BREAKER_ERROR_RATE = float(os.getenv("LLM_BREAKER_ERROR_RATE", "0.5"))
+# How long an open circuit fails fast before letting a probe request through
+LLM_BREAKER_OPEN_SECONDS = float(os.getenv("LLM_BREAKER_OPEN_SECONDS", "30"))
+
+# Upstream statuses worth retrying: timeouts, rate limits and server errors
+TRANSIENT_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504}
+
+class CircuitOpen(Exception):
+    """Raised instead of calling the upstream API while the circuit is open."""
+
+def is_transient(error: Exception) -> bool:
+    """Whether an error from the upstream API is likely to go away on retry."""
+    if isinstance(error, (httpx.TransportError, TimeoutError, ConnectionError)):
+        return True
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(error, "response", None), "status_code", None)
+    if status_code is not None:
+        return status_code in TRANSIENT_STATUS_CODES
+    # The OpenAI client wraps connection failures and timeouts without a status
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError")
+
+def backoff_delay(attempt: int, base: float = LLM_RETRY_BASE_MS / 1000.0, cap: float = LLM_RETRY_MAX_MS / 1000.0) -> float:
+    """Full-jitter delay in seconds before retry number attempt (from 0)."""
+    return random.uniform(0.0, min(cap, base * (2 ** attempt)))
+
+class CircuitBreaker:
+    """Retries transient upstream errors and fails fast while the upstream is down.
+
+    Outcomes of the last `window` calls are kept; when the error rate
+    reaches `error_rate` the circuit opens and calls raise CircuitOpen
+    without touching the network. After `open_seconds` a single probe is
+    let through: success closes the circuit, failure opens it again.
+    Only transient errors count as failures.
+
+    Every admitted call gets a ticket carrying the circuit's generation,
+    which advances whenever the circuit opens or closes. Only the probe's
+    outcome moves the circuit out of open; calls admitted in an earlier
+    generation (e.g. still running when it opened) are counted but change
+    nothing.
+    """
+
+    def __init__(self, max_retries: int = LLM_MAX_RETRIES, window: int = LLM_BREAKER_WINDOW,
+                 min_calls: int = LLM_BREAKER_MIN_CALLS, error_rate: float = LLM_BREAKER_ERROR_RATE,
+                 open_seconds: float = LLM_BREAKER_OPEN_SECONDS):
+        self.max_retries = max_retries
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.open_seconds = open_seconds
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = None
+        self._generation = 0
+        self._probing = False
+        self.stats = {"calls": 0, "failures": 0, "retries": 0, "short_circuited": 0, "opened": 0, "fallbacks": 0}
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state_locked()
+
+    def _state_locked(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.open_seconds:
+            return "half_open"
+        return "open"
+
+    def is_open(self) -> bool:
+        """Whether a call now would be refused (without taking the half-open probe)."""
+        with self._lock:
+            state = self._state_locked()
+            return state == "open" or (state == "half_open" and self._probing)
+
+    def before_call(self):
+        """Admit a call and return its ticket for record(), or raise CircuitOpen."""
+        with self._lock:
+            state = self._state_locked()
+            if state == "open" or (state == "half_open" and self._probing):
+                self.stats["short_circuited"] += 1
+                raise CircuitOpen("The assistant's language model is temporarily unavailable")
+            probe = state == "half_open"
+            if probe:
+                self._probing = True
+            self.stats["calls"] += 1
+            return (self._generation, probe)
+
+    def record(self, ticket, success):
+        """Record the outcome of the call admitted with ticket.
+
+        success is True, False (transient failure) or None (not the
+        upstream's fault).
+        """
+        generation, probe = ticket
+        with self._lock:
+            if success is False:
+                self.stats["failures"] += 1
+            if generation != self._generation:
+                # Admitted before the circuit last opened or closed; it says nothing about now
+                return
+            if probe:
+                # The probe decides the circuit on its own
+                self._probing = False
+                if success:
+                    self._generation += 1
+                    self._opened_at = None
+                    self._outcomes.clear()
+                    print("LLM circuit closed")
+                elif success is False:
+                    self._open_locked()
+                return
+            if success is None:
+                return
+            self._outcomes.append(success)
+            failures = self._outcomes.count(False)
+            if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.error_rate:
+                self._open_locked()
+
+    def _open_locked(self):
+        self._generation += 1
+        self._opened_at = time.monotonic()
+        self.stats["opened"] += 1
+        print(f"LLM circuit opened for {self.open_seconds:.0f}s")
+
+    def _retry_or_raise(self, ticket, error: Exception, attempt: int, started: bool = False):
+        """Record a failed attempt, then sleep before a retry or re-raise."""
+        transient = is_transient(error)
+        self.record(ticket, False if transient else None)
+        if started or not transient or attempt >= self.max_retries:
+            raise error
+        delay = backoff_delay(attempt)
+        with self._lock:
+            self.stats["retries"] += 1
+        print(f"Transient LLM error ({error}), retrying in {delay:.2f}s")
+        time.sleep(delay)
+
+    def call(self, fn):
+        """Call fn(), retrying transient errors."""
+        for attempt in range(self.max_retries + 1):
+            ticket = self.before_call()
+            try:
+                result = fn()
+            except Exception as e:
+                self._retry_or_raise(ticket, e, attempt)
+                continue
+            self.record(ticket, True)
+            return result
+
+    def stream(self, start):
+        """Yield from start(), retrying transient errors until the first chunk has been yielded."""
+        for attempt in range(self.max_retries + 1):
+            ticket = self.before_call()
+            started = False
+            recorded = False
+            chunks = None
+            try:
+                # Inside the try, so a start() that fails at once still records its ticket
+                chunks = start()
+                for chunk in chunks:
+                    started = True
+                    yield chunk
+                recorded = True
+                self.record(ticket, True)
+                return
+            except Exception as e:
+                recorded = True
+                self._retry_or_raise(ticket, e, attempt, started)
+            finally:
+                if not recorded:
+                    # The reader stopped early (e.g. a cancelled stream); release a half-open probe
+                    self.record(ticket, None)
+                if chunks is not None and hasattr(chunks, "close"):
+                    chunks.close()
+
+    def record_fallback(self):
+        with self._lock:
+            self.stats["fallbacks"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["state"] = self._state_locked()
+            stats["recent_error_rate"] = round(self._outcomes.count(False) / len(self._outcomes), 4) if self._outcomes else 0.0
+        return stats
+
+# Process-wide breaker for DeepSeek calls made by the chains
+llm_breaker = CircuitBreaker()
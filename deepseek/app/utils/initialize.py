@@ -10,13 +10,22 @@ if sys.platform == 'darwin':  # macOS
     if not isinstance(asyncio.get_event_loop_policy(), asyncio.DefaultEventLoopPolicy):
         asyncio.set_event_loop_policy(asyncio.DefaultEventLoopPolicy())
 
-# Global variables to track warm-up status
-warmup_status = {
-    "is_warming_up": False,
-    "is_warm": False,
-    "timestamp": None,
-    "error": None
-}
+from app.utils.readiness import readiness, WARMING_UP, READY, ERROR
+
+ADKAR_STORE_PATH = "app/data/vector_store"
+CHANGE_PLANNING_STORE_PATH = "app/data/change_planning_store"
+
+# Build indexes with the bounded-memory page -> chunk -> batch pipeline
+STREAMING_INGESTION = os.getenv("STREAMING_INGESTION", "false").lower() in ("1", "true", "yes")
+
+def run_streaming_ingestion(corpus):
+    """Ingest a corpus with app.data.ingest in a subprocess."""
+    try:
+        subprocess.run([sys.executable, "-m", "app.data.ingest", "--corpus", corpus], check=True)
+        return True
+    except subprocess.CalledProcessError as e:
+        print(f"❌ Error during streaming ingestion of {corpus}: {e}")
+        return False
 
 def check_environment():
     """Check if the environment is properly configured."""
@@ -50,6 +59,10 @@ def create_resources_directory():
 
 def initialize_adkar_data():
     """Initialize ADKAR data processing and vector store creation."""
+    if STREAMING_INGESTION:
+        print("📊 Streaming ADKAR documents into the vector store...")
+        return run_streaming_ingestion("adkar")
+    
     # Process documents
     print("📊 Processing ADKAR documents...")
     try:
@@ -70,6 +83,10 @@ def initialize_adkar_data():
 
 def initialize_change_planning_data():
     """Initialize change planning data processing and vector store creation."""
+    if STREAMING_INGESTION:
+        print("📊 Streaming change planning documents into the vector store...")
+        return run_streaming_ingestion("change_planning")
+    
     # Process change planning documents
     print("📊 Processing change planning documents...")
     try:
@@ -96,7 +113,9 @@ def initialize_change_planning_data():
                     docs.append(doc)
             
             # Create the vector store with a different path
-            create_vector_store(docs, save_path="app/data/change_planning_store")
+            from app.data.dedup import load_dedup_report
+            create_vector_store(docs, save_path=CHANGE_PLANNING_STORE_PATH,
+                                dedup_report=load_dedup_report("app/data/change_planning_documents.json"))
             return True
         else:
             print("⚠️ No processed change planning documents found. Unable to create vector store.")
@@ -108,65 +127,102 @@ def initialize_change_planning_data():
         print(f"❌ Error creating change planning vector store: {e}")
         return False
 
-def warmup_models():
-    """Pre-warm the models by loading them into memory and making a test query."""
-    global warmup_status
+# Dummy queries used to exercise the embedder and indexes during warmup
+WARMUP_QUERIES = [
+    "warmup",
+    "How do I support my team through a new process change?",
+    "What are the risks and benefits of implementing a new quality system in pharmaceutical manufacturing?"
+]
+
+def _warm_component(name, func):
+    """Run one warmup step, recording its timing in the readiness state."""
+    start_time = time.time()
+    try:
+        func()
+    except Exception as e:
+        readiness.record_component(name, time.time() - start_time, error=str(e))
+        print(f"⚠️ Warmup of {name} failed: {e}")
+        return False
+    readiness.record_component(name, time.time() - start_time)
+    print(f"✅ Warmed up {name} in {time.time() - start_time:.2f}s")
+    return True
+
+def _warm_embeddings():
+    """Load the embedding model and JIT-prime torch with a few dummy encodes."""
+    from app.models.vector_store import get_embeddings
     
-    print("🔥 Pre-warming models...")
-    warmup_status["is_warming_up"] = True
+    embeddings = get_embeddings()
+    # Different sequence lengths make torch allocate and cache its kernels now
+    for query in WARMUP_QUERIES:
+        embeddings.embed_query(query)
+    embeddings.embed_documents(WARMUP_QUERIES)
+
+def _warm_index(store_path):
+    """Load a vector store into the process cache and run a dummy search."""
+    from app.models.vector_store import get_vector_store
+    
+    vector_store = get_vector_store(store_path)
+    if vector_store is None:
+        raise ValueError(f"Vector store not found at {store_path}")
+    vector_store.similarity_search(WARMUP_QUERIES[-1], k=1)
+
+def _warm_upstream():
+    """Open the pooled DeepSeek connection without generating tokens."""
+    from app.models.llm import warm_upstream_connection
+    
+    warm_upstream_connection()
+
+def warmup_models(force=False):
+    """Pre-warm everything a first query needs, without calling the LLM.
+    
+    Loads the embedding model and both indexes, runs dummy searches and
+    opens the pooled upstream connection. No tokens are generated.
+    """
+    if not readiness.begin(force=force):
+        print("⏳ Warmup already in progress or models already warm, skipping.")
+        return readiness.status != ERROR
     
+    print("🔥 Pre-warming models...")
     try:
-        # Import here to avoid circular imports
-        from app.models.rag_chain import create_rag_chain
-        from app.models.change_planning_chain import create_change_planning_chain
-        
-        # Warm up regular chat model
-        print("🤖 Warming up RAG chat model...")
-        rag_chain = create_rag_chain(streaming=False)
-        test_result = rag_chain.invoke("This is a test query to warm up the model.")
-        print(f"✅ RAG chat model warmed up successfully! (Response length: {len(test_result)})")
+        embeddings_ok = _warm_component("embeddings", _warm_embeddings)
+        adkar_ok = _warm_component("adkar_index", lambda: _warm_index(ADKAR_STORE_PATH))
+        planning_ok = _warm_component("change_planning_index", lambda: _warm_index(CHANGE_PLANNING_STORE_PATH))
+        # A cold connection only costs latency, so it does not block readiness
+        _warm_component("upstream_connection", _warm_upstream)
         
-        # Warm up planning model
-        print("📋 Warming up planning model...")
-        planning_chain = create_change_planning_chain(streaming=False)
-        test_result = planning_chain.invoke("This is a test query to warm up the planning model.")
-        print(f"✅ Planning model warmed up successfully! (Response length: {len(test_result)})")
-        
-        # Update status
-        warmup_status["is_warm"] = True
-        warmup_status["timestamp"] = time.time()
-        warmup_status["error"] = None
+        if not embeddings_ok:
+            readiness.finish(error="Error warming up models: embedding model failed to load")
+            return False
+        if not (adkar_ok or planning_ok):
+            readiness.finish(error="Error warming up models: no vector store could be loaded")
+            return False
         
+        readiness.finish()
         print("🚀 Models are ready for use!")
         return True
-        
     except Exception as e:
         error_msg = f"Error warming up models: {str(e)}"
         print(f"❌ {error_msg}")
-        warmup_status["error"] = error_msg
+        readiness.finish(error=error_msg)
         return False
-    finally:
-        warmup_status["is_warming_up"] = False
 
 def initialize_system(warmup_only=False):
     """Initialize the complete RAG system."""
-    global warmup_status
-    
     print("🚀 Initializing Change Management RAG Systems...")
     
-    # Check environment
+    # Generation needs the DeepSeek key; building indexes, warmup and search do not
     if not check_environment():
-        return False
+        print("⚠️ Continuing without DeepSeek: only retrieval endpoints such as /api/search will work")
     
     # If only warming up models
     if warmup_only:
         # If already warming up, don't start again
-        if warmup_status["is_warming_up"]:
+        if readiness.status == WARMING_UP:
             print("⏳ Models are already being warmed up. Please wait...")
             return True
         
         # If already warm, just return success
-        if warmup_status["is_warm"]:
+        if readiness.status == READY:
             print("✓ Models are already warm and ready!")
             return True
         
@@ -196,7 +252,10 @@ def initialize_system(warmup_only=False):
     
     # Warm up models if at least one system was initialized successfully
     if adkar_success or planning_success:
-        warmup_models()
+        # The ADKAR store is rebuilt in a subprocess, so pick up its new version now
+        from app.models.vector_store import refresh_vector_store_cache
+        refresh_vector_store_cache()
+        warmup_models(force=True)
     
     # Overall status
     if adkar_success or planning_success:
@@ -207,19 +266,8 @@ def initialize_system(warmup_only=False):
         return False
 
 def get_warmup_status():
-    """Return the current warmup status."""
-    global warmup_status
-    
-    if warmup_status["error"]:
-        return {"status": "error", "message": warmup_status["error"]}
-    elif warmup_status["is_warming_up"]:
-        return {"status": "warming_up", "message": "Models are being warmed up"}
-    elif warmup_status["is_warm"]:
-        timestamp = warmup_status["timestamp"]
-        time_str = time.strftime("%H:%M:%S", time.localtime(timestamp)) if timestamp else "unknown"
-        return {"status": "ready", "message": f"Models are warm and ready (since {time_str})"}
-    else:
-        return {"status": "not_started", "message": "Model warmup has not been initiated"}
+    """Return the current warmup status, including per-component timings."""
+    return readiness.snapshot()
 
 if __name__ == "__main__":
     initialize_system() 
\ No newline at end of file
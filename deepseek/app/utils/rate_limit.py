@@ -0,0 +1,116 @@
+import os
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Sustained requests per minute and burst size for each client, per endpoint
+# (a rate of 0 turns the limit off)
+RATE_LIMITS = {
+    "chat": (
+        float(os.getenv("RATE_LIMIT_CHAT_PER_MINUTE", "20")),
+        int(os.getenv("RATE_LIMIT_CHAT_BURST", "5"))
+    ),
+    "planning": (
+        float(os.getenv("RATE_LIMIT_PLANNING_PER_MINUTE", "30")),
+        int(os.getenv("RATE_LIMIT_PLANNING_BURST", "10"))
+    ),
+    "search": (
+        float(os.getenv("RATE_LIMIT_SEARCH_PER_MINUTE", "120")),
+        int(os.getenv("RATE_LIMIT_SEARCH_BURST", "20"))
+    )
+}
+# Clients tracked at once; the least recently seen are forgotten first
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "10000"))
+
+def _hash_key(api_key):
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+def _parse_keys(value):
+    return {_hash_key(key.strip()) for key in value.split(",") if key.strip()}
+
+# Comma-separated API keys that get their own bucket when sent in
+# X-API-Key; any other key is ignored and the client is limited by address
+RATE_LIMIT_API_KEYS = _parse_keys(os.getenv("RATE_LIMIT_API_KEYS", ""))
+# Keys of trusted front ends (such as the Streamlit app, which sends
+# ASSISTANT_API_KEY) that name their own user in X-Client-Id; each user
+# then gets a bucket instead of sharing the front end's address
+RATE_LIMIT_PROXY_KEYS = _parse_keys(os.getenv("RATE_LIMIT_PROXY_KEYS", ""))
+
+def client_key(api_key, host, client_id=None, api_keys=None, proxy_keys=None):
+    """Identify a client by a configured API key when it sends one, otherwise by address.
+
+    Unknown keys are not trusted, so a caller cannot get fresh buckets (or
+    push real clients out of the tracked set) by inventing keys. Requests
+    with a proxy key are identified by the end user the front end names.
+    Keys are hashed so they are never held or reported in clear text.
+    """
+    api_keys = RATE_LIMIT_API_KEYS if api_keys is None else api_keys
+    proxy_keys = RATE_LIMIT_PROXY_KEYS if proxy_keys is None else proxy_keys
+    if api_key:
+        hashed = _hash_key(api_key)
+        if hashed in proxy_keys:
+            return f"key:{hashed[:16]}:client:{(client_id or 'unknown')[:64]}"
+        if hashed in api_keys:
+            return "key:" + hashed[:16]
+    return f"ip:{host or 'unknown'}"
+
+class TokenBucketLimiter:
+    """Token buckets per client and endpoint, with per-client usage counters.
+
+    Each bucket holds up to `burst` tokens and refills continuously at the
+    endpoint's rate; a request takes one token. State for at most
+    max_clients clients is kept, evicting the least recently seen.
+    """
+
+    def __init__(self, limits: Dict[str, Tuple[float, int]] = RATE_LIMITS, max_clients: int = RATE_LIMIT_MAX_CLIENTS):
+        self.limits = limits
+        self.max_clients = max_clients
+        self._clients: "OrderedDict[str, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, key: str, kind: str) -> Tuple[bool, float]:
+        """Take a token for the client. Returns (allowed, seconds until one is available)."""
+        per_minute, burst = self.limits[kind]
+        now = time.monotonic()
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = self._clients[key] = {"buckets": {}, "usage": {}}
+                while len(self._clients) > self.max_clients:
+                    self._clients.popitem(last=False)
+            self._clients.move_to_end(key)
+            usage = client["usage"].setdefault(kind, {"allowed": 0, "limited": 0})
+
+            if per_minute <= 0:
+                usage["allowed"] += 1
+                return True, 0.0
+
+            rate = per_minute / 60.0
+            tokens, updated = client["buckets"].get(kind, (float(burst), now))
+            tokens = min(float(burst), tokens + (now - updated) * rate)
+            if tokens >= 1.0:
+                client["buckets"][kind] = (tokens - 1.0, now)
+                usage["allowed"] += 1
+                return True, 0.0
+            client["buckets"][kind] = (tokens, now)
+            usage["limited"] += 1
+            return False, (1.0 - tokens) / rate
+
+    def usage(self, top: int = 50):
+        """Request counters for the busiest tracked clients."""
+        with self._lock:
+            clients = [(key, {kind: dict(counts) for kind, counts in client["usage"].items()})
+                       for key, client in self._clients.items()]
+        clients.sort(key=lambda item: -sum(counts["allowed"] + counts["limited"] for counts in item[1].values()))
+        return {
+            "tracked_clients": len(clients),
+            "clients": [{"client": key, "usage": usage} for key, usage in clients[:top]]
+        }
+
+rate_limiter = TokenBucketLimiter()
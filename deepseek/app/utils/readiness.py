@@ -0,0 +1,94 @@
+import threading
+import time
+
+# Readiness states, in the order a healthy warmup moves through them
+NOT_STARTED = "not_started"
+WARMING_UP = "warming_up"
+READY = "ready"
+ERROR = "error"
+
+class ReadinessState:
+    """Thread-safe readiness state machine for model warmup.
+
+    Transitions are not_started/ready/error -> warming_up -> ready/error.
+    Only one warmup can hold the warming_up state at a time, and each
+    warmed component records how long it took.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._status = NOT_STARTED
+        self._error = None
+        self._started_at = None
+        self._finished_at = None
+        self._ready_at = None
+        self._components = {}
+
+    def begin(self, force=False):
+        """Move to warming_up. Returns False if a warmup should not start."""
+        with self._lock:
+            if self._status == WARMING_UP:
+                return False
+            if self._status == READY and not force:
+                return False
+            self._status = WARMING_UP
+            self._error = None
+            self._started_at = time.time()
+            self._finished_at = None
+            self._components = {}
+            return True
+
+    def record_component(self, name, seconds, error=None):
+        """Record the timing (and failure, if any) of one warmed component."""
+        with self._lock:
+            self._components[name] = {
+                "seconds": round(seconds, 4),
+                "ok": error is None,
+                "error": error
+            }
+
+    def finish(self, error=None):
+        """Leave warming_up, moving to ready or error."""
+        with self._lock:
+            self._finished_at = time.time()
+            if error:
+                self._status = ERROR
+                self._error = error
+            else:
+                self._status = READY
+                self._error = None
+                self._ready_at = self._finished_at
+
+    @property
+    def status(self):
+        with self._lock:
+            return self._status
+
+    def snapshot(self):
+        """Return a consistent copy of the current state for the status endpoints."""
+        with self._lock:
+            if self._status == ERROR:
+                message = self._error
+            elif self._status == WARMING_UP:
+                message = "Models are being warmed up"
+            elif self._status == READY:
+                time_str = time.strftime("%H:%M:%S", time.localtime(self._ready_at))
+                message = f"Models are warm and ready (since {time_str})"
+            else:
+                message = "Model warmup has not been initiated"
+
+            duration = None
+            if self._started_at is not None:
+                end = self._finished_at or time.time()
+                duration = round(max(end - self._started_at, 0.0), 4)
+
+            return {
+                "status": self._status,
+                "message": message,
+                "timestamp": self._ready_at,
+                "duration": duration,
+                "components": {name: dict(info) for name, info in self._components.items()}
+            }
+
+# Single readiness state shared by every warmup entry point in the process
+readiness = ReadinessState()
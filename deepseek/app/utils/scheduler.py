@@ -0,0 +1,111 @@
+import os
+import contextvars
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Answers generated at once across chat and planning
+LLM_MAX_CONCURRENT = int(os.getenv("LLM_MAX_CONCURRENT", "8"))
+# Requests allowed to wait for a free slot before new ones are turned away
+LLM_MAX_QUEUED = int(os.getenv("LLM_MAX_QUEUED", "64"))
+# Relative share of generation slots when both kinds are waiting
+LLM_WEIGHTS = {
+    "chat": float(os.getenv("LLM_WEIGHT_CHAT", "1")),
+    "planning": float(os.getenv("LLM_WEIGHT_PLANNING", "3"))
+}
+
+# Set while the current request holds a slot; LangChain copies context into
+# the threads it runs chain steps on, so those steps see it too
+_holding_slot = contextvars.ContextVar("holding_generation_slot", default=False)
+
+class SchedulerBusy(Exception):
+    """Raised when the generation queue is full."""
+
+class WeightedFairScheduler:
+    """Weighted fair queuing of LLM generations across request kinds.
+
+    Each waiting request gets a virtual finish tag of
+    max(virtual time, its kind's last tag) + 1 / weight, and free slots go
+    to the smallest tag. While both kinds are waiting, planning (weight 3)
+    is served three times as often as chat (weight 1); a kind with nothing
+    waiting does not bank credit for later.
+    """
+
+    def __init__(self, max_concurrent: int = LLM_MAX_CONCURRENT, weights: Dict[str, float] = LLM_WEIGHTS,
+                 max_queued: int = LLM_MAX_QUEUED):
+        self.max_concurrent = max_concurrent
+        self.weights = weights
+        self.max_queued = max_queued
+        self._cond = threading.Condition()
+        self._queue = []
+        self._sequence = itertools.count()
+        self._active = 0
+        self._virtual_time = 0.0
+        self._last_tag = {kind: 0.0 for kind in weights}
+        self.stats = {kind: {"started": 0, "rejected": 0, "wait_seconds": 0.0} for kind in weights}
+
+    def acquire(self, kind: str):
+        """Block until a generation slot is granted to this request."""
+        start = time.monotonic()
+        with self._cond:
+            if len(self._queue) >= self.max_queued:
+                self.stats[kind]["rejected"] += 1
+                raise SchedulerBusy("Too many requests are waiting for the assistant; please retry shortly")
+
+            tag = max(self._virtual_time, self._last_tag[kind]) + 1.0 / self.weights[kind]
+            self._last_tag[kind] = tag
+            ticket = (tag, next(self._sequence))
+            heapq.heappush(self._queue, ticket)
+            while self._active >= self.max_concurrent or self._queue[0] != ticket:
+                self._cond.wait()
+
+            heapq.heappop(self._queue)
+            self._active += 1
+            self._virtual_time = tag
+            self.stats[kind]["started"] += 1
+            self.stats[kind]["wait_seconds"] += time.monotonic() - start
+            # The next ticket may be able to start too
+            self._cond.notify_all()
+
+    def release(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, kind: str):
+        """Hold a generation slot for the block.
+
+        Extra model calls made while answering (e.g. condensing the
+        question inside the chain) share the answer's slot instead of
+        queueing behind it.
+        """
+        if _holding_slot.get():
+            yield
+            return
+        self.acquire(kind)
+        token = _holding_slot.set(True)
+        try:
+            yield
+        finally:
+            _holding_slot.reset(token)
+            self.release()
+
+    def snapshot(self):
+        with self._cond:
+            return {
+                "active": self._active,
+                "queued": len(self._queue),
+                "max_concurrent": self.max_concurrent,
+                "kinds": {kind: dict(stats, wait_seconds=round(stats["wait_seconds"], 3))
+                          for kind, stats in self.stats.items()}
+            }
+
+generation_scheduler = WeightedFairScheduler()
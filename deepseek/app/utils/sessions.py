@@ -0,0 +1,165 @@
+import os
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+
+from app.utils.stream_bus import STREAM_BUS_BACKEND
+
+load_dotenv()
+
+# "memory" keeps sessions inside one process; "sqlite" shares them between
+# workers. Defaults to whatever the stream bus uses.
+SESSION_STORE_BACKEND = os.getenv("SESSION_STORE_BACKEND", STREAM_BUS_BACKEND)
+SESSION_STORE_PATH = os.getenv("SESSION_STORE_PATH", "app/data/sessions.sqlite3")
+
+# Sessions idle for longer than this are forgotten
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "3600"))
+# Upper bound on sessions held by the in-process store
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "5000"))
+
+def new_session_state() -> Dict[str, Any]:
+    """An empty conversation: a rolling summary plus recent verbatim turns."""
+    return {"summary": "", "turns": []}
+
+class InProcessSessionStore:
+    """Session states kept in this process, least recently used evicted first."""
+
+    def __init__(self, ttl_seconds: float = SESSION_TTL_SECONDS, max_sessions: int = SESSION_MAX_SESSIONS):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a copy of the session state, or None if unknown or expired."""
+        with self._lock:
+            entry = self._sessions.get(key)
+            if entry is None:
+                return None
+            updated_at, state = entry
+            if updated_at < time.time() - self.ttl_seconds:
+                del self._sessions[key]
+                return None
+            self._sessions.move_to_end(key)
+            return json.loads(state)
+
+    def put(self, key: str, state: Dict[str, Any]):
+        with self._lock:
+            self._sessions[key] = (time.time(), json.dumps(state))
+            self._sessions.move_to_end(key)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def update(self, key: str, fn) -> Dict[str, Any]:
+        """Atomically replace a session's state with fn(state) and return it.
+
+        Runs under the store's lock, so fn must be quick (no model calls).
+        """
+        with self._lock:
+            entry = self._sessions.get(key)
+            if entry is not None and entry[0] >= time.time() - self.ttl_seconds:
+                state = json.loads(entry[1])
+            else:
+                state = new_session_state()
+            state = fn(state)
+            self._sessions[key] = (time.time(), json.dumps(state))
+            self._sessions.move_to_end(key)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return state
+
+    def delete(self, key: str):
+        with self._lock:
+            self._sessions.pop(key, None)
+
+class SQLiteSessionStore:
+    """Session states shared between processes through a SQLite file."""
+
+    def __init__(self, path: str = SESSION_STORE_PATH, ttl_seconds: float = SESSION_TTL_SECONDS):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._connection().execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_key TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        row = self._connection().execute(
+            "SELECT state FROM sessions WHERE session_key = ? AND updated_at >= ?",
+            (key, time.time() - self.ttl_seconds)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key: str, state: Dict[str, Any]):
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions (session_key, state, updated_at) VALUES (?, ?, ?)",
+            (key, json.dumps(state), time.time())
+        )
+        conn.execute("DELETE FROM sessions WHERE updated_at < ?", (time.time() - self.ttl_seconds,))
+
+    def update(self, key: str, fn) -> Dict[str, Any]:
+        """Atomically replace a session's state with fn(state) and return it.
+
+        The read and write share one write transaction, so updates from
+        other workers wait for it; fn must be quick (no model calls).
+        """
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT state FROM sessions WHERE session_key = ? AND updated_at >= ?",
+                (key, time.time() - self.ttl_seconds)
+            ).fetchone()
+            state = fn(json.loads(row[0]) if row else new_session_state())
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_key, state, updated_at) VALUES (?, ?, ?)",
+                (key, json.dumps(state), time.time())
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return state
+
+    def delete(self, key: str):
+        self._connection().execute("DELETE FROM sessions WHERE session_key = ?", (key,))
+
+_session_store = None
+_session_store_lock = threading.Lock()
+
+def get_session_store():
+    """Return the process-wide session store for the configured backend."""
+    global _session_store
+    if _session_store is None:
+        with _session_store_lock:
+            if _session_store is None:
+                if SESSION_STORE_BACKEND == "memory":
+                    _session_store = InProcessSessionStore()
+                elif SESSION_STORE_BACKEND == "sqlite":
+                    _session_store = SQLiteSessionStore()
+                else:
+                    raise ValueError(f"Unknown SESSION_STORE_BACKEND: {SESSION_STORE_BACKEND}")
+    return _session_store
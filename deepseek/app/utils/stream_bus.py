@@ -0,0 +1,302 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# "memory" keeps streams inside one process; "sqlite" shares them between
+# uvicorn workers (or replicas on one host) through a WAL-mode database file
+STREAM_BUS_BACKEND = os.getenv("STREAM_BUS_BACKEND", "memory")
+STREAM_BUS_PATH = os.getenv("STREAM_BUS_PATH", "app/data/stream_bus.sqlite3")
+
+# Streams nobody reads are dropped after this many seconds
+STREAM_TTL_SECONDS = float(os.getenv("STREAM_TTL_SECONDS", "600"))
+# Finished streams stay available for replay this long, so a client that
+# drops mid-answer can reconnect with Last-Event-ID instead of regenerating
+STREAM_REPLAY_GRACE_SECONDS = float(os.getenv("STREAM_REPLAY_GRACE_SECONDS", "120"))
+# Most recent frames kept per stream for replay
+STREAM_REPLAY_MAX_FRAMES = int(os.getenv("STREAM_REPLAY_MAX_FRAMES", "2000"))
+# Generation is cancelled once a stream has had no reader for this long
+# (long enough for a dropped client to reconnect and resume)
+STREAM_CANCEL_GRACE_SECONDS = float(os.getenv("STREAM_CANCEL_GRACE_SECONDS", "10"))
+
+class _Stream:
+    """Frames of one in-process stream, numbered from 1."""
+
+    def __init__(self, max_frames: int):
+        self.frames = deque(maxlen=max_frames)
+        self.last_event_id = 0
+        self.created_at = time.time()
+        self.finished_at = None
+        self.readers = 0
+        # A stream nobody has attached to yet counts as detached since it was created
+        self.detached_at = self.created_at
+
+class InProcessStreamBus:
+    """Stream transport backed by per-request replay buffers in this process."""
+
+    def __init__(self, ttl_seconds: float = STREAM_TTL_SECONDS,
+                 grace_seconds: float = STREAM_REPLAY_GRACE_SECONDS,
+                 max_frames: int = STREAM_REPLAY_MAX_FRAMES):
+        self.ttl_seconds = ttl_seconds
+        self.grace_seconds = grace_seconds
+        self.max_frames = max_frames
+        self._streams: Dict[str, _Stream] = {}
+        self._lock = threading.Lock()
+
+    def open(self, request_id: str):
+        """Make sure a stream exists for the request."""
+        with self._lock:
+            self._expire_stale()
+            if request_id not in self._streams:
+                self._streams[request_id] = _Stream(self.max_frames)
+
+    def exists(self, request_id: str) -> bool:
+        with self._lock:
+            self._expire_stale()
+            return request_id in self._streams
+
+    def publish(self, request_id: str, message: str):
+        """Append an SSE frame to the request's stream and give it the next event ID."""
+        with self._lock:
+            stream = self._streams.get(request_id)
+            if stream is None:
+                stream = self._streams[request_id] = _Stream(self.max_frames)
+            stream.last_event_id += 1
+            stream.frames.append((stream.last_event_id, message))
+
+    def read(self, request_id: str, after_id: int = 0) -> List[Tuple[int, str]]:
+        """Return the (event ID, frame) pairs published after after_id, oldest first."""
+        with self._lock:
+            stream = self._streams.get(request_id)
+            if stream is None:
+                return []
+            return [(event_id, message) for event_id, message in stream.frames if event_id > after_id]
+
+    def finish(self, request_id: str):
+        """Mark the stream complete; it stays readable for the replay grace period."""
+        with self._lock:
+            stream = self._streams.get(request_id)
+            if stream is not None and stream.finished_at is None:
+                stream.finished_at = time.time()
+
+    def is_finished(self, request_id: str) -> bool:
+        with self._lock:
+            stream = self._streams.get(request_id)
+            return stream is not None and stream.finished_at is not None
+
+    def attach(self, request_id: str):
+        """Record that a client is reading the stream."""
+        with self._lock:
+            stream = self._streams.get(request_id)
+            if stream is not None:
+                stream.readers += 1
+                stream.detached_at = None
+
+    def detach(self, request_id: str):
+        """Record that a reader went away."""
+        with self._lock:
+            stream = self._streams.get(request_id)
+            if stream is not None:
+                stream.readers = max(stream.readers - 1, 0)
+                if stream.readers == 0:
+                    stream.detached_at = time.time()
+
+    def is_abandoned(self, request_id: str, grace_seconds: float = STREAM_CANCEL_GRACE_SECONDS) -> bool:
+        """Whether the stream has had no reader for grace_seconds, counting from its creation if nobody ever attached."""
+        with self._lock:
+            stream = self._streams.get(request_id)
+            if stream is None:
+                return True
+            return stream.readers == 0 and stream.detached_at is not None \
+                and time.time() - stream.detached_at >= grace_seconds
+
+    def close(self, request_id: str):
+        """Discard the stream and its replay buffer."""
+        with self._lock:
+            self._streams.pop(request_id, None)
+
+    def _expire_stale(self):
+        now = time.time()
+        stale = [
+            request_id for request_id, stream in self._streams.items()
+            if stream.created_at < now - self.ttl_seconds
+            or (stream.finished_at is not None and stream.finished_at < now - self.grace_seconds)
+        ]
+        for request_id in stale:
+            del self._streams[request_id]
+
+class SQLiteStreamBus:
+    """Stream transport shared between processes through a SQLite file.
+
+    The POST that starts generation and the GET that reads the stream may
+    land in different workers; both see the same frames table. Event IDs
+    are numbered per stream, so a reconnect can resume on any worker.
+    """
+
+    def __init__(self, path: str = STREAM_BUS_PATH, ttl_seconds: float = STREAM_TTL_SECONDS,
+                 grace_seconds: float = STREAM_REPLAY_GRACE_SECONDS,
+                 max_frames: int = STREAM_REPLAY_MAX_FRAMES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.grace_seconds = grace_seconds
+        self.max_frames = max_frames
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        conn = self._connection()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS streams (
+                request_id TEXT PRIMARY KEY,
+                created_at REAL NOT NULL,
+                finished_at REAL,
+                last_event_id INTEGER NOT NULL DEFAULT 0,
+                readers INTEGER NOT NULL DEFAULT 0,
+                detached_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS frames (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                request_id TEXT NOT NULL,
+                message TEXT NOT NULL,
+                event_id INTEGER NOT NULL
+            );
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS frames_by_event ON frames (request_id, event_id)")
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def open(self, request_id: str):
+        conn = self._connection()
+        now = time.time()
+        conn.execute(
+            "INSERT OR IGNORE INTO streams (request_id, created_at, detached_at) VALUES (?, ?, ?)",
+            (request_id, now, now)
+        )
+        self._expire_stale(conn)
+
+    def exists(self, request_id: str) -> bool:
+        row = self._connection().execute(
+            "SELECT 1 FROM streams WHERE request_id = ?", (request_id,)
+        ).fetchone()
+        return row is not None
+
+    def publish(self, request_id: str, message: str):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            conn.execute(
+                "INSERT OR IGNORE INTO streams (request_id, created_at, detached_at) VALUES (?, ?, ?)",
+                (request_id, now, now)
+            )
+            conn.execute(
+                "UPDATE streams SET last_event_id = last_event_id + 1 WHERE request_id = ?",
+                (request_id,)
+            )
+            event_id = conn.execute(
+                "SELECT last_event_id FROM streams WHERE request_id = ?", (request_id,)
+            ).fetchone()[0]
+            conn.execute(
+                "INSERT INTO frames (request_id, event_id, message) VALUES (?, ?, ?)",
+                (request_id, event_id, message)
+            )
+            # Keep only the newest frames of this stream for replay
+            conn.execute(
+                "DELETE FROM frames WHERE request_id = ? AND event_id <= ?",
+                (request_id, event_id - self.max_frames)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def read(self, request_id: str, after_id: int = 0) -> List[Tuple[int, str]]:
+        return self._connection().execute(
+            "SELECT event_id, message FROM frames WHERE request_id = ? AND event_id > ? ORDER BY event_id",
+            (request_id, after_id)
+        ).fetchall()
+
+    def finish(self, request_id: str):
+        self._connection().execute(
+            "UPDATE streams SET finished_at = ? WHERE request_id = ? AND finished_at IS NULL",
+            (time.time(), request_id)
+        )
+
+    def is_finished(self, request_id: str) -> bool:
+        row = self._connection().execute(
+            "SELECT finished_at FROM streams WHERE request_id = ?", (request_id,)
+        ).fetchone()
+        return row is not None and row[0] is not None
+
+    def attach(self, request_id: str):
+        self._connection().execute(
+            "UPDATE streams SET readers = readers + 1, detached_at = NULL WHERE request_id = ?",
+            (request_id,)
+        )
+
+    def detach(self, request_id: str):
+        self._connection().execute(
+            """UPDATE streams SET readers = MAX(readers - 1, 0),
+                   detached_at = CASE WHEN readers <= 1 THEN ? ELSE detached_at END
+               WHERE request_id = ?""",
+            (time.time(), request_id)
+        )
+
+    def is_abandoned(self, request_id: str, grace_seconds: float = STREAM_CANCEL_GRACE_SECONDS) -> bool:
+        row = self._connection().execute(
+            "SELECT readers, detached_at FROM streams WHERE request_id = ?", (request_id,)
+        ).fetchone()
+        if row is None:
+            return True
+        readers, detached_at = row
+        return readers == 0 and detached_at is not None and time.time() - detached_at >= grace_seconds
+
+    def close(self, request_id: str):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM frames WHERE request_id = ?", (request_id,))
+            conn.execute("DELETE FROM streams WHERE request_id = ?", (request_id,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _expire_stale(self, conn: sqlite3.Connection):
+        """Drop streams (and their frames) that outlived the TTL or their replay grace period."""
+        now = time.time()
+        stale = "SELECT request_id FROM streams WHERE created_at < ? OR finished_at < ?"
+        cutoffs = (now - self.ttl_seconds, now - self.grace_seconds)
+        conn.execute(f"DELETE FROM frames WHERE request_id IN ({stale})", cutoffs)
+        conn.execute("DELETE FROM streams WHERE created_at < ? OR finished_at < ?", cutoffs)
+
+_stream_bus = None
+_stream_bus_lock = threading.Lock()
+
+def get_stream_bus():
+    """Return the process-wide stream bus for the configured backend."""
+    global _stream_bus
+    if _stream_bus is None:
+        with _stream_bus_lock:
+            if _stream_bus is None:
+                if STREAM_BUS_BACKEND == "memory":
+                    _stream_bus = InProcessStreamBus()
+                elif STREAM_BUS_BACKEND == "sqlite":
+                    _stream_bus = SQLiteStreamBus()
+                else:
+                    raise ValueError(f"Unknown STREAM_BUS_BACKEND: {STREAM_BUS_BACKEND}")
+    return _stream_bus
@@ -0,0 +1,89 @@
+import json
+import os
+import threading
+import time
+
+# Longest a token may wait in the buffer before it is sent
+STREAM_FLUSH_INTERVAL_MS = float(os.getenv("STREAM_FLUSH_INTERVAL_MS", "40"))
+# Buffered text size that triggers an immediate flush
+STREAM_FLUSH_BYTES = int(os.getenv("STREAM_FLUSH_BYTES", "1024"))
+
+def sse_frame(payload):
+    """Encode a payload as a single SSE data frame."""
+    return f"data: {json.dumps(payload)}\n\n"
+
+class CoalescingStreamWriter:
+    """Coalesce model tokens into SSE frames by time window and size.
+
+    Tokens are buffered and published as one {"text": ...} frame when the
+    oldest buffered token has waited flush_interval seconds, or when the
+    buffer reaches max_bytes. A small flusher thread enforces the time
+    window even if the model pauses between tokens. Frames keep the shape
+    the widgets already parse, so they just receive longer text pieces.
+    """
+
+    def __init__(self, publish, flush_interval=STREAM_FLUSH_INTERVAL_MS / 1000.0, max_bytes=STREAM_FLUSH_BYTES):
+        self._publish = publish
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self._buffer = []
+        self._buffer_bytes = 0
+        self._first_buffered_at = None
+        self._closed = False
+        self._cond = threading.Condition()
+        self.frames = 0
+        self.tokens = 0
+        if flush_interval > 0:
+            threading.Thread(target=self._flush_loop, daemon=True).start()
+
+    def write(self, text):
+        """Buffer a token, flushing if the size threshold is reached."""
+        if not text:
+            return
+        with self._cond:
+            self.tokens += 1
+            if not self._buffer:
+                self._first_buffered_at = time.monotonic()
+                self._cond.notify()
+            self._buffer.append(text)
+            self._buffer_bytes += len(text)
+            if self.flush_interval <= 0 or self._buffer_bytes >= self.max_bytes:
+                self._flush_locked()
+
+    def flush(self):
+        with self._cond:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._buffer:
+            return
+        text = "".join(self._buffer)
+        self._buffer = []
+        self._buffer_bytes = 0
+        self._first_buffered_at = None
+        self._publish(sse_frame({'text': text}))
+        self.frames += 1
+
+    def _flush_loop(self):
+        with self._cond:
+            while not self._closed:
+                if self._first_buffered_at is None:
+                    self._cond.wait()
+                    continue
+                remaining = self._first_buffered_at + self.flush_interval - time.monotonic()
+                if remaining <= 0:
+                    self._flush_locked()
+                else:
+                    self._cond.wait(remaining)
+
+    def close(self, error=None):
+        """Flush what is left, then publish the optional error and end frames."""
+        with self._cond:
+            self._flush_locked()
+            self._closed = True
+            self._cond.notify()
+            if error:
+                self._publish(sse_frame({'error': error}))
+                self.frames += 1
+            self._publish(sse_frame({'text': '', 'end': True}))
+            self.frames += 1
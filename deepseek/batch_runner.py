@@ -0,0 +1,207 @@
+"""
+Offline batch question runner
+-----------------------------
+Runs ADKAR and change-planning questions from a JSONL file through the
+assistants concurrently, sharing one loaded index per corpus, one chain
+per filter combination and the pooled DeepSeek client.
+
+Each input line is a JSON object such as:
+    {"id": "q1", "kind": "planning", "question": "...", "plan_stage": "planning", "change_type": "technology"}
+    {"id": "q2", "kind": "chat", "question": "...", "resource_type": "guide", "audience": "managers"}
+"kind" defaults to --kind and "id" to the line number.
+
+Results are appended to the output JSONL as each item finishes, with its
+answer or error and timing. The output doubles as the checkpoint: running
+the same command again skips items that already succeeded and retries the
+rest.
+
+Run from the deepseek directory:
+    python batch_runner.py scenarios.jsonl --output results.jsonl --concurrency 8
+"""
+import os
+import sys
+import asyncio
+
+# Configure asyncio event loop before importing torch-related modules
+if sys.platform == 'darwin':  # macOS
+    if not isinstance(asyncio.get_event_loop_policy(), asyncio.DefaultEventLoopPolicy):
+        asyncio.set_event_loop_policy(asyncio.DefaultEventLoopPolicy())
+
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Corpus and filter fields for each kind of question
+KINDS = {
+    "chat": {"corpus": "adkar", "filters": ("resource_type", "audience")},
+    "planning": {"corpus": "change_planning", "filters": ("plan_stage", "change_type")}
+}
+
+def read_items(path, default_kind):
+    """Parse the input JSONL into items with an id, kind, question and filters."""
+    items = []
+    with open(path, 'r') as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            kind = record.get("kind", default_kind)
+            if kind not in KINDS:
+                raise ValueError(f"Line {line_number}: unknown kind '{kind}'")
+            question = record.get("question") or record.get("message")
+            if not question:
+                raise ValueError(f"Line {line_number}: missing question")
+            items.append({
+                "id": str(record.get("id", line_number)),
+                "kind": kind,
+                "question": question,
+                "filters": {key: record[key] for key in KINDS[kind]["filters"] if record.get(key)}
+            })
+    ids = [item["id"] for item in items]
+    if len(set(ids)) != len(ids):
+        raise ValueError("Item ids must be unique")
+    return items
+
+def completed_ids(path):
+    """Ids that already have a successful result in the output file."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut short by a crash; the item will run again
+                continue
+            if record.get("error") is None:
+                done.add(record["id"])
+    return done
+
+class ChainCache:
+    """One non-streaming chain per kind and filter combination, shared by all workers."""
+
+    def __init__(self):
+        self._chains = {}
+        self._lock = threading.Lock()
+
+    def get(self, kind, filters):
+        key = (kind, tuple(sorted(filters.items())))
+        with self._lock:
+            chain = self._chains.get(key)
+            if chain is None:
+                chain = self._chains[key] = self._create(kind, filters)
+            return chain
+
+    @staticmethod
+    def _create(kind, filters):
+        if kind == "planning":
+            from app.models.change_planning_chain import create_change_planning_chain
+            return create_change_planning_chain(streaming=False, **filters)
+        from app.models.rag_chain import create_rag_chain
+        return create_rag_chain(streaming=False, **filters)
+
+class ResultWriter:
+    """Append results to the output JSONL, flushed to disk one line at a time."""
+
+    def __init__(self, path):
+        self._file = open(path, 'a')
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+def run_item(item, chains, breaker):
+    """Answer one item, returning its result record."""
+    start = time.perf_counter()
+    answer, error = None, None
+    try:
+        chain = chains.get(item["kind"], item["filters"])
+        answer = breaker.call(lambda: chain.invoke(item["question"]))
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    return {
+        "id": item["id"],
+        "kind": item["kind"],
+        "question": item["question"],
+        "filters": item["filters"],
+        "answer": answer,
+        "error": error,
+        "seconds": round(time.perf_counter() - start, 3),
+        "completed_at": time.strftime("%Y-%m-%dT%H:%M:%S")
+    }
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(int(p / 100.0 * len(values)), len(values) - 1)] if values else 0.0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="JSONL file of questions")
+    parser.add_argument("--output", default="batch_results.jsonl", help="JSONL file for results (also the checkpoint)")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("BATCH_CONCURRENCY", "8")))
+    parser.add_argument("--kind", choices=list(KINDS), default="planning", help="Kind for items that do not set one")
+    args = parser.parse_args()
+
+    if not os.getenv("DEEPSEEK_API_KEY"):
+        sys.exit("DEEPSEEK_API_KEY is not set")
+
+    from app.models.retrieval import get_corpus_store
+    from app.models.llm import usage_tracker
+    from app.utils.circuit_breaker import llm_breaker
+
+    items = read_items(args.input, args.kind)
+    done = completed_ids(args.output)
+    pending = [item for item in items if item["id"] not in done]
+    print(f"{len(items)} items, {len(items) - len(pending)} already done, {len(pending)} to run "
+          f"with concurrency {args.concurrency}")
+    if not pending:
+        return
+
+    # Load each needed index once, before the workers start
+    for kind in sorted({item["kind"] for item in pending}):
+        get_corpus_store(KINDS[kind]["corpus"])
+
+    chains = ChainCache()
+    writer = ResultWriter(args.output)
+    timings = []
+    failed = 0
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            futures = [executor.submit(run_item, item, chains, llm_breaker) for item in pending]
+            for finished, future in enumerate(as_completed(futures), start=1):
+                record = future.result()
+                writer.write(record)
+                timings.append(record["seconds"])
+                if record["error"]:
+                    failed += 1
+                    print(f"[{finished}/{len(pending)}] {record['id']} failed: {record['error']}")
+                else:
+                    print(f"[{finished}/{len(pending)}] {record['id']} done in {record['seconds']:.2f}s")
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"\nFinished {len(timings)} items ({failed} failed) in {elapsed:.1f}s, "
+          f"{len(timings) / elapsed:.2f} items/s")
+    print(f"Per item: p50 {percentile(timings, 50):.2f}s, p95 {percentile(timings, 95):.2f}s")
+    print(f"Token usage: {usage_tracker.snapshot()}")
+    if failed:
+        print(f"Run the same command again to retry the {failed} failed items")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Batch retrieval benchmark
+-------------------------
+Compares retrieve_batch against retrieving one question at a time through
+the LangChain retriever, the way the chains do.
+
+Run from the deepseek directory:
+    python -m benchmarks.batch_retrieval --corpus adkar --queries 200
+"""
+import argparse
+import json
+import time
+
+from app.models.retrieval import CORPORA, get_corpus_store, retrieve_batch
+
+def sample_queries(corpus, count):
+    """Build synthetic questions from the opening words of stored chunks."""
+    documents_file = {
+        "adkar": "app/data/processed_documents.json",
+        "change_planning": "app/data/change_planning_documents.json"
+    }[corpus]
+    with open(documents_file, 'r') as f:
+        data = json.load(f)
+    
+    queries = []
+    for item in data:
+        words = item["page_content"].split()
+        if len(words) >= 8:
+            queries.append(" ".join(words[:12]))
+    if not queries:
+        raise ValueError(f"No usable chunks in {documents_file}")
+    return [queries[i % len(queries)] for i in range(count)]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", choices=list(CORPORA), default="adkar")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=8)
+    args = parser.parse_args()
+    
+    queries = sample_queries(args.corpus, args.queries)
+    vector_store = get_corpus_store(args.corpus)
+    retriever = vector_store.as_retriever(search_kwargs={"k": args.k})
+    
+    # Warm both paths so model loading is not measured
+    retriever.invoke(queries[0])
+    retrieve_batch(queries[:1], corpus=args.corpus, k=args.k)
+    
+    start = time.perf_counter()
+    for query in queries:
+        retriever.invoke(query)
+    loop_seconds = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    retrieve_batch(queries, corpus=args.corpus, k=args.k)
+    batch_seconds = time.perf_counter() - start
+    
+    print(f"Corpus: {args.corpus}, queries: {len(queries)}, k: {args.k}")
+    print(f"Per-query loop: {loop_seconds:.3f}s ({len(queries) / loop_seconds:.1f} queries/s)")
+    print(f"Batched:        {batch_seconds:.3f}s ({len(queries) / batch_seconds:.1f} queries/s)")
+    print(f"Speedup:        {loop_seconds / batch_seconds:.1f}x")
+
+if __name__ == "__main__":
+    main()
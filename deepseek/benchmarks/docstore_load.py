@@ -0,0 +1,121 @@
+"""
+Docstore load benchmark
+-----------------------
+Builds a synthetic store of --chunks chunks (random vectors, --chars
+characters of text each) and saves it twice: with the pickled LangChain
+InMemoryDocstore (index.pkl) and with the SQLite docstore. Each copy is then
+opened in a fresh process, which reports:
+  - load time
+  - resident memory added by loading
+  - time to read the chunks for --lookups searches of k=8 random positions
+Repeat with several --chunks values to see how each format scales.
+
+Run from the deepseek directory:
+    python -m benchmarks.docstore_load --chunks 50000
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+FORMATS = ("pickle", "sqlite")
+
+def rss_mb():
+    """Peak resident memory of this process so far, in megabytes."""
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return usage / (1024 * 1024) if sys.platform == 'darwin' else usage / 1024
+
+def build(directory, chunks, chars, dim=384, seed=7):
+    """Save the same synthetic store in both formats under directory."""
+    import faiss
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+    from langchain.schema.document import Document
+    from app.models.docstore import DOCSTORE_FILE, write_docstore
+    from app.models.vector_store import INDEX_FILE
+
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(chunks, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    index = faiss.IndexFlatL2(dim)
+    index.add(vectors)
+
+    words = ["sponsor", "change", "resistance", "training", "adoption", "reinforcement", "awareness", "desire"]
+    ids = [f"chunk-{position}" for position in range(chunks)]
+    documents = {}
+    for position, chunk_id in enumerate(ids):
+        text = " ".join(rng.choice(words, size=chars // 8))[:chars]
+        documents[chunk_id] = Document(
+            page_content=text,
+            metadata={"source": f"doc-{position // 40}.pdf", "page": position % 40, "resource_type": "guide"}
+        )
+    vector_store = FAISS(
+        embedding_function=None, index=index, docstore=InMemoryDocstore(documents),
+        index_to_docstore_id=dict(enumerate(ids))
+    )
+
+    pickle_dir = os.path.join(directory, "pickle")
+    vector_store.save_local(pickle_dir)
+    sqlite_dir = os.path.join(directory, "sqlite")
+    os.makedirs(sqlite_dir)
+    faiss.write_index(index, os.path.join(sqlite_dir, INDEX_FILE))
+    write_docstore(os.path.join(sqlite_dir, DOCSTORE_FILE), vector_store)
+
+def load(store_dir, lookups, k=8):
+    """Open one copy and time it; runs in its own process so memory is comparable."""
+    from app.models.docstore import documents_at
+    from app.models.vector_store import read_store_dir
+
+    before = rss_mb()
+    start = time.perf_counter()
+    vector_store = read_store_dir(store_dir, None, allow_pickle=True)
+    load_seconds = time.perf_counter() - start
+    loaded = rss_mb()
+
+    size = vector_store.index.ntotal
+    start = time.perf_counter()
+    for _ in range(lookups):
+        documents_at(vector_store, random.sample(range(size), k))
+    lookup_micros = (time.perf_counter() - start) / lookups * 1e6
+    return {"load_seconds": load_seconds, "load_rss_mb": loaded - before, "lookup_us": lookup_micros}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=50000)
+    parser.add_argument("--chars", type=int, default=1000)
+    parser.add_argument("--lookups", type=int, default=500)
+    parser.add_argument("--load", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.load:
+        print(json.dumps(load(args.load, args.lookups)))
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        build(directory, args.chunks, args.chars)
+        print(f"Built {args.chunks} chunks of {args.chars} chars in {time.perf_counter() - start:.1f}s")
+
+        print(f"{'format':<8} {'files MiB':>10} {'load s':>8} {'load RSS MiB':>13} {'k=8 read us':>12}")
+        for name in FORMATS:
+            store_dir = os.path.join(directory, name)
+            files_mb = sum(os.path.getsize(os.path.join(store_dir, f)) for f in os.listdir(store_dir)) / (1024 * 1024)
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.docstore_load", "--load", store_dir, "--lookups", str(args.lookups)],
+                check=True, capture_output=True, text=True
+            ).stdout
+            row = json.loads(output.strip().splitlines()[-1])
+            print(f"{name:<8} {files_mb:>10.1f} {row['load_seconds']:>8.3f} {row['load_rss_mb']:>13.1f} "
+                  f"{row['lookup_us']:>12.1f}")
+    print("The index itself (vectors) is loaded in both formats; the difference is the chunk text and metadata.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Embedding backend benchmark
+---------------------------
+Compares the torch (HuggingFaceEmbeddings) embedder with the ONNX Runtime
+fp32 and int8 exports on single-query latency, batch throughput, load time
+and peak resident memory. Each backend runs in its own subprocess so their
+memory footprints do not mix.
+
+Export the ONNX model first (python -m app.models.embeddings export), then
+run from the deepseek directory:
+    python -m benchmarks.embedding_backends
+"""
+import argparse
+import json
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+BACKENDS = ["torch", "onnx-fp32", "onnx-int8"]
+
+def run_backend(backend, queries, batch_texts):
+    """Measure one backend in the current process and return its numbers."""
+    start = time.perf_counter()
+    if backend == "torch":
+        from app.models.embeddings import create_torch_embeddings
+        embeddings = create_torch_embeddings()
+    else:
+        from app.models.embeddings import OnnxMiniLMEmbeddings
+        embeddings = OnnxMiniLMEmbeddings(quantized=backend == "onnx-int8")
+    embeddings.embed_query("warmup")
+    load_seconds = time.perf_counter() - start
+    
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        embeddings.embed_query(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    
+    start = time.perf_counter()
+    embeddings.embed_documents(batch_texts)
+    batch_seconds = time.perf_counter() - start
+    
+    return {
+        "backend": backend,
+        "load_seconds": round(load_seconds, 3),
+        "query_p50_ms": round(statistics.median(latencies), 2),
+        "query_p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 2),
+        "batch_texts_per_second": round(len(batch_texts) / batch_seconds, 1),
+        # ru_maxrss is reported in kilobytes on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=BACKENDS, help="Measure a single backend in this process")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=400)
+    args = parser.parse_args()
+    
+    from app.models.embeddings import load_parity_texts
+    texts = load_parity_texts(limit=args.batch)
+    queries = [" ".join(text.split()[:12]) for text in texts][:args.queries]
+    batch_texts = texts[:args.batch]
+    
+    if args.backend:
+        print(json.dumps(run_backend(args.backend, queries, batch_texts)))
+        return
+    
+    print(f"{'backend':<10} {'load s':>8} {'p50 ms':>8} {'p95 ms':>8} {'texts/s':>9} {'RSS MB':>8}")
+    for backend in BACKENDS:
+        completed = subprocess.run(
+            [sys.executable, "-m", "benchmarks.embedding_backends", "--backend", backend,
+             "--queries", str(args.queries), "--batch", str(args.batch)],
+            capture_output=True, text=True
+        )
+        if completed.returncode != 0:
+            print(f"{backend:<10} failed: {completed.stderr.strip().splitlines()[-1]}")
+            continue
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        print(f"{backend:<10} {result['load_seconds']:>8} {result['query_p50_ms']:>8} "
+              f"{result['query_p95_ms']:>8} {result['batch_texts_per_second']:>9} {result['peak_rss_mb']:>8}")
+
+if __name__ == "__main__":
+    main()
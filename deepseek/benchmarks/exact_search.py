@@ -0,0 +1,99 @@
+"""
+Exact search engine microbenchmark
+----------------------------------
+Times the search step alone (queries are embedded up front) for:
+  - the LangChain FAISS wrapper with a metadata filter, as the chains used to
+  - the raw FAISS index plus docstore lookups and dict filters
+  - the exact NumPy engine with bitmap masks, in float32 and float16
+with and without a metadata filter, and checks the engine returns the same
+chunks as FAISS.
+
+Run from the deepseek directory:
+    python -m benchmarks.exact_search --corpus adkar --queries 200 --k 8
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.models import exact_search
+from app.models.docstore import metadata_in_index_order
+from app.models.exact_search import ExactSearchEngine
+from app.models.retrieval import CORPORA, _search_candidates, get_corpus_store
+from app.models.vector_store import get_embeddings
+from benchmarks.batch_retrieval import sample_queries
+
+def sample_filter(corpus, vector_store):
+    """A filter on the most common value of the corpus's first filter key."""
+    key = CORPORA[corpus]["filter_keys"][0]
+    values = [metadata.get(key) for metadata in metadata_in_index_order(vector_store)]
+    values = [value for value in values if value is not None]
+    if not values:
+        return None
+    return {key: max(set(values), key=values.count)}
+
+def time_per_query(search, vectors):
+    start = time.perf_counter()
+    for vector in vectors:
+        search(vector)
+    return (time.perf_counter() - start) / len(vectors) * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", choices=list(CORPORA), default="adkar")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=8)
+    args = parser.parse_args()
+
+    vector_store = get_corpus_store(args.corpus)
+    queries = sample_queries(args.corpus, args.queries)
+    vectors = np.asarray(get_embeddings().embed_documents(queries), dtype=np.float32)
+    filter_keys = CORPORA[args.corpus]["filter_keys"]
+    engines = {
+        dtype: ExactSearchEngine.from_vector_store(vector_store, filter_keys, dtype=dtype)
+        for dtype in ("float32", "float16")
+    }
+    fetch_k = max(20, args.k * 4)
+
+    def faiss_path(vector, filter_dict):
+        # Force the FAISS branch of the retrieval module
+        limit = exact_search.EXACT_SEARCH_MAX_CHUNKS
+        exact_search.EXACT_SEARCH_MAX_CHUNKS = 0
+        try:
+            return _search_candidates(args.corpus, vector_store, vector[None, :], [filter_dict], args.k, fetch_k)[0]
+        finally:
+            exact_search.EXACT_SEARCH_MAX_CHUNKS = limit
+
+    print(f"Corpus: {args.corpus} ({vector_store.index.ntotal} chunks), queries: {len(queries)}, k: {args.k}")
+    cases = [("no filter", None)]
+    filter_dict = sample_filter(args.corpus, vector_store)
+    if filter_dict:
+        cases.append((f"filter {filter_dict}", filter_dict))
+    for label, filter_dict in cases:
+        timings = {
+            "LangChain FAISS wrapper": time_per_query(
+                lambda v: vector_store.similarity_search_with_score_by_vector(v.tolist(), k=args.k, filter=filter_dict, fetch_k=fetch_k),
+                vectors
+            ),
+            "FAISS + docstore + dict filter": time_per_query(lambda v: faiss_path(v, filter_dict), vectors),
+        }
+        for dtype, engine in engines.items():
+            timings[f"exact engine ({dtype})"] = time_per_query(
+                lambda v: engine.search(v[None, :], args.k, [filter_dict]), vectors
+            )
+
+        agreement = np.mean([
+            [p for p, _, _ in faiss_path(v, filter_dict)] == [p for p, _, _ in engines["float32"].search(v[None, :], args.k, [filter_dict])[0]]
+            for v in vectors
+        ])
+        # With a filter FAISS only sees fetch_k candidates, so it can miss matches the engine finds
+        print(f"\n{label} (exact engine matches FAISS on {agreement:.0%} of queries)")
+        baseline = timings["LangChain FAISS wrapper"]
+        for name, micros in timings.items():
+            print(f"  {name:<32} {micros:9.1f} us/query  {baseline / micros:5.1f}x")
+
+    for dtype, engine in engines.items():
+        print(f"Matrix size ({dtype}): {engine.matrix.nbytes / 1024:.0f} KiB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Hedged LLM request benchmark
+----------------------------
+Streams answers from a local stub of the DeepSeek chat API that injects
+first-token latency: most requests start after --fast-ms, but a fraction
+(--slow-fraction) stall for --slow-ms, sending only keep-alive comments.
+Measures time to first token with and without hedging, and prints the
+hedge, win and budget counters and how many losing streams were closed.
+No real tokens are spent.
+
+Run from the deepseek directory:
+    python -m benchmarks.llm_hedging --requests 200 --slow-fraction 0.05
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class StubStreamingDeepSeek(BaseHTTPRequestHandler):
+    """Streams a short answer as chat.completion.chunk events after an injected delay."""
+
+    fast_seconds = 0.1
+    slow_seconds = 3.0
+    slow_fraction = 0.05
+    requests = 0
+    disconnects = 0
+    _lock = threading.Lock()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with StubStreamingDeepSeek._lock:
+            StubStreamingDeepSeek.requests += 1
+        slow = random.random() < self.slow_fraction
+        delay = self.slow_seconds if slow else self.fast_seconds * random.uniform(0.5, 1.5)
+
+        # Like DeepSeek, answer at once and send keep-alive comments while the request waits
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        try:
+            waited_until = time.monotonic() + delay
+            while time.monotonic() < waited_until:
+                time.sleep(min(0.1, max(waited_until - time.monotonic(), 0.0)))
+                self.wfile.write(b": keep-alive\n\n")
+                self.wfile.flush()
+            for token in ["Sponsorship ", "matters ", "most ", "early."] * 5:
+                self.send_chunk(body, {"role": "assistant", "content": token})
+                time.sleep(0.01)
+            self.send_chunk(body, {}, finish_reason="stop")
+            self.send_chunk(body, None, usage={"prompt_tokens": 50, "completion_tokens": 20, "total_tokens": 70})
+            self.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The app cancelled this request after the other one won
+            with StubStreamingDeepSeek._lock:
+                StubStreamingDeepSeek.disconnects += 1
+
+    def send_chunk(self, body, delta, finish_reason=None, usage=None):
+        chunk = {
+            "id": "stub", "object": "chat.completion.chunk", "created": 0, "model": body.get("model"),
+            "choices": [] if delta is None else [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+        }
+        if usage:
+            chunk["usage"] = usage
+        self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def log_message(self, *args):
+        pass
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(int(p / 100.0 * len(values)), len(values) - 1)]
+
+def measure(llm, requests):
+    """Time to first token (seconds) for each streamed request."""
+    times = []
+    for index in range(requests):
+        start = time.perf_counter()
+        first = None
+        for chunk in llm.stream(f"Question number {index}?"):
+            if first is None and chunk.content:
+                first = time.perf_counter() - start
+        times.append(first)
+    return times
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--fast-ms", type=float, default=100)
+    parser.add_argument("--slow-ms", type=float, default=3000)
+    parser.add_argument("--slow-fraction", type=float, default=0.05)
+    parser.add_argument("--budget", type=float, default=0.1, help="Largest fraction of requests hedged")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    StubStreamingDeepSeek.fast_seconds = args.fast_ms / 1000.0
+    StubStreamingDeepSeek.slow_seconds = args.slow_ms / 1000.0
+    StubStreamingDeepSeek.slow_fraction = args.slow_fraction
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubStreamingDeepSeek)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    # Point the app at the stub before its modules read the configuration
+    os.environ["DEEPSEEK_API_BASE"] = f"http://127.0.0.1:{server.server_port}/v1"
+    os.environ["DEEPSEEK_API_KEY"] = "stub"
+    os.environ["LLM_HEDGE_ENABLED"] = "false"
+
+    from app.models.hedging import HedgePolicy, HedgedChatModel
+    from app.models.llm import create_llm
+
+    plain = create_llm(streaming=True)
+    policy = HedgePolicy(budget=args.budget, default_delay=args.fast_ms * 3 / 1000.0)
+    hedged = HedgedChatModel(model=create_llm(streaming=True), policy=policy)
+
+    print(f"Stub: {args.fast_ms:.0f} ms first token, {args.slow_fraction:.0%} of requests stall {args.slow_ms:.0f} ms")
+    for label, llm in (("without hedging", plain), ("with hedging", hedged)):
+        StubStreamingDeepSeek.requests = 0
+        times = measure(llm, args.requests)
+        print(f"\n{label}: {StubStreamingDeepSeek.requests} upstream requests")
+        for p in (50, 95, 99):
+            print(f"  p{p} time to first token: {percentile(times, p) * 1000:8.1f} ms")
+        print(f"  max: {max(times) * 1000:8.1f} ms")
+
+    print(f"\nHedging counters: {policy.snapshot()}")
+    print(f"Upstream streams closed early by the app: {StubStreamingDeepSeek.disconnects}")
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+MMR vs. similarity search benchmark
+-----------------------------------
+Runs the same questions through plain top-k similarity search and through
+search_mmr, and reports per-query latency, the time spent in the MMR
+selection itself, redundancy (mean pairwise cosine similarity between the
+returned chunks, and pairs above 0.9) and coverage (distinct source pages).
+
+Run from the deepseek directory:
+    python -m benchmarks.mmr_search --corpus adkar --queries 100 --k 5
+"""
+import argparse
+import itertools
+import time
+
+import numpy as np
+
+from app.models.retrieval import (
+    CORPORA, RETRIEVAL_MMR_FETCH_K, RETRIEVAL_MMR_LAMBDA, get_corpus_store, mmr_select, search_batch, search_mmr
+)
+from app.models.vector_store import get_embeddings
+from benchmarks.batch_retrieval import sample_queries
+
+def redundancy(vectors):
+    """Mean pairwise cosine similarity, and the number of near-duplicate pairs."""
+    if len(vectors) < 2:
+        return 0.0, 0
+    pairs = [float(a @ b) for a, b in itertools.combinations(vectors, 2)]
+    return float(np.mean(pairs)), sum(score > 0.9 for score in pairs)
+
+def summarize(name, latencies, results, embeddings):
+    mean_similarity = []
+    near_duplicates = 0
+    pages = []
+    for docs in results:
+        # The embedder returns unit vectors, so dot products are cosines
+        vectors = np.asarray(embeddings.embed_documents([doc.page_content for doc in docs]), dtype=np.float32) if docs else []
+        similarity, duplicates = redundancy(vectors)
+        mean_similarity.append(similarity)
+        near_duplicates += duplicates
+        pages.append(len({(doc.metadata.get("source"), doc.metadata.get("page")) for doc in docs}))
+    print(f"{name:<22} {np.mean(latencies) * 1000:8.2f} ms/query  "
+          f"chunks {np.mean([len(docs) for docs in results]):4.1f}  "
+          f"pairwise cos {np.mean(mean_similarity):.3f}  "
+          f"near-dup pairs {near_duplicates:4d}  "
+          f"distinct pages {np.mean(pages):4.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", choices=list(CORPORA), default="adkar")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--baseline-k", type=int, default=8, help="k of the similarity search MMR replaces")
+    parser.add_argument("--fetch-k", type=int, default=RETRIEVAL_MMR_FETCH_K)
+    parser.add_argument("--lambda-mult", type=float, default=RETRIEVAL_MMR_LAMBDA)
+    args = parser.parse_args()
+
+    queries = sample_queries(args.corpus, args.queries)
+    embeddings = get_embeddings()
+    vector_store = get_corpus_store(args.corpus)
+    search_mmr(queries[0], corpus=args.corpus, k=args.k)  # load the model and index
+
+    runs = {
+        f"similarity k={args.baseline_k}": lambda q: search_batch([q], corpus=args.corpus, k=args.baseline_k)[0],
+        f"similarity k={args.k}": lambda q: search_batch([q], corpus=args.corpus, k=args.k)[0],
+        f"mmr k={args.k}/{args.fetch_k}": lambda q: search_mmr(q, corpus=args.corpus, k=args.k, fetch_k=args.fetch_k,
+                                                              lambda_mult=args.lambda_mult)
+    }
+    print(f"Corpus: {args.corpus} ({vector_store.index.ntotal} chunks), queries: {len(queries)}")
+    for name, run in runs.items():
+        latencies = []
+        results = []
+        for query in queries:
+            start = time.perf_counter()
+            pairs = run(query)
+            latencies.append(time.perf_counter() - start)
+            results.append([doc for doc, _ in pairs])
+        summarize(name, latencies, results, embeddings)
+
+    # The selection step alone, on vectors reconstructed from the index
+    fetch_k = min(args.fetch_k, vector_store.index.ntotal)
+    candidate_vectors = vector_store.index.reconstruct_batch(np.arange(fetch_k, dtype=np.int64))
+    relevance = np.linspace(0.8, 0.4, fetch_k)
+    start = time.perf_counter()
+    for _ in range(1000):
+        mmr_select(candidate_vectors, relevance, args.k, args.lambda_mult)
+    print(f"MMR selection alone: {(time.perf_counter() - start) * 1000:.1f} us per call "
+          f"({fetch_k} candidates, k={args.k})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+PCA projection benchmark
+------------------------
+Fits a PCA projection on a corpus's vectors at several dimensions, the way
+create_vector_store does with ADKAR_PCA_DIM / CHANGE_PLANNING_PCA_DIM, and
+reports for each:
+  - recall@k against exact search on the full 384-dim vectors
+  - serialized FAISS index size (vectors plus the projection)
+  - single-query search latency
+so a dimension can be chosen per corpus.
+
+Run from the deepseek directory:
+    python -m benchmarks.pca_projection --corpus adkar --dims 384,256,128,64,32 --k 8
+"""
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+from app.models.retrieval import CORPORA, embed_queries, get_corpus_store
+from app.models.vector_store import project_vector_store
+from benchmarks.batch_retrieval import sample_queries
+
+class _VectorsOnly:
+    """Just enough of a vector store for project_vector_store."""
+
+    def __init__(self, index):
+        self.index = index
+
+def build_index(vectors, dim):
+    """Flat index over the vectors, projected to dim dimensions if below full size."""
+    index = faiss.IndexFlatL2(vectors.shape[1])
+    index.add(vectors)
+    return project_vector_store(_VectorsOnly(index), dim).index
+
+def evaluate(vectors, queries, dims, k):
+    """Recall@k, index size and per-query latency for each dimension."""
+    truth = faiss.IndexFlatL2(vectors.shape[1])
+    truth.add(vectors)
+    _, expected = truth.search(queries, k)
+
+    rows = []
+    for dim in dims:
+        start = time.perf_counter()
+        index = build_index(vectors, dim)
+        build_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for query in queries:
+            index.search(query[None, :], k)
+        micros = (time.perf_counter() - start) / len(queries) * 1e6
+
+        _, found = index.search(queries, k)
+        recall = np.mean([len(set(found[row]) & set(expected[row])) / k for row in range(len(queries))])
+        rows.append({
+            "dim": dim,
+            "recall": float(recall),
+            "size_kib": len(faiss.serialize_index(index)) / 1024,
+            "us_per_query": micros,
+            "build_seconds": build_seconds
+        })
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", choices=list(CORPORA), default="adkar")
+    parser.add_argument("--dims", default="384,256,192,128,96,64,32")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=8)
+    args = parser.parse_args()
+
+    index = get_corpus_store(args.corpus).index
+    if isinstance(index, faiss.IndexPreTransform):
+        print("Note: this store is already projected; comparing against its reconstructed vectors")
+    vectors = index.reconstruct_n(0, index.ntotal)
+    queries = embed_queries(sample_queries(args.corpus, args.queries))
+    dims = [int(dim) for dim in args.dims.split(",")]
+
+    print(f"Corpus: {args.corpus} ({len(vectors)} chunks), queries: {len(queries)}, k: {args.k}")
+    print(f"{'dim':>5} {'recall@' + str(args.k):>9} {'index KiB':>10} {'us/query':>9} {'build s':>8}")
+    for row in evaluate(vectors, queries, dims, args.k):
+        print(f"{row['dim']:>5} {row['recall']:>9.3f} {row['size_kib']:>10.0f} "
+              f"{row['us_per_query']:>9.1f} {row['build_seconds']:>8.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+PDF loader benchmark
+--------------------
+Compares the PyPDFLoader and PyMuPDF backends on every PDF in the corpus:
+pages per second, pages kept, and text parity of the pages both produce.
+
+Run from the deepseek directory:
+    python -m benchmarks.pdf_loaders
+"""
+import argparse
+import difflib
+import os
+import time
+
+from app.data.pdf_loaders import iter_pdf_file_pages
+
+CORPUS_DIRECTORIES = ["./resources", "./resources/change_planning"]
+
+def normalize(text):
+    return " ".join(text.split())
+
+def load(file_path, loader):
+    start = time.perf_counter()
+    pages = {doc.metadata["page"]: doc for doc in iter_pdf_file_pages(file_path, loader=loader)}
+    return pages, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directories", nargs="*", default=CORPUS_DIRECTORIES)
+    args = parser.parse_args()
+    
+    files = [
+        os.path.join(directory, name)
+        for directory in args.directories if os.path.isdir(directory)
+        for name in sorted(os.listdir(directory)) if name.endswith(".pdf")
+    ]
+    if not files:
+        print("No PDFs found.")
+        return
+    
+    totals = {"pypdf": [0, 0.0], "pymupdf": [0, 0.0]}
+    print(f"{'file':<50} {'pypdf p/s':>10} {'pymupdf p/s':>12} {'pages':>11} {'parity':>7}")
+    for file_path in files:
+        pypdf_pages, pypdf_seconds = load(file_path, "pypdf")
+        mupdf_pages, mupdf_seconds = load(file_path, "pymupdf")
+        totals["pypdf"][0] += len(pypdf_pages)
+        totals["pypdf"][1] += pypdf_seconds
+        totals["pymupdf"][0] += len(mupdf_pages)
+        totals["pymupdf"][1] += mupdf_seconds
+        
+        # Text similarity on pages both loaders kept
+        common = sorted(set(pypdf_pages) & set(mupdf_pages))
+        ratios = [
+            difflib.SequenceMatcher(
+                None,
+                normalize(pypdf_pages[page].page_content),
+                normalize(mupdf_pages[page].page_content),
+                autojunk=False
+            ).ratio()
+            for page in common
+        ]
+        parity = sum(ratios) / len(ratios) if ratios else 0.0
+        
+        name = os.path.basename(file_path)[:48]
+        print(f"{name:<50} {len(pypdf_pages) / pypdf_seconds:>10.1f} {len(mupdf_pages) / mupdf_seconds:>12.1f} "
+              f"{len(pypdf_pages):>5}/{len(mupdf_pages):<5} {parity:>7.3f}")
+    
+    for loader, (pages, seconds) in totals.items():
+        print(f"{loader}: {pages} pages in {seconds:.2f}s ({pages / seconds:.1f} pages/s)")
+
+if __name__ == "__main__":
+    main()
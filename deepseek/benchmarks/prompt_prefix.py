@@ -0,0 +1,92 @@
+"""
+Prompt prefix cache check
+-------------------------
+Sends both chains' prompts to a local stub of the DeepSeek chat API
+instead of the real service. The stub records every request, checks that
+the system message is byte-identical across requests, and simulates
+DeepSeek's prefix cache (shared leading prompt, in 64-token units) so the
+cached-token usage the app records can be inspected without spending
+tokens.
+
+Run from the deepseek directory:
+    python -m benchmarks.prompt_prefix --requests 5
+"""
+import argparse
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CACHE_UNIT_TOKENS = 64
+
+def estimate_tokens(text):
+    return (len(text) + 3) // 4
+
+class StubDeepSeek(BaseHTTPRequestHandler):
+    """Answers /chat/completions with a fixed reply and prefix-cache usage."""
+
+    seen_prompts = []
+    system_messages = {}
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        messages = body["messages"]
+        prompt = json.dumps(messages)
+        system = next((m["content"] for m in messages if m["role"] == "system"), "")
+        StubDeepSeek.system_messages.setdefault(system[:60], set()).add(system)
+
+        shared = max((len(os.path.commonprefix([prompt, previous])) for previous in self.seen_prompts), default=0)
+        StubDeepSeek.seen_prompts.append(prompt)
+        prompt_tokens = estimate_tokens(prompt)
+        cached = estimate_tokens(prompt[:shared]) // CACHE_UNIT_TOKENS * CACHE_UNIT_TOKENS
+
+        reply = json.dumps({
+            "id": "stub", "object": "chat.completion", "created": 0, "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": 1,
+                "total_tokens": prompt_tokens + 1,
+                "prompt_cache_hit_tokens": cached,
+                "prompt_cache_miss_tokens": prompt_tokens - cached,
+                "prompt_tokens_details": {"cached_tokens": cached}
+            }
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+    def log_message(self, *args):
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5, help="Requests per chain")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubDeepSeek)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    # Point the app at the stub before its modules read the configuration
+    os.environ["DEEPSEEK_API_BASE"] = f"http://127.0.0.1:{server.server_port}/v1"
+    os.environ["DEEPSEEK_API_KEY"] = "stub"
+
+    from app.models.llm import create_llm, usage_tracker
+    from app.models.rag_chain import create_rag_prompt
+    from app.models.change_planning_chain import create_change_planning_prompt
+
+    llm = create_llm(streaming=False)
+    for create_prompt in (create_rag_prompt, create_change_planning_prompt):
+        prompt = create_prompt()
+        for index in range(args.requests):
+            context = f"Retrieved passage {index}: " + "Sponsorship and reinforcement matter. " * (20 + index)
+            llm.invoke(prompt.format_messages(context=context, question=f"Question number {index}?"))
+
+    server.shutdown()
+    identical = all(len(variants) == 1 for variants in StubDeepSeek.system_messages.values())
+    print(f"System message byte-identical across requests: {identical}")
+    print(f"Usage recorded: {usage_tracker.snapshot()}")
+
+if __name__ == "__main__":
+    main()
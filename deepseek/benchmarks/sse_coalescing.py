@@ -0,0 +1,100 @@
+"""
+SSE frame coalescing benchmark
+------------------------------
+Streams a synthetic answer through the old one-frame-per-token path and
+through CoalescingStreamWriter, with a reader draining the stream bus the
+way generate_stream_response does. Reports frames and writes per answer,
+CPU time, and the worst delay a token spent waiting to be sent.
+
+Run from the deepseek directory:
+    python -m benchmarks.sse_coalescing --tokens 2000 --tokens-per-second 80
+"""
+import argparse
+import json
+import os
+import threading
+import time
+
+from app.utils.stream_bus import InProcessStreamBus
+from app.utils.stream_writer import CoalescingStreamWriter, STREAM_FLUSH_INTERVAL_MS
+
+def synthetic_tokens(count, tokens_per_second, burst):
+    """Yield tokens at the given rate, arriving in bursts like network reads."""
+    gap = burst / tokens_per_second
+    for index in range(count):
+        if index % burst == 0:
+            time.sleep(gap)
+        yield f"tok{index % 97} "
+
+def drain(bus, request_id, stats, done, poll_seconds=0.02):
+    """Read the bus like the SSE endpoint: one write per batch of ready frames."""
+    last_event_id = 0
+    while True:
+        frames = bus.read(request_id, last_event_id)
+        if frames:
+            stats["writes"] += 1
+            last_event_id = frames[-1][0]
+            if any('"end": true' in message for _, message in frames):
+                done.set()
+                return
+        else:
+            time.sleep(poll_seconds)
+
+def run(mode, args):
+    bus = InProcessStreamBus()
+    request_id = f"bench-{mode}"
+    bus.open(request_id)
+    stats = {"frames": 0, "writes": 0, "max_wait_ms": 0.0}
+    done = threading.Event()
+    reader = threading.Thread(target=drain, args=(bus, request_id, stats, done), daemon=True)
+    reader.start()
+    
+    pending_since = []
+    
+    def publish(message):
+        stats["frames"] += 1
+        if pending_since:
+            stats["max_wait_ms"] = max(stats["max_wait_ms"], (time.monotonic() - pending_since[0]) * 1000)
+            pending_since.clear()
+        bus.publish(request_id, message)
+    
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    if mode == "per-token":
+        # The old path logged every chunk; send the log to /dev/null so only its cost shows
+        with open(os.devnull, "w") as log:
+            for token in synthetic_tokens(args.tokens, args.tokens_per_second, args.burst):
+                print(f"Streaming chunk: {token}", file=log)
+                publish(f"data: {json.dumps({'text': token})}\n\n")
+        publish(f"data: {json.dumps({'text': '', 'end': True})}\n\n")
+    else:
+        writer = CoalescingStreamWriter(publish)
+        for token in synthetic_tokens(args.tokens, args.tokens_per_second, args.burst):
+            if not pending_since:
+                pending_since.append(time.monotonic())
+            writer.write(token)
+        writer.close()
+    done.wait(timeout=10)
+    
+    return {
+        "mode": mode,
+        "frames": stats["frames"],
+        "writes": stats["writes"],
+        "cpu_ms": round((time.process_time() - cpu_start) * 1000, 1),
+        "wall_s": round(time.perf_counter() - wall_start, 2),
+        "max_token_wait_ms": round(stats["max_wait_ms"], 1)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=2000)
+    parser.add_argument("--tokens-per-second", type=float, default=80)
+    parser.add_argument("--burst", type=int, default=4, help="Tokens arriving together per network read")
+    args = parser.parse_args()
+    
+    print(f"Flush interval: {STREAM_FLUSH_INTERVAL_MS} ms")
+    for mode in ["per-token", "coalesced"]:
+        print(run(mode, args))
+
+if __name__ == "__main__":
+    main()
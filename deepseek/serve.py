@@ -95,8 +95,7 @@ if __name__ == "__main__":
         print("WARNING: Using default admin password. Set ADMIN_PASSWORD in .env for production.")
     
     if not deepseek_api_key:
-        print("ERROR: DeepSeek API key not set. Please set DEEPSEEK_API_KEY in .env file.")
-        sys.exit(1)
+        print("WARNING: DeepSeek API key not set. Only /api/search will work until DEEPSEEK_API_KEY is set in .env.")
     
     print("\n=== Change Management Assistant Server ===")
     print("API will be available at: http://localhost:8000")
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Tests import the app the way the entry points do, from the deepseek directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
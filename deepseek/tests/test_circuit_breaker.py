@@ -0,0 +1,100 @@
+import time
+
+import pytest
+
+from app.utils.circuit_breaker import CircuitBreaker, CircuitOpen
+
+def _opened_breaker(open_seconds=0.05):
+    breaker = CircuitBreaker(max_retries=0, window=4, min_calls=2, error_rate=0.5, open_seconds=open_seconds)
+    tickets = [breaker.before_call() for _ in range(3)]
+    breaker.record(tickets[0], False)
+    breaker.record(tickets[1], False)
+    assert breaker.state == "open"
+    # tickets[2] was admitted before the circuit opened and is still running
+    return breaker, tickets[2]
+
+def test_late_success_from_before_opening_keeps_the_circuit_open():
+    breaker, late = _opened_breaker()
+    breaker.record(late, True)
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+
+def test_late_outcome_does_not_decide_or_release_the_probe():
+    breaker, late = _opened_breaker()
+    time.sleep(0.06)
+    probe = breaker.before_call()
+    breaker.record(late, True)
+    assert breaker.state == "half_open"
+    # The probe is still out, so nothing else is let through
+    assert breaker.is_open()
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+
+    breaker.record(probe, True)
+    assert breaker.state == "closed"
+
+def test_failed_probe_reopens_and_late_failures_are_only_counted():
+    breaker, late = _opened_breaker()
+    time.sleep(0.06)
+    probe = breaker.before_call()
+    breaker.record(probe, False)
+    assert breaker.state == "open"
+    opened = breaker.snapshot()["opened"]
+
+    breaker.record(late, False)
+    assert breaker.snapshot()["opened"] == opened
+    assert breaker.snapshot()["failures"] == 4
+
+def test_outcomes_from_before_closing_do_not_count_against_the_new_window():
+    breaker, late = _opened_breaker()
+    time.sleep(0.06)
+    breaker.record(breaker.before_call(), True)
+    assert breaker.state == "closed"
+
+    breaker.record(late, False)
+    breaker.record(breaker.before_call(), False)
+    # Only one failure in the new window, below min_calls
+    assert breaker.state == "closed"
+
+def test_abandoned_probe_lets_the_next_call_probe():
+    breaker, _ = _opened_breaker()
+    time.sleep(0.06)
+    breaker.record(breaker.before_call(), None)
+    assert breaker.state == "half_open"
+    breaker.record(breaker.before_call(), True)
+    assert breaker.state == "closed"
+
+def test_call_closes_the_circuit_through_the_probe():
+    breaker, _ = _opened_breaker()
+    time.sleep(0.06)
+    assert breaker.call(lambda: "ok") == "ok"
+    assert breaker.state == "closed"
+
+def test_probe_whose_start_fails_at_once_is_recorded():
+    breaker, _ = _opened_breaker()
+    time.sleep(0.06)
+
+    def start():
+        # Not a generator: fails before returning an iterator
+        raise ConnectionError("refused")
+
+    with pytest.raises(ConnectionError):
+        list(breaker.stream(start))
+    # The failed probe reopened the circuit instead of leaving it stuck half open
+    assert breaker.state == "open"
+    time.sleep(0.06)
+    assert list(breaker.stream(lambda: iter(["ok"]))) == ["ok"]
+    assert breaker.state == "closed"
+
+def test_non_transient_start_failure_releases_the_probe():
+    breaker, _ = _opened_breaker()
+    time.sleep(0.06)
+
+    def start():
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        list(breaker.stream(start))
+    assert breaker.state == "half_open"
+    assert not breaker.is_open()
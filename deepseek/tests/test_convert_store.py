@@ -0,0 +1,49 @@
+import os
+
+import faiss
+import numpy as np
+import pytest
+from langchain.schema.document import Document
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+
+import app.models.vector_store as vector_store_module
+from app.data.convert_store import convert_store
+from app.models.docstore import DOCSTORE_FILE, documents_at
+from app.models.vector_store import CURRENT_POINTER, PICKLED_DOCSTORE_FILE, load_vector_store, read_store_dir
+
+@pytest.fixture
+def legacy_store(tmp_path, monkeypatch):
+    """A store saved before versioning, with LangChain's pickled docstore."""
+    # Loading a converted store needs no embedding model
+    monkeypatch.setattr(vector_store_module, "get_embeddings", lambda: None)
+    index = faiss.IndexFlatL2(4)
+    index.add(np.eye(4, dtype=np.float32)[:3])
+    ids = [f"chunk-{position}" for position in range(3)]
+    documents = {chunk_id: Document(page_content=f"text {chunk_id}", metadata={"page": position})
+                 for position, chunk_id in enumerate(ids)}
+    FAISS(
+        embedding_function=None, index=index, docstore=InMemoryDocstore(documents),
+        index_to_docstore_id=dict(enumerate(ids))
+    ).save_local(str(tmp_path))
+    return str(tmp_path)
+
+def test_pickled_docstore_is_refused_unless_allowed(legacy_store):
+    with pytest.raises(ValueError, match="convert_store"):
+        read_store_dir(legacy_store, None, allow_pickle=False)
+    assert read_store_dir(legacy_store, None, allow_pickle=True).index.ntotal == 3
+
+def test_convert_store_publishes_a_sqlite_version(legacy_store):
+    version = convert_store(legacy_store)
+
+    assert os.path.exists(os.path.join(legacy_store, CURRENT_POINTER))
+    assert not os.path.exists(os.path.join(legacy_store, PICKLED_DOCSTORE_FILE))
+    assert os.path.exists(os.path.join(legacy_store, "versions", version, DOCSTORE_FILE))
+    converted = load_vector_store(legacy_store)
+    documents = documents_at(converted, [2, 0])
+    assert [doc.page_content for doc in documents] == ["text chunk-2", "text chunk-0"]
+    assert documents[0].metadata == {"page": 2}
+    assert converted.index_to_docstore_id[1] == "chunk-1"
+
+    # Nothing left to convert
+    assert convert_store(legacy_store) is None
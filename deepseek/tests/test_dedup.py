@@ -0,0 +1,25 @@
+from langchain.schema.document import Document
+
+from app.data.dedup import (
+    dedup_documents, dedup_report_path, describe_savings, embed_seconds_saved, load_dedup_report, save_dedup_report
+)
+
+def test_report_is_kept_for_the_embedding_step(tmp_path):
+    documents_file = str(tmp_path / "processed_documents.json")
+    text = "Sponsors must communicate the reasons for the change early and often to every team."
+    _, report = dedup_documents([Document(page_content=text, metadata={"source": f"v{n}.pdf"}) for n in range(4)])
+
+    save_dedup_report(report, documents_file)
+    assert dedup_report_path(documents_file) == str(tmp_path / "processed_documents.dedup.json")
+    assert load_dedup_report(documents_file) == report
+
+    # A build without dedup must not report the previous build's savings
+    save_dedup_report(None, documents_file)
+    assert load_dedup_report(documents_file) is None
+
+def test_seconds_saved_uses_the_measured_rate():
+    report = {"chunks_removed": 3, "shrink_ratio": 0.25}
+    assert embed_seconds_saved(report, embed_seconds=4.5, chunks_embedded=9) == 1.5
+    assert embed_seconds_saved(report, embed_seconds=0.0, chunks_embedded=0) == 0.0
+    assert describe_savings(report, 1.5) == \
+        "Deduplication removed 3 chunks: index shrinks by 25.0%, saving about 1.5s of embedding"
@@ -0,0 +1,235 @@
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+from app.models.hedging import (
+    HedgePolicy, StreamCancelled, cancellable_stream, hedged_stream, on_cancel, release_on_cancel
+)
+
+class _Response:
+    """Just enough of an httpx response for release_on_cancel."""
+
+    def __init__(self, sock):
+        self.is_closed = False
+        self.extensions = {"network_stream": self}
+        self._sock = sock
+
+    def get_extra_info(self, name):
+        return self._sock if name == "socket" else None
+
+def _policy():
+    return HedgePolicy(default_delay=0.05, min_delay=0.0, budget=1.0)
+
+def test_losing_attempt_is_released_while_waiting_for_data():
+    upstream, server = socket.socketpair()
+    released = threading.Event()
+    calls = []
+
+    def start():
+        calls.append(None)
+        if len(calls) == 1:
+            # The primary stalls in a read, like a request waiting behind keep-alive comments
+            release_on_cancel(_Response(upstream))
+            upstream.recv(1)
+            released.set()
+            raise ConnectionError("closed by the hedge")
+        return iter(["token"])
+
+    started = time.monotonic()
+    assert list(hedged_stream(start, _policy())) == ["token"]
+    # Released by the cancelling side, not when the stalled read next returns data
+    assert released.wait(2)
+    assert time.monotonic() - started < 2
+    upstream.close()
+    server.close()
+
+def test_release_registered_after_losing_runs_at_once():
+    released = threading.Event()
+    proceed = threading.Event()
+    calls = []
+
+    def start():
+        calls.append(None)
+        if len(calls) == 1:
+            proceed.wait(2)
+            on_cancel(released.set)
+            return iter([])
+        return iter(["token"])
+
+    assert list(hedged_stream(start, _policy())) == ["token"]
+    proceed.set()
+    assert released.wait(2)
+
+def test_finished_attempt_is_not_released():
+    released = threading.Event()
+
+    def start():
+        on_cancel(released.set)
+        return iter(["a", "b"])
+
+    assert list(hedged_stream(start, _policy())) == ["a", "b"]
+    # Its connection may already be serving another request
+    assert not released.wait(0.2)
+
+def test_closed_response_is_left_alone():
+    upstream, server = socket.socketpair()
+    response = _Response(upstream)
+    calls = []
+
+    def start():
+        calls.append(None)
+        if len(calls) == 1:
+            release_on_cancel(response)
+            response.is_closed = True
+            time.sleep(0.3)
+            return iter([])
+        return iter(["token"])
+
+    assert list(hedged_stream(start, _policy())) == ["token"]
+    time.sleep(0.4)
+    server.sendall(b"x")
+    assert upstream.recv(1) == b"x"
+    upstream.close()
+    server.close()
+
+def test_cancellable_stream_cancels_before_the_first_chunk():
+    upstream, server = socket.socketpair()
+    released = threading.Event()
+
+    def start():
+        release_on_cancel(_Response(upstream))
+        upstream.recv(1)
+        released.set()
+        raise ConnectionError("closed on cancel")
+        yield
+
+    started = time.monotonic()
+    with pytest.raises(StreamCancelled):
+        list(cancellable_stream(start, lambda: time.monotonic() - started > 0.1, check_seconds=0.05))
+    # Checked on a timer, not on chunk arrival, and the stalled read is released
+    assert time.monotonic() - started < 1
+    assert released.wait(2)
+    upstream.close()
+    server.close()
+
+def test_cancellable_stream_passes_chunks_and_errors_through():
+    assert list(cancellable_stream(lambda: iter("abc"), lambda: False, check_seconds=0.05)) == ["a", "b", "c"]
+
+    def failing():
+        yield "a"
+        raise ValueError("upstream")
+
+    with pytest.raises(ValueError, match="upstream"):
+        list(cancellable_stream(failing, lambda: False, check_seconds=0.05))
+
+class StubStreamingDeepSeek(BaseHTTPRequestHandler):
+    """Trimmed copy of the stub in benchmarks/llm_hedging.py with scripted first-token delays.
+
+    Like DeepSeek, it answers at once and sends keep-alive comments until
+    the first token is due; each request takes the next delay in `delays`.
+    """
+
+    delays = []
+    requests = 0
+    disconnects = 0
+    _lock = threading.Lock()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        with StubStreamingDeepSeek._lock:
+            StubStreamingDeepSeek.requests += 1
+            delay = StubStreamingDeepSeek.delays.pop(0) if StubStreamingDeepSeek.delays else 0.0
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        try:
+            waited_until = time.monotonic() + delay
+            while time.monotonic() < waited_until:
+                time.sleep(0.02)
+                self.wfile.write(b": keep-alive\n\n")
+                self.wfile.flush()
+            for token in ["Sponsorship ", "matters."]:
+                self.wfile.write(f"data: {json.dumps({'content': token})}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The app closed this request after the other one won
+            with StubStreamingDeepSeek._lock:
+                StubStreamingDeepSeek.disconnects += 1
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def stub_url():
+    StubStreamingDeepSeek.delays = []
+    StubStreamingDeepSeek.requests = 0
+    StubStreamingDeepSeek.disconnects = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubStreamingDeepSeek)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/v1/chat/completions"
+    server.shutdown()
+
+@pytest.fixture
+def http_client():
+    # Configured like the pooled DeepSeek client in app/models/llm.py
+    with httpx.Client(timeout=httpx.Timeout(30.0, connect=10.0),
+                      event_hooks={"response": [release_on_cancel]}) as client:
+        yield client
+
+def stream_tokens(http_client, url):
+    """start() for hedged_stream: one streamed request, yielding each token."""
+    def start():
+        with http_client.stream("POST", url, json={"stream": True}) as response:
+            for line in response.iter_lines():
+                if line.startswith("data: ") and line != "data: [DONE]":
+                    yield json.loads(line[len("data: "):])["content"]
+    return start
+
+def wait_for(condition, seconds=3.0):
+    deadline = time.monotonic() + seconds
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return condition()
+
+def test_slow_first_attempt_is_hedged_and_the_fast_one_wins(stub_url, http_client):
+    StubStreamingDeepSeek.delays = [5.0, 0.0]
+    policy = HedgePolicy(default_delay=0.2, min_delay=0.0, budget=1.0)
+
+    started = time.monotonic()
+    assert "".join(hedged_stream(stream_tokens(http_client, stub_url), policy)) == "Sponsorship matters."
+    assert time.monotonic() - started < 2
+
+    stats = policy.snapshot()
+    assert StubStreamingDeepSeek.requests == 2
+    assert (stats["requests"], stats["hedged"], stats["hedge_wins"], stats["cancelled_losers"]) == (1, 1, 1, 1)
+    # The stalled primary's connection is closed by the app, long before its first token
+    assert wait_for(lambda: StubStreamingDeepSeek.disconnects == 1)
+
+def test_fast_first_attempt_is_not_hedged(stub_url, http_client):
+    policy = HedgePolicy(default_delay=1.0, min_delay=0.0, budget=1.0)
+
+    assert "".join(hedged_stream(stream_tokens(http_client, stub_url), policy)) == "Sponsorship matters."
+    stats = policy.snapshot()
+    assert (stats["hedged"], stats["hedge_wins"], stats["cancelled_losers"]) == (0, 0, 0)
+    assert StubStreamingDeepSeek.requests == 1
+
+def test_hedging_stops_once_the_budget_is_spent(stub_url, http_client):
+    # Every primary is slow, but at most 10% of the last 10 requests (one) may be hedged
+    StubStreamingDeepSeek.delays = [1.0, 0.0, 0.4, 0.4, 0.4]
+    policy = HedgePolicy(default_delay=0.1, min_delay=0.0, budget=0.1, window=10)
+
+    for _ in range(4):
+        assert "".join(hedged_stream(stream_tokens(http_client, stub_url), policy)) == "Sponsorship matters."
+
+    stats = policy.snapshot()
+    assert (stats["requests"], stats["hedged"], stats["hedge_wins"], stats["budget_denied"]) == (4, 1, 1, 3)
+    assert stats["hedge_rate"] == 0.25
+    assert StubStreamingDeepSeek.requests == 5
@@ -0,0 +1,31 @@
+import uuid
+
+from app.utils.rate_limit import TokenBucketLimiter, _parse_keys, client_key
+
+KEYS = _parse_keys("partner-key, other-key")
+
+def test_configured_keys_get_their_own_bucket():
+    assert client_key("partner-key", "10.0.0.1", api_keys=KEYS).startswith("key:")
+    assert client_key("partner-key", "10.0.0.2", api_keys=KEYS) == client_key("partner-key", "10.0.0.1", api_keys=KEYS)
+    assert client_key("other-key", "10.0.0.1", api_keys=KEYS) != client_key("partner-key", "10.0.0.1", api_keys=KEYS)
+
+def test_unknown_keys_are_limited_by_address():
+    assert client_key("made-up", "10.0.0.1", api_keys=KEYS) == "ip:10.0.0.1"
+    assert client_key(None, "10.0.0.1", api_keys=KEYS) == "ip:10.0.0.1"
+    assert client_key("anything", "10.0.0.1", api_keys=set()) == "ip:10.0.0.1"
+
+def test_random_keys_do_not_escape_the_limit():
+    limiter = TokenBucketLimiter(limits={"chat": (1.0, 2)}, max_clients=10)
+    results = [limiter.check(client_key(str(uuid.uuid4()), "10.0.0.9", api_keys=KEYS), "chat")[0] for _ in range(5)]
+    assert results == [True, True, False, False, False]
+    assert limiter.usage()["tracked_clients"] == 1
+
+def test_proxy_keys_identify_each_end_user():
+    proxies = _parse_keys("streamlit-key")
+    alice = client_key("streamlit-key", "10.0.0.5", "session-a", api_keys=KEYS, proxy_keys=proxies)
+    bob = client_key("streamlit-key", "10.0.0.5", "session-b", api_keys=KEYS, proxy_keys=proxies)
+    assert alice != bob
+    assert alice.endswith(":client:session-a")
+    # Only proxy keys may name a user
+    assert client_key("partner-key", "10.0.0.5", "session-a", api_keys=KEYS, proxy_keys=proxies) == client_key("partner-key", "10.0.0.5", None, api_keys=KEYS, proxy_keys=proxies)
+    assert client_key("made-up", "10.0.0.5", "session-a", api_keys=KEYS, proxy_keys=proxies) == "ip:10.0.0.5"
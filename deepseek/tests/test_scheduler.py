@@ -0,0 +1,26 @@
+import threading
+
+from app.utils.scheduler import WeightedFairScheduler
+
+def test_nested_slot_shares_the_outer_slot():
+    scheduler = WeightedFairScheduler(max_concurrent=1, weights={"chat": 1.0})
+    with scheduler.slot("chat"):
+        # Would wait forever if the inner call queued for a second slot
+        with scheduler.slot("chat"):
+            assert scheduler.snapshot()["active"] == 1
+    assert scheduler.snapshot()["active"] == 0
+
+def test_slots_in_other_threads_still_queue():
+    scheduler = WeightedFairScheduler(max_concurrent=1, weights={"chat": 1.0})
+    started = threading.Event()
+
+    def other():
+        with scheduler.slot("chat"):
+            started.set()
+
+    with scheduler.slot("chat"):
+        thread = threading.Thread(target=other)
+        thread.start()
+        assert not started.wait(0.2)
+    thread.join(5)
+    assert started.is_set()
@@ -0,0 +1,65 @@
+import threading
+
+import pytest
+
+from app.models import conversation
+from app.utils.sessions import InProcessSessionStore, SQLiteSessionStore
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path, monkeypatch):
+    if request.param == "memory":
+        store = InProcessSessionStore()
+    else:
+        store = SQLiteSessionStore(str(tmp_path / "sessions.sqlite3"))
+    monkeypatch.setattr(conversation, "get_session_store", lambda: store)
+    return store
+
+def run_threads(count, target):
+    threads = [threading.Thread(target=target, args=(number,)) for number in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+def test_concurrent_turns_are_all_kept(store, monkeypatch):
+    monkeypatch.setattr(conversation, "SESSION_RECENT_TURNS", 1000)
+    monkeypatch.setattr(conversation, "SESSION_HISTORY_TOKENS", 10 ** 6)
+
+    def answer(worker):
+        for number in range(10):
+            conversation.record_turn("chat", "s1", f"q{worker}-{number}", "a")
+
+    run_threads(8, answer)
+    questions = {turn["question"] for turn in store.get("chat:s1")["turns"]}
+    assert len(questions) == 80
+
+def test_compaction_keeps_turns_added_while_summarizing(store, monkeypatch):
+    monkeypatch.setattr(conversation, "SESSION_RECENT_TURNS", 2)
+    summarizing = threading.Event()
+    release = threading.Event()
+
+    def slow_summary(summary, turns, kind="chat"):
+        summarizing.set()
+        release.wait(5)
+        return "summary of " + ", ".join(turn["question"] for turn in turns)
+
+    monkeypatch.setattr(conversation, "summarize_turns", slow_summary)
+    conversation.record_turn("chat", "s1", "q1", "a")
+    conversation.record_turn("chat", "s1", "q2", "a")
+    compacting = threading.Thread(target=conversation.record_turn, args=("chat", "s1", "q3", "a"))
+    compacting.start()
+    assert summarizing.wait(5)
+    # A concurrent answer lands while the summary call is running
+    monkeypatch.setattr(conversation, "SESSION_RECENT_TURNS", 10)
+    conversation.record_turn("chat", "s1", "q4", "a")
+    release.set()
+    compacting.join()
+
+    state = store.get("chat:s1")
+    assert state["summary"] == "summary of q1"
+    assert [turn["question"] for turn in state["turns"]] == ["q2", "q3", "q4"]
+
+def test_update_starts_from_empty_state(store):
+    state = store.update("chat:new", lambda state: dict(state, summary="s"))
+    assert state == {"summary": "s", "turns": []}
+    assert store.get("chat:new") == state
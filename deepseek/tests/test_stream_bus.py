@@ -0,0 +1,147 @@
+import multiprocessing
+import time
+
+import pytest
+
+from app.utils.stream_bus import InProcessStreamBus, SQLiteStreamBus
+
+def make_bus(kind, tmp_path, **kwargs):
+    if kind == "memory":
+        return InProcessStreamBus(**kwargs)
+    return SQLiteStreamBus(str(tmp_path / "bus.sqlite3"), **kwargs)
+
+@pytest.fixture(params=["memory", "sqlite"])
+def bus_factory(request, tmp_path):
+    return lambda **kwargs: make_bus(request.param, tmp_path, **kwargs)
+
+def test_publish_and_read_by_event_id(bus_factory):
+    bus = bus_factory()
+    bus.open("r1")
+    assert bus.exists("r1")
+    assert not bus.exists("other")
+    for message in ("a", "b", "c"):
+        bus.publish("r1", message)
+
+    assert bus.read("r1") == [(1, "a"), (2, "b"), (3, "c")]
+    assert bus.read("r1", after_id=2) == [(3, "c")]
+    assert bus.read("r1", after_id=3) == []
+    assert bus.read("missing") == []
+
+def test_streams_are_independent(bus_factory):
+    bus = bus_factory()
+    bus.publish("r1", "one")
+    bus.publish("r2", "two")
+    assert bus.read("r1") == [(1, "one")]
+    assert bus.read("r2") == [(1, "two")]
+
+def test_finish_keeps_frames_for_replay(bus_factory):
+    bus = bus_factory()
+    bus.open("r1")
+    bus.publish("r1", "a")
+    assert not bus.is_finished("r1")
+    bus.finish("r1")
+    assert bus.is_finished("r1")
+    assert bus.read("r1") == [(1, "a")]
+
+def test_replay_buffer_is_bounded(bus_factory):
+    bus = bus_factory(max_frames=3)
+    for number in range(5):
+        bus.publish("r1", str(number))
+    assert bus.read("r1") == [(3, "2"), (4, "3"), (5, "4")]
+
+def test_close_discards_stream(bus_factory):
+    bus = bus_factory()
+    bus.publish("r1", "a")
+    bus.close("r1")
+    assert not bus.exists("r1")
+    assert bus.read("r1") == []
+
+def test_finished_streams_expire_after_grace(bus_factory):
+    bus = bus_factory(grace_seconds=0.05)
+    bus.publish("r1", "a")
+    bus.finish("r1")
+    bus.open("r2")
+    assert bus.exists("r1")
+    time.sleep(0.1)
+    # Stale streams are dropped when another stream is opened
+    bus.open("r3")
+    assert not bus.exists("r1")
+    assert bus.read("r1") == []
+    assert bus.exists("r2")
+
+def test_unread_streams_expire_after_ttl(bus_factory):
+    bus = bus_factory(ttl_seconds=0.05)
+    bus.publish("r1", "a")
+    time.sleep(0.1)
+    bus.open("r2")
+    assert not bus.exists("r1")
+    assert bus.exists("r2")
+
+def test_abandoned_after_last_reader_leaves(bus_factory):
+    bus = bus_factory()
+    bus.open("r1")
+    bus.attach("r1")
+    bus.attach("r1")
+    bus.detach("r1")
+    assert not bus.is_abandoned("r1", grace_seconds=0)
+    bus.detach("r1")
+    assert bus.is_abandoned("r1", grace_seconds=0)
+    assert not bus.is_abandoned("r1", grace_seconds=60)
+    assert bus.is_abandoned("missing")
+
+def test_never_attached_stream_is_abandoned_after_grace(bus_factory):
+    bus = bus_factory()
+    bus.open("r1")
+    assert not bus.is_abandoned("r1", grace_seconds=60)
+    time.sleep(0.05)
+    assert bus.is_abandoned("r1", grace_seconds=0.01)
+    bus.attach("r1")
+    assert not bus.is_abandoned("r1", grace_seconds=0)
+    # Published into before anyone opened it, e.g. by a generation on another worker
+    bus.publish("r2", "a")
+    time.sleep(0.05)
+    assert bus.is_abandoned("r2", grace_seconds=0.01)
+
+def _publish_in_child(path, request_id, messages):
+    bus = SQLiteStreamBus(path)
+    bus.open(request_id)
+    for message in messages:
+        bus.publish(request_id, message)
+    bus.finish(request_id)
+
+def _read_in_child(path, request_id, after_id, results):
+    results.put(SQLiteStreamBus(path).read(request_id, after_id))
+
+def run_child(target, *args):
+    process = multiprocessing.get_context("spawn").Process(target=target, args=args)
+    process.start()
+    process.join(30)
+    assert process.exitcode == 0
+
+def test_sqlite_bus_is_shared_between_processes(tmp_path):
+    path = str(tmp_path / "bus.sqlite3")
+    bus = SQLiteStreamBus(path)
+
+    # Generation in one worker, streaming from another
+    run_child(_publish_in_child, path, "r1", ["a", "b", "c"])
+    assert bus.exists("r1")
+    assert bus.is_finished("r1")
+    assert bus.read("r1", after_id=1) == [(2, "b"), (3, "c")]
+
+    # And the other way round, resuming from an event ID
+    bus.open("r2")
+    bus.publish("r2", "x")
+    bus.publish("r2", "y")
+    results = multiprocessing.get_context("spawn").Queue()
+    run_child(_read_in_child, path, "r2", 1, results)
+    assert [tuple(frame) for frame in results.get(timeout=10)] == [(2, "y")]
+
+def test_sqlite_bus_expiry_is_seen_by_other_processes(tmp_path):
+    path = str(tmp_path / "bus.sqlite3")
+    bus = SQLiteStreamBus(path, grace_seconds=0.05)
+    run_child(_publish_in_child, path, "r1", ["a"])
+    time.sleep(0.1)
+    bus.open("r2")
+    results = multiprocessing.get_context("spawn").Queue()
+    run_child(_read_in_child, path, "r1", 0, results)
+    assert results.get(timeout=10) == []
@@ -0,0 +1,71 @@
+import functools
+import json
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import api
+from app.utils.scheduler import generation_scheduler
+from app.utils.stream_bus import InProcessStreamBus
+
+STREAM_PATHS = ["/api/chat/stream", "/api/planning/stream"]
+
+@pytest.fixture
+def client():
+    return TestClient(api.app)
+
+def frames(body):
+    return [json.loads(line[len("data: "):]) for line in body.splitlines() if line.startswith("data: ")]
+
+@pytest.mark.parametrize("path", STREAM_PATHS)
+def test_resume_of_expired_stream_ends_at_once(client, path):
+    request_id = f"expired-{path}"
+    start = time.time()
+    response = client.get(path, params={"request_id": request_id}, headers={"Last-Event-ID": "5"})
+
+    assert time.time() - start < 2
+    assert frames(response.text) == [{"text": "", "end": True, "error": "Stream expired"}]
+    # The reconnect must not leave an empty stream behind
+    assert not api.stream_bus.exists(request_id)
+
+@pytest.mark.parametrize("path", STREAM_PATHS)
+def test_new_stream_replays_published_frames(client, path):
+    request_id = f"fresh-{path}"
+    api.stream_bus.open(request_id)
+    api.add_to_stream(request_id, f"data: {json.dumps({'text': 'Hello'})}\n\n")
+    api.add_to_stream(request_id, f"data: {json.dumps({'text': '', 'end': True})}\n\n")
+    api.stream_bus.finish(request_id)
+
+    response = client.get(path, params={"request_id": request_id})
+    assert [frame.get("text") for frame in frames(response.text)] == ["", "Hello", ""]
+
+class _StalledChain:
+    """A chain whose upstream never sends a first token until released."""
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def stream(self, message):
+        self.release.wait(10)
+        yield "late"
+
+def test_unread_generation_is_cancelled_before_its_first_token(monkeypatch):
+    bus = InProcessStreamBus()
+    monkeypatch.setattr(bus, "is_abandoned", functools.partial(bus.is_abandoned, grace_seconds=0.2))
+    monkeypatch.setattr(api, "stream_bus", bus)
+    monkeypatch.setattr(api, "STREAM_CANCEL_CHECK_SECONDS", 0.05)
+    chain = _StalledChain()
+
+    # The client POSTed, then closed the widget before its GET attached
+    bus.open("never-read")
+    start = time.time()
+    api.process_llm_streaming(chain, "question", "never-read")
+    chain.release.set()
+
+    assert time.time() - start < 2
+    assert generation_scheduler.snapshot()["active"] == 0
+    published = [frame for _, message in bus.read("never-read") for frame in frames(message)]
+    assert {"error": "Generation cancelled"} in published
+    assert bus.is_finished("never-read")